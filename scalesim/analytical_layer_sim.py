@@ -0,0 +1,252 @@
+"""
+This file contains the 'analytical_layer_sim' class that estimates the report data of a single
+layer in closed form, without generating the operand and demand matrices or running the cycle
+level memory simulation.
+"""
+
+import math
+
+from scalesim.scale_config import scale_config as cfg
+from scalesim.topology_utils import topologies as topo
+
+
+class analytical_layer_sim:
+    """
+    Class which computes the cycles, utilization and access counts of a single layer analytically.
+    The layer is mapped on the array in folds of arr_row x arr_col as in the systolic_compute_*
+    classes and the folds are assumed to run back to back without any memory stalls, which is what
+    the cycle level simulation reports when the DRAM bandwidth is estimated (CALC mode).
+    The DRAM accesses are the compulsory ones, each element is moved once.
+    """
+    #
+    def __init__(self):
+        """
+        __init__ method
+        """
+        self.layer_id = 0
+        self.dataflow = ''
+        self.topo = topo()
+        self.config = cfg()
+
+        self.arr_row = 1
+        self.arr_col = 1
+        self.num_mac_unit = 1
+
+        self.Sr = 0
+        self.Sc = 0
+        self.T = 0
+        self.row_fold = 1
+        self.col_fold = 1
+
+        # Report items : Compute report
+        self.total_cycles = 0
+        self.stall_cycles = 0
+        self.num_compute = 0
+        self.overall_util = 0
+        self.mapping_eff = 0
+        self.compute_util = 0
+
+        # Report items : Access counts
+        self.ifmap_sram_reads = 0
+        self.filter_sram_reads = 0
+        self.ofmap_sram_writes = 0
+        self.ifmap_dram_reads = 0
+        self.filter_dram_reads = 0
+        self.ofmap_dram_writes = 0
+
+        self.params_set_flag = False
+        self.runs_ready = False
+
+    #
+    def set_params(self, layer_id=0, config_obj=cfg(), topology_obj=topo()):
+        """
+        Method to set the run parameters for housekeeping.
+        """
+        self.layer_id = layer_id
+        self.config = config_obj
+        self.topo = topology_obj
+
+        assert not self.config.sparsity_support, 'Analytical mode does not model sparsity'
+
+        self.dataflow = self.config.get_dataflow()
+        self.arr_row, self.arr_col = self.config.get_array_dims()
+        self.num_mac_unit = self.arr_row * self.arr_col
+
+        self.params_set_flag = True
+
+    #
+    def run(self):
+        """
+        Method to calculate the report data of the layer from the spatio-temporal dimensions.
+        """
+        assert self.params_set_flag, 'Parameters are not set. Run set_params()'
+
+        self.Sr, self.Sc, self.T = \
+            self.topo.get_spatiotemporal_dims(layer_id=self.layer_id, df=self.dataflow)
+
+        # The ofmap pixels of all the images of a batch are mapped along the same dimension
+        batch_size = self.config.get_batch_size()
+        if self.dataflow == 'os':
+            self.Sr *= batch_size
+        elif self.dataflow == 'ws':
+            self.T *= batch_size
+        else:
+            self.Sc *= batch_size
+        self.row_fold = math.ceil(self.Sr / self.arr_row)
+        self.col_fold = math.ceil(self.Sc / self.arr_col)
+        num_folds = self.row_fold * self.col_fold
+
+        self.num_compute = self.topo.get_layer_num_ofmap_px(self.layer_id) \
+                           * self.topo.get_layer_window_size(self.layer_id) * batch_size
+
+        # Rows of the demand matrices per fold, ie the cycles taken by a fold including the
+        # pipeline fill and drain, and the cycles used for the compute utilization of a fold
+        if self.dataflow == 'os':
+            demand_rows_per_fold = self.T + self.arr_row + self.arr_col - 2
+            util_cycles_per_fold = demand_rows_per_fold
+        else:
+            demand_rows_per_fold = self.T + 2 * self.arr_row + self.arr_col - 2
+            util_cycles_per_fold = demand_rows_per_fold + self.arr_col - 1
+
+        # The cycles are counted from 0, the last row of the demand is serviced in this cycle
+        self.total_cycles = num_folds * demand_rows_per_fold - 1
+        self.stall_cycles = 0
+        self.overall_util = (self.num_compute * 100) / (self.total_cycles * self.num_mac_unit)
+
+        # The folds are visited column fold first, as in the systolic_compute_* classes. Summing
+        # the per fold values in the same order keeps the averages identical to the simulation
+        rows_used = self.get_used_per_fold(self.Sr, self.arr_row)
+        cols_used = self.get_used_per_fold(self.Sc, self.arr_col)
+        mapping_eff_per_fold = []
+        compute_util_per_fold = []
+        for col_used in cols_used:
+            for row_used in rows_used:
+                mac_used = row_used * col_used
+                mapping_eff_per_fold.append(mac_used / self.num_mac_unit)
+                compute_util_per_fold.append(
+                    (mac_used * self.T) / (self.num_mac_unit * util_cycles_per_fold))
+
+        self.mapping_eff = sum(mapping_eff_per_fold) / num_folds * 100
+        self.compute_util = sum(compute_util_per_fold) / num_folds * 100
+
+        self.calc_sram_accesses()
+        self.calc_dram_accesses()
+
+        self.runs_ready = True
+
+    #
+    @staticmethod
+    def get_used_per_fold(dim, arr_dim):
+        """
+        Method to get the number of rows (or cols) of the array used in each fold along a
+        dimension. All the folds but the last one use the entire array.
+        """
+        num_folds = math.ceil(dim / arr_dim)
+        used = [arr_dim] * num_folds
+        used[-1] = dim - (num_folds - 1) * arr_dim
+        return used
+
+    #
+    def calc_sram_accesses(self):
+        """
+        Method to calculate the SRAM accesses made by the array. Each fold reads its operand
+        slices once and the stationary operand is read once per fold.
+        """
+        num_folds = self.row_fold * self.col_fold
+
+        if self.dataflow == 'os':
+            self.ifmap_sram_reads = self.col_fold * self.T * self.Sr
+            self.filter_sram_reads = self.row_fold * self.T * self.Sc
+            # The simulation also counts the arr_row + arr_col cycles of draining a fold
+            self.ofmap_sram_writes = self.Sr * self.Sc \
+                                     + num_folds * (self.arr_row + self.arr_col)
+        elif self.dataflow == 'ws':
+            self.ifmap_sram_reads = self.col_fold * self.T * self.Sr
+            self.filter_sram_reads = self.Sr * self.Sc
+            self.ofmap_sram_writes = self.row_fold * self.T * self.Sc
+        else:
+            self.ifmap_sram_reads = self.Sr * self.Sc
+            self.filter_sram_reads = self.col_fold * self.T * self.Sr
+            self.ofmap_sram_writes = self.row_fold * self.T * self.Sc
+
+    #
+    def calc_dram_accesses(self):
+        """
+        Method to calculate the compulsory DRAM accesses, ie. the number of distinct ifmap, filter
+        and ofmap elements touched by the layer.
+        """
+        ifmap_h, ifmap_w = self.topo.get_layer_ifmap_dims(self.layer_id)
+        filter_h, filter_w = self.topo.get_layer_filter_dims(self.layer_id)
+        stride_h, stride_w = self.topo.get_layer_strides(self.layer_id)
+        ofmap_h, ofmap_w = self.topo.get_layer_ofmap_dims(self.layer_id)
+        num_channels = self.topo.get_layer_num_channels(self.layer_id)
+
+        used_ifmap_h = self.get_used_ifmap_dim(ifmap_h, filter_h, stride_h, ofmap_h)
+        used_ifmap_w = self.get_used_ifmap_dim(ifmap_w, filter_w, stride_w, ofmap_w)
+
+        batch_size = self.config.get_batch_size()
+
+        self.ifmap_dram_reads = used_ifmap_h * used_ifmap_w * num_channels * batch_size
+        self.filter_dram_reads = self.topo.get_layer_window_size(self.layer_id) \
+                                 * self.topo.get_layer_num_filters(self.layer_id)
+        self.ofmap_dram_writes = self.topo.get_layer_num_ofmap_px(self.layer_id) * batch_size
+
+    #
+    @staticmethod
+    def get_used_ifmap_dim(ifmap_dim, filter_dim, stride, ofmap_dim):
+        """
+        Method to get the number of ifmap rows (or cols) covered by the convolution windows.
+        """
+        if stride > filter_dim:
+            return ofmap_dim * filter_dim
+        return min(ifmap_dim, (ofmap_dim - 1) * stride + filter_dim)
+
+    #
+    def get_layer_id(self):
+        """
+        Method to return layer id.
+        """
+        assert self.params_set_flag, 'Parameters are not set yet'
+        return self.layer_id
+
+    #
+    def get_compute_report_items(self):
+        """
+        Method to get the data for the compute report, in the same order as single_layer_sim. The
+        prefetch is not modeled, so the total cycles including the prefetch are the total cycles.
+        """
+        assert self.runs_ready, 'Runs are not done yet'
+
+        items = [self.total_cycles,
+                 self.total_cycles,
+                 self.stall_cycles,
+                 self.overall_util,
+                 self.mapping_eff,
+                 self.compute_util]
+        return items
+
+    #
+    def get_bandwidth_report_items(self):
+        """
+        Method to get the data for the bandwidth report, in the same order as single_layer_sim.
+        """
+        assert self.runs_ready, 'Runs are not done yet'
+
+        items = [self.ifmap_sram_reads / self.total_cycles,
+                 self.filter_sram_reads / self.total_cycles,
+                 self.ofmap_sram_writes / self.total_cycles]
+        items += [self.ifmap_dram_reads / self.total_cycles,
+                  self.filter_dram_reads / self.total_cycles,
+                  self.ofmap_dram_writes / self.total_cycles]
+        return items
+
+    #
+    def get_access_report_items(self):
+        """
+        Method to get the SRAM and DRAM access counts.
+        """
+        assert self.runs_ready, 'Runs are not done yet'
+
+        items = [self.ifmap_sram_reads, self.filter_sram_reads, self.ofmap_sram_writes]
+        items += [self.ifmap_dram_reads, self.filter_dram_reads, self.ofmap_dram_writes]
+        return items
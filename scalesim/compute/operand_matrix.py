@@ -5,10 +5,59 @@ operand matrices.
 
 import numpy as np
 import math
+from functools import lru_cache
 
 from scalesim.topology_utils import topologies as topoutil
 from scalesim.layout_utils import layouts as layoututil
 from scalesim.scale_config import scale_config as cfg
+from scalesim.utilities.trace_io import get_addr_dtype
+
+
+# Number of custom layout address matrices kept by get_custom_layout_addresses()
+custom_layout_cache_size = 16
+
+
+#
+@lru_cache(maxsize=custom_layout_cache_size)
+def get_custom_layout_addresses(data_dims, intraline_factor, intraline_order, interline_order,
+                                base_addr=0, num_copies=1, addr_dtype=np.dtype(np.int64)):
+    """
+    Method to get the addresses of a tensor in the order given by a custom layout, as a single row.
+    Each dimension is split into lines of intraline_factor elements, padded with -1 when needed,
+    and the (interline, intraline) axes are visited in the given orders. With num_copies > 1 the
+    layout is repeated for the following copies of the tensor, eg. the images of a batch.
+    The results are cached, as layout studies run the same layers with many layouts, and are
+    read only.
+    """
+    num_dims = len(data_dims)
+    num_lines = [math.ceil(dim / factor) for dim, factor in zip(data_dims, intraline_factor)]
+    padding = [lines * factor - dim
+               for dim, lines, factor in zip(data_dims, num_lines, intraline_factor)]
+
+    tensor_size = int(np.prod(data_dims))
+    addr_np = np.arange(num_copies * tensor_size, dtype=addr_dtype) + base_addr
+    addr_np = addr_np.reshape((num_copies,) + tuple(data_dims))
+
+    # Note that: padded -1 will be removed in read_buffer/prepare_hashed_buffer, so won't waste
+    # on-chip memory.
+    if any(padding):
+        addr_np = np.pad(addr_np, [(0, 0)] + [(0, pad) for pad in padding], 'constant',
+                         constant_values=-1)
+
+    # Factorize each dimension into interline and intraline axes, gather the interline axes
+    # before the intraline axes and apply the orders of the layout in one transpose of the view
+    factored_shape = [num_copies]
+    for lines, factor in zip(num_lines, intraline_factor):
+        factored_shape += [lines, factor]
+    addr_np = addr_np.reshape(factored_shape)
+
+    split_axes = [1 + 2 * dim for dim in range(num_dims)] + [2 + 2 * dim for dim in range(num_dims)]
+    layout_axes = [0] + [split_axes[axis] for axis in list(interline_order) + list(intraline_order)]
+
+    layout_addr_np = np.ascontiguousarray(np.transpose(addr_np, layout_axes)).reshape((1, -1))
+    layout_addr_np.flags.writeable = False
+
+    return layout_addr_np
 
 
 class operand_matrix(object):
@@ -38,10 +87,12 @@ class operand_matrix(object):
         #  Derived hyper parameters
         self.ofmap_px_per_filt, self.conv_window_size = 1, 1
         self.ofmap_rows, self.ofmap_cols = 1, 1
+        self.ifmap_image_size, self.ofmap_image_size = 1, 1
 
         # Offsets
         self.ifmap_offset, self.filter_offset, self.ofmap_offset = 0, 10000000, 20000000
         self.matrix_offset_arr = [0, 10000000, 20000000]
+        self.addr_dtype = np.int32
 
         # Address matrices
         self.ifmap_addr_matrix = np.ones((self.ofmap_px_per_filt, self.conv_window_size), dtype=int)
@@ -52,6 +103,9 @@ class operand_matrix(object):
         self.sparse_filter_array = np.ones((self.conv_window_size, self.num_filters), dtype=int)
         self.ifmap_addr_matrix_original = np.ones((self.ofmap_px_per_filt, self.conv_window_size), dtype=int)
 
+        # Number of rows of the ifmap matrix generated at a time
+        self.tile_rows = 4096
+
         # Flags
         self.params_set_flag = False
         self.matrices_ready_flag = False
@@ -95,14 +149,7 @@ class operand_matrix(object):
         #if len(layer_hyper_param_arr) == 8:
         #    self.col_stride = layer_hyper_param_arr[7]
 
-        # TODO: Anand
-        # TODO: Next release
-        # TODO: Add an option for batching
-        self.batch_size = 1
-
-        # TODO: Marked for cleanup
-        #if len(layer_hyper_param_arr) == 9:
-        #    self.batch_size = layer_hyper_param_arr[8]
+        self.batch_size = self.config.get_batch_size()
 
         # Assign the calculated hyper parameters
         self.ofmap_rows, self.ofmap_cols = self.topoutil.get_layer_ofmap_dims(self.layer_id)
@@ -111,15 +158,29 @@ class operand_matrix(object):
         self.ofmap_px_per_filt = int(self.ofmap_rows * self.ofmap_cols)
         self.conv_window_size = int(self.topoutil.get_layer_window_size(self.layer_id))
 
+        # The images of a batch are stored one after the other
+        self.ifmap_image_size = self.ifmap_rows * self.ifmap_cols * self.num_input_channels
+        self.ofmap_image_size = self.ofmap_px_per_filt * self.num_filters
+
         # Assign the offsets
         self.ifmap_offset, self.filter_offset, self.ofmap_offset \
             = self.config.get_offsets()
 
+        # The addresses are int32 unless the largest of them does not fit
+        max_ifmap_addr = self.ifmap_offset + self.batch_size * self.ifmap_image_size
+        max_filter_addr = self.filter_offset + self.conv_window_size * self.num_filters
+        max_ofmap_addr = self.ofmap_offset + self.batch_size * self.ofmap_image_size
+        self.addr_dtype = get_addr_dtype(max(max_ifmap_addr, max_filter_addr, max_ofmap_addr))
+
         # Address matrices: This is needed to take into account the updated dimensions
         self.ifmap_addr_matrix = \
-            np.ones((self.ofmap_px_per_filt * self.batch_size, self.conv_window_size), dtype='>i4')
-        self.filter_addr_matrix = np.ones((self.conv_window_size, self.num_filters), dtype='>i4')
-        self.ofmap_addr_matrix = np.ones((self.ofmap_px_per_filt, self.num_filters), dtype='>i4')
+            np.ones((self.ofmap_px_per_filt * self.batch_size, self.conv_window_size),
+                    dtype=self.addr_dtype)
+        self.filter_addr_matrix = np.ones((self.conv_window_size, self.num_filters),
+                                          dtype=self.addr_dtype)
+        self.ofmap_addr_matrix = np.ones((self.ofmap_px_per_filt * self.batch_size,
+                                          self.num_filters),
+                                         dtype=self.addr_dtype)
         self.params_set_flag = True
 
         # TODO: This should be called from top level
@@ -170,14 +231,23 @@ class operand_matrix(object):
             print(message)
             return -1
 
-        row_indices = np.arange(self.batch_size * self.ofmap_px_per_filt)
-        col_indices = np.arange(self.conv_window_size)
+        num_rows = self.ofmap_px_per_filt
 
-        # Create 2D index arrays using meshgrid
-        i, j = np.meshgrid(row_indices, col_indices, indexing='ij')
+        # Generate the matrix of the first image a few rows at a time, so the index arrays stay
+        # small
+        window_pattern = np.empty((num_rows, self.conv_window_size), dtype=self.addr_dtype)
+        for start_row in range(0, num_rows, self.tile_rows):
+            end_row = min(start_row + self.tile_rows, num_rows)
+            window_pattern[start_row:end_row, :] = \
+                self.get_ifmap_tile((start_row, end_row), (0, self.conv_window_size))
 
-        # Call calc_ifmap_elem_addr_numpy with 2D index arrays
-        self.ifmap_addr_matrix = self.calc_ifmap_elem_addr(i, j)
+        # The other images of the batch use the same windows, offset by the size of an image
+        if self.batch_size > 1:
+            window_pattern = np.tile(window_pattern, (self.batch_size, 1))
+            image_ids = np.repeat(np.arange(self.batch_size), num_rows)
+            self.add_batch_offsets(window_pattern, image_ids, self.ifmap_image_size)
+
+        self.ifmap_addr_matrix = window_pattern
         self.ifmap_addr_matrix_original = self.ifmap_addr_matrix
   
         if self.config.sparsity_support:
@@ -213,7 +283,7 @@ class operand_matrix(object):
         c_col, c_ch = np.divmod(k, channel)
 
         valid_indices = np.logical_and(c_row + i_row < ifmap_rows, c_col + i_col < ifmap_cols)
-        ifmap_px_addr = np.full(i.shape, -1)
+        ifmap_px_addr = np.full(i.shape, -1, dtype=self.addr_dtype)
         if valid_indices.any():
             internal_address = (c_row[valid_indices] * ifmap_cols + c_col[valid_indices]) * \
                                channel + c_ch[valid_indices]
@@ -221,6 +291,14 @@ class operand_matrix(object):
 
         return ifmap_px_addr
 
+    #
+    def add_batch_offsets(self, addr_matrix_np, image_ids, image_size):
+        """
+        Method to move the rows of an address matrix generated for the first image of the batch
+        to the images they belong to, in place. The -1 entries stay invalid.
+        """
+        offsets = (image_ids * image_size).astype(self.addr_dtype).reshape((-1, 1))
+        np.add(addr_matrix_np, offsets, out=addr_matrix_np, where=addr_matrix_np != -1)
     # creates the ofmap operand
     def create_ofmap_matrix(self):
         """
@@ -233,7 +311,9 @@ class operand_matrix(object):
             print(message)
             return -1
 
-        row_indices = np.expand_dims(np.arange(self.ofmap_px_per_filt), axis=1)
+        # The rows of the images of a batch follow each other, so the linear address of a row
+        # already includes the offset of its image
+        row_indices = np.expand_dims(np.arange(self.batch_size * self.ofmap_px_per_filt), axis=1)
         # if self.config.sparsity_support:
         #     _, col_indices = np.unique(np.array(self.filter_addr_matrix[0]), return_inverse=True)
         # else:
@@ -252,7 +332,7 @@ class operand_matrix(object):
         num_filt = self.num_filters
         internal_address = num_filt * i + j
         ofmap_px_addr = internal_address + offset
-        return ofmap_px_addr
+        return ofmap_px_addr.astype(self.addr_dtype)
 
     # creates the filter operand
     def create_filter_matrix(self):
@@ -365,6 +445,8 @@ class operand_matrix(object):
                 if self.config.filter_offset == 0 and first_element == 0:
                     self.filter_addr_matrix[0][0] = 0
 
+            self.filter_addr_matrix = self.filter_addr_matrix.astype(self.addr_dtype)
+
         return 0
 
     # logic to translate filter into matrix fed into systolic array MACs
@@ -378,7 +460,7 @@ class operand_matrix(object):
         channel = self.num_input_channels
         internal_address = j * filter_row * filter_col * channel + i
         filter_px_addr = internal_address + offset
-        return filter_px_addr
+        return filter_px_addr.astype(self.addr_dtype)
 
     # function to get a part or the full ifmap operand
     def get_ifmap_matrix_part(self, start_row=0, num_rows=-1, start_col=0,
@@ -388,7 +470,7 @@ class operand_matrix(object):
         code.
         """
         if num_rows == -1:
-            num_rows = self.ofmap_px_per_filt
+            num_rows = self.batch_size * self.ofmap_px_per_filt
         if num_cols == -1:
             num_cols = self.conv_window_size
         my_name = 'operand_matrix.get_ifmap_matrix_part(): '
@@ -400,7 +482,7 @@ class operand_matrix(object):
                 message = err_prefix + ": Parameters not set yet. Run set_params(). Exiting!"
                 print(message)
                 return -1, np.zeros((1, 1))
-        if (start_row + num_rows) > self.ofmap_px_per_filt or \
+        if (start_row + num_rows) > self.batch_size * self.ofmap_px_per_filt or \
            (start_col + num_cols) > self.conv_window_size:
             message = err_prefix + ": Illegal arguments. Exiting!"
             print(message)
@@ -432,70 +514,30 @@ class operand_matrix(object):
             Under which, the address should be calculated as
 
             ifmap_px_addr = internal_address + offset
+
+            The addresses are cached per layer shape and layout, see get_custom_layout_addresses()
         """
         #                          X, Y, C
         #ifmap_intraline_factor = [2, 2, 16] # A given fixed dimension order
         #ifmap_intraline_order  = [0, 1, 2] # A given fixed dimension order
         #ifmap_interline_order  = [1+3, 2+3, 0+3] # A given fixed dimension order
-        ifmap_intraline_factor = self.layoututil.get_layer_ifmap_intraline_factor()
-        ifmap_intraline_order = self.layoututil.get_layer_ifmap_intraline_order()
-        ifmap_interline_order = self.layoututil.get_layer_ifmap_interline_order()
+        ifmap_intraline_factor = self.layoututil.get_layer_ifmap_intraline_factor(self.layer_id)
+        ifmap_intraline_order = self.layoututil.get_layer_ifmap_intraline_order(self.layer_id)
+        ifmap_interline_order = self.layoututil.get_layer_ifmap_interline_order(self.layer_id)
         
         # Sanity Checking
         assert np.prod(ifmap_intraline_factor) <= int(self.config.get_ifmap_sram_bandwidth())
 
-        ifmap_overall_data = np.arange(self.ifmap_rows * self.ifmap_cols * self.num_input_channels)
-        
-        # Reshape each dimension of ifmap to be a different index.
-        ifmap_overall_data = ifmap_overall_data.reshape(self.ifmap_rows, self.ifmap_cols, self.num_input_channels)
-        num_x_t = math.ceil(self.ifmap_rows / ifmap_intraline_factor[0])
-        padding_x = num_x_t * ifmap_intraline_factor[0] - self.ifmap_rows
-        num_y_t = math.ceil(self.ifmap_cols / ifmap_intraline_factor[1])
-        padding_y = num_y_t * ifmap_intraline_factor[1] - self.ifmap_cols
-        num_c_t = math.ceil(self.num_input_channels / ifmap_intraline_factor[2])
-        padding_c = num_c_t * ifmap_intraline_factor[2] - self.num_input_channels
-        x_t = ifmap_intraline_factor[0]
-        y_t = ifmap_intraline_factor[1]
-        c_t = ifmap_intraline_factor[2]
-
-        ifmap_overall_data_pad = np.pad(ifmap_overall_data, [(0, padding_x), (0, padding_y), (0, padding_c)], 'constant', constant_values=-1)
-        # Note that: padded -1 will be removed in read_buffer/prepare_hashed_buffer, so won't waste on-chip memory.
-        
-        # Factorize each dimension of ifmap to be interline (row) and intraline (col).
-        assert ifmap_overall_data_pad.shape[0] % ifmap_intraline_factor[0] == 0, (f"dimension X must be full divisible by"
-             f" intraline factorization; post-padding X:{ifmap_overall_data_pad.shape[0]}, factor:{ifmap_intraline_factor[0]}")
-        assert ifmap_overall_data_pad.shape[1] % ifmap_intraline_factor[1] == 0, (f"dimension Y must be full divisible by"
-             f" intraline factorization; post-padding Y:{ifmap_overall_data_pad.shape[1]} factor:{ifmap_intraline_factor[1]}")
-        assert ifmap_overall_data_pad.shape[2] % ifmap_intraline_factor[2] == 0, (f"dimension C must be full divisible by" 
-             f" intraline factorization; post-padding C:{ifmap_overall_data_pad.shape[2]}, factor:{ifmap_intraline_factor[2]}")
-        
-        """
-            x_t = ifmap_intraline_factor[1]
-            y_t = ifmap_intraline_factor[2]
-            c_t = ifmap_intraline_factor[3]
-            
-            for x_1 in range(X, x_t):
-              for x_2 in range(x_t):
-                for y_1 in range(Y, y1):
-                  for y_2 in range(y1):
-                    for c_1 in range(C, c_t):
-                      for c_2 in range(c_t):
-                        # Address specification.
-                        # x = x_2 + x_1 * x_t
-                        # y = y_2 + y_1 * y_t
-                        # c = c_2 + c_1 * c1
-        """
-        ifmap_overall_data_pad = ifmap_overall_data_pad.reshape(num_x_t, x_t, num_y_t, y_t, num_c_t, c_t)
-        
-        # Transpose two separate interline dimension order and intraline dimension order.
-        ifmap_overall_data_pad = np.transpose(ifmap_overall_data_pad, (0,2,4,1,3,5))
-
-        # Transpose data layout to force a specific order.
-        ifmap_overall_data_pad = np.transpose(ifmap_overall_data_pad, 
-           (ifmap_interline_order[0], ifmap_interline_order[1], ifmap_interline_order[2], 
-            ifmap_intraline_order[0], ifmap_intraline_order[1], ifmap_intraline_order[2]))
+        ifmap_prefetch_matrix = get_custom_layout_addresses(
+            (self.ifmap_rows, self.ifmap_cols, self.num_input_channels),
+            tuple(ifmap_intraline_factor),
+            tuple(ifmap_intraline_order),
+            tuple(ifmap_interline_order),
+            base_addr=0,
+            num_copies=self.batch_size,
+            addr_dtype=np.dtype(self.addr_dtype))
 
-        return ifmap_overall_data_pad.reshape(1,-1)
+        return ifmap_prefetch_matrix
         
     # function to get a part or the full filter operand
     def get_filter_matrix_part(self, start_row=0, num_rows=-1, start_col=0,
@@ -561,80 +603,31 @@ class operand_matrix(object):
 
             internal_address = j * filter_row * filter_col * channel + i
             j:  the kernel index 
+
+            The addresses are cached per layer shape and layout, see get_custom_layout_addresses()
         """
         #                            K, C, R, S
         # filter_intraline_factor = [4,16, 1, 1] # A given fixed dimension order
         # filter_intraline_order  = [3, 2, 1, 0] # A given fixed dimension order
         # filter_interline_order  = [0+4, 1+4, 2+4, 3+4] # A given fixed dimension order
-        filter_intraline_factor = self.layoututil.get_layer_filter_intraline_factor()
-        filter_intraline_order  = self.layoututil.get_layer_filter_intraline_order()
-        filter_interline_order  = self.layoututil.get_layer_filter_interline_order()
+        filter_intraline_factor = self.layoututil.get_layer_filter_intraline_factor(self.layer_id)
+        filter_intraline_order  = self.layoututil.get_layer_filter_intraline_order(self.layer_id)
+        filter_interline_order  = self.layoututil.get_layer_filter_interline_order(self.layer_id)
 
         # Sanity Checking
         assert np.prod(filter_intraline_factor) == int(self.config.get_filter_sram_bandwidth())
 
-        filter_overall_data = np.arange(self.filter_rows * self.filter_cols * self.num_input_channels * self.num_filters) + self.filter_offset
-        
-        # Reshape each dimension of filter to be a different index.
-        filter_overall_data = filter_overall_data.reshape(self.num_filters, self.num_input_channels, self.filter_rows, self.filter_cols)
-        num_k_t = math.ceil(self.num_filters / filter_intraline_factor[0])
-        padding_k = num_k_t * filter_intraline_factor[0] - self.num_filters
-        num_c_t = math.ceil(self.num_input_channels / filter_intraline_factor[1])
-        padding_c = num_c_t * filter_intraline_factor[1] - self.num_input_channels
-        num_r_t = math.ceil(self.filter_rows / filter_intraline_factor[2])
-        padding_r = num_r_t * filter_intraline_factor[2] - self.filter_rows
-        num_s_t = math.ceil(self.filter_cols / filter_intraline_factor[3])
-        padding_s = num_s_t * filter_intraline_factor[3] - self.filter_cols
-        k_t = filter_intraline_factor[0]
-        c_t = filter_intraline_factor[1]
-        r_t = filter_intraline_factor[2]
-        s_t = filter_intraline_factor[3]
-
-        filter_overall_data_pad = np.pad(filter_overall_data, [(0, padding_k), (0, padding_c), (0, padding_r), (0, padding_s)], 'constant', constant_values=-1)
-        # Note that: padded -1 will be removed in read_buffer/prepare_hashed_buffer, so won't waste on-chip memory.
-        
-        # Factorize each dimension of filter to be interline (row) and intraline (col).
-        assert filter_overall_data_pad.shape[0] % filter_intraline_factor[0] == 0, (f"dimension K must be full divisible by"
-             f" intraline factorization; post-padding K:{filter_overall_data_pad.shape[0]}, factor:{filter_intraline_factor[0]}")
-        assert filter_overall_data_pad.shape[1] % filter_intraline_factor[1] == 0, (f"dimension C must be full divisible by"
-             f" intraline factorization; post-padding C:{filter_overall_data_pad.shape[1]} factor:{filter_intraline_factor[1]}")
-        assert filter_overall_data_pad.shape[2] % filter_intraline_factor[2] == 0, (f"dimension R must be full divisible by" 
-             f" intraline factorization; post-padding R:{filter_overall_data_pad.shape[2]}, factor:{filter_intraline_factor[2]}")
-        assert filter_overall_data_pad.shape[3] % filter_intraline_factor[3] == 0, (f"dimension S must be full divisible by" 
-             f" intraline factorization; post-padding S:{filter_overall_data_pad.shape[2]}, factor:{filter_intraline_factor[2]}")
-        
-        """
-            k_t = filter_intraline_factor[0]
-            c_t = filter_intraline_factor[1]
-            r_t = filter_intraline_factor[2]
-            s_t = filter_intraline_factor[3]
-
-            for k_1 in range(K, k_t):
-              for k_2 in range(k_t):
-                for c_1 in range(C, c_t):
-                  for c_2 in range(c_t):
-                    for r_1 in range(R, r_t):
-                      for r_2 in range(r_t):
-                        for s_1 in range(S, s_t):
-                          for s_2 in range(s_t):
-                            # Address specification.
-                            # k = k_2 + k_1 * k_t
-                            # c = c_2 + c_1 * c_t
-                            # r = r_2 + r_1 * r1
-                            # s = s_2 + s_1 * s1
-        """
-        filter_overall_data_pad = filter_overall_data_pad.reshape(num_k_t, k_t, num_c_t, c_t, num_r_t, r_t, num_s_t, s_t)
-        
-        # Transpose two separate interline dimension order and intraline dimension order.
-        filter_overall_data_pad = np.transpose(filter_overall_data_pad, (0,2,4,6,1,3,5,7))
-
-        # Transpose data layout to force a specific order.
-        filter_overall_data_pad = np.transpose(filter_overall_data_pad, 
-           (filter_interline_order[0], filter_interline_order[1], filter_interline_order[2], filter_interline_order[3], 
-            filter_intraline_order[0], filter_intraline_order[1], filter_intraline_order[2], filter_intraline_order[3]))
-
-        print(f"finalized filter.shape = {filter_overall_data_pad.shape}")
-        return filter_overall_data_pad.reshape(1,-1)
+        # The filters are shared by the whole batch
+        filter_prefetch_matrix = get_custom_layout_addresses(
+            (self.num_filters, self.num_input_channels, self.filter_rows, self.filter_cols),
+            tuple(filter_intraline_factor),
+            tuple(filter_intraline_order),
+            tuple(filter_interline_order),
+            base_addr=self.filter_offset,
+            num_copies=1,
+            addr_dtype=np.dtype(self.addr_dtype))
+
+        return filter_prefetch_matrix
     
     # function to get a part or the full ofmap operand
     def get_ofmap_matrix_part(self, start_row=0, num_rows=-1, start_col=0,
@@ -647,7 +640,7 @@ class operand_matrix(object):
         # Since we cannot pass self as an argument in the member functions
         # This is an alternate way of making the matrix dimensions as defaults
         if num_rows == -1:
-            num_rows = self.ofmap_px_per_filt
+            num_rows = self.batch_size * self.ofmap_px_per_filt
         if num_cols == -1:
             num_cols = self.num_filters
         my_name = 'operand_matrix.get_ofmap_matrix_part(): '
@@ -659,7 +652,7 @@ class operand_matrix(object):
                 message = err_prefix + ": Parameters not set yet. Run set_params(). Exiting!"
                 print(message)
                 return -1, np.zeros((1, 1))
-        if (start_row + num_rows) > self.ofmap_px_per_filt or \
+        if (start_row + num_rows) > self.batch_size * self.ofmap_px_per_filt or \
            (start_col + num_cols) > self.num_filters:
             message = err_prefix + ": Illegal arguments. Exiting!"
             print(message)
@@ -702,6 +695,116 @@ class operand_matrix(object):
                self.filter_addr_matrix, \
                self.ofmap_addr_matrix
 
+    #
+    def get_ifmap_tile(self, row_range, col_range):
+        """
+        Method to get a tile of the IFMAP operand matrix, generated on demand from the element
+        addresses. The ranges are (start, end) pairs with the end excluded. The tile is taken from
+        the dense matrix, ie. before the columns of pruned filter elements are removed. With a
+        batch the windows of each pixel are computed once and offset to the images of the rows.
+        """
+        row_indices = np.arange(row_range[0], row_range[1])
+        col_indices = np.arange(col_range[0], col_range[1])
+
+        if self.batch_size == 1:
+            i, j = np.meshgrid(row_indices, col_indices, indexing='ij')
+            return self.calc_ifmap_elem_addr(i, j)
+
+        image_ids, px_ids = np.divmod(row_indices, self.ofmap_px_per_filt)
+        unique_px_ids, px_inverse = np.unique(px_ids, return_inverse=True)
+        i, j = np.meshgrid(unique_px_ids, col_indices, indexing='ij')
+
+        ifmap_tile = self.calc_ifmap_elem_addr(i, j)[px_inverse]
+        self.add_batch_offsets(ifmap_tile, image_ids, self.ifmap_image_size)
+        return ifmap_tile
+
+    #
+    def get_filter_tile(self, row_range, col_range):
+        """
+        Method to get a tile of the dense filter operand matrix, generated on demand.
+        """
+        row_indices = np.expand_dims(np.arange(row_range[0], row_range[1]), axis=1)
+        col_indices = np.arange(col_range[0], col_range[1])
+
+        return self.calc_filter_elem_addr(row_indices, col_indices)
+
+    #
+    def get_ofmap_tile(self, row_range, col_range):
+        """
+        Method to get a tile of the OFMAP operand matrix, generated on demand.
+        """
+        row_indices = np.expand_dims(np.arange(row_range[0], row_range[1]), axis=1)
+        col_indices = np.arange(col_range[0], col_range[1])
+
+        return self.calc_ofmap_elem_addr(row_indices, col_indices)
+
+    #
+    def get_tiled_operand_matrices(self):
+        """
+        Method to get lazy stand ins for the IFMAP, Filter and OFMAP operand matrices. Only the
+        tiles sliced out by the compute system are generated, so the full matrices are never held
+        in memory. Not available with sparsity, which needs the full filter matrix to be condensed.
+        """
+        assert self.params_set_flag, 'Parameters are not set. Run set_params()'
+        assert not self.config.sparsity_support, 'Tiled operands are not supported with sparsity'
+
+        ifmap_tiles = operand_tile_view(self.get_ifmap_tile,
+                                        (self.batch_size * self.ofmap_px_per_filt,
+                                         self.conv_window_size),
+                                        self.addr_dtype)
+        filter_tiles = operand_tile_view(self.get_filter_tile,
+                                         (self.conv_window_size, self.num_filters),
+                                         self.addr_dtype)
+        ofmap_tiles = operand_tile_view(self.get_ofmap_tile,
+                                        (self.batch_size * self.ofmap_px_per_filt,
+                                         self.num_filters),
+                                        self.addr_dtype)
+
+        return ifmap_tiles, filter_tiles, ofmap_tiles
+
+
+class operand_tile_view(object):
+    """
+    Class which stands in for an operand matrix in the compute systems. It has the shape of the
+    matrix, and slicing it with [rows, cols] generates only that tile. It can be transposed.
+    """
+    #
+    def __init__(self, get_tile, shape, dtype, transposed=False):
+        """
+        __init__ method.
+        """
+        self.get_tile = get_tile
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.transposed = transposed
+
+    #
+    def __getitem__(self, index):
+        """
+        Method to generate the tile selected by a pair of contiguous slices.
+        """
+        assert isinstance(index, tuple) and len(index) == 2, 'Index with [rows, cols] slices'
+
+        ranges = []
+        for dim_slice, dim_size in zip(index, self.shape):
+            assert isinstance(dim_slice, slice), 'Only slices are supported'
+            start, end, step = dim_slice.indices(dim_size)
+            assert step == 1, 'Only contiguous slices are supported'
+            ranges.append((start, max(start, end)))
+
+        if self.transposed:
+            return np.transpose(self.get_tile(ranges[1], ranges[0]))
+        return self.get_tile(ranges[0], ranges[1])
+
+    #
+    def transpose(self, *axes):
+        """
+        Method to get the transposed view, also used by np.transpose().
+        """
+        assert len(axes) == 0 or axes[0] is None, 'Only the full transpose is supported'
+        return operand_tile_view(self.get_tile, (self.shape[1], self.shape[0]), self.dtype,
+                                 not self.transposed)
+
 
 if __name__ == '__main__':
     # opmat = operand_matrix()
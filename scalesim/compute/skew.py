@@ -0,0 +1,133 @@
+"""
+This file contains the vectorized kernels shared by the systolic compute classes of all the three
+dataflows to account for the skew in the systolic array data flow.
+"""
+
+import math
+import numpy as np
+
+
+# Number of input elements copied at a time by skew_matrix
+skew_block_elems = 8192
+
+
+#
+def diagonal_rollout(input_matrix_np, dtype=np.float64):
+    """
+    Method to roll out the input matrix along its anti-diagonals into a single row. The diagonals
+    are visited in order and the elements of a diagonal from the bottom row to the top row, which
+    accounts for the temporal locality when there is a skew in demand.
+    Example:
+        Input matrix:
+        1 2 3
+        4 5 6
+
+        Output matrix:
+        1 4 2 5 3 6
+    """
+    rows, cols = input_matrix_np.shape
+
+    diag_ids = np.arange(rows + cols - 1)
+    diag_lens = np.minimum(diag_ids, rows - 1) - np.maximum(0, diag_ids - cols + 1) + 1
+    diag_starts = np.cumsum(diag_lens) - diag_lens
+
+    # Position of every element in the rolled out row: the start of its diagonal plus its offset
+    # from the first (lowest row, smallest column) element of that diagonal
+    row_ids = np.arange(rows).reshape((-1, 1))
+    col_ids = np.arange(cols).reshape((1, -1))
+    elem_diag_ids = row_ids + col_ids
+    dest_ids = diag_starts[elem_diag_ids] + col_ids - np.maximum(0, elem_diag_ids - rows + 1)
+
+    out_matrix_np = np.zeros((1, rows * cols), dtype=dtype)
+    out_matrix_np[0, dest_ids] = input_matrix_np
+
+    return out_matrix_np
+
+
+#
+def skew_matrix(input_matrix_np):
+    """
+    Method to add skew to the input matix to maintain systolic array flow. Column c of the input
+    is delayed by c rows and the gaps are filled with -1. A stack of folds with the shape
+    (folds, rows, cols) is skewed fold by fold in a single call.
+    Example:
+        Input matrix:
+        1 1 1 1 1 1 1 1 1
+
+        Output matrix:
+            1 1 1
+          1 1 1
+        1 1 1
+    """
+    rows, cols = input_matrix_np.shape[-2:]
+
+    out_shape = input_matrix_np.shape[:-2] + (rows + cols - 1, cols)
+    out_matrix_np = np.full(out_shape, -1, dtype=input_matrix_np.dtype)
+
+    # Element (r, c) of the input goes to (r + c, c), ie. one row and one column further along
+    # the flattened output for every column
+    item_size = out_matrix_np.itemsize
+    diagonal_view = np.lib.stride_tricks.as_strided(
+                        out_matrix_np,
+                        shape=input_matrix_np.shape,
+                        strides=out_matrix_np.strides[:-2] + (cols * item_size,
+                                                              (cols + 1) * item_size))
+
+    # The columns of the diagonal view are one output row apart, copying a few rows at a time
+    # keeps the output rows being written in the cache
+    block_rows = max(1, skew_block_elems // cols)
+    for row_start in range(0, rows, block_rows):
+        diagonal_view[..., row_start:row_start + block_rows, :] = \
+            input_matrix_np[..., row_start:row_start + block_rows, :]
+
+    return out_matrix_np
+
+
+#
+def skew_matrix_row_sparsity(input_matrix_np, arr_row, block_size):
+    """
+    Method to add skew to the ifmap demands of the row wise sparse mapping. The rows are padded
+    with -1 to the width of two tiles and split into blocks of block_size elements, each block is
+    repeated block_size / 2 times, and block column j of the output is delayed by j rows. The
+    output has arr_row - 1 rows more than the input. A stack of folds with the shape
+    (folds, rows, cols) is skewed fold by fold in a single call.
+    """
+    num_tiles = 2
+    rows, num_cols = input_matrix_np.shape[-2:]
+
+    # Pad to the width of the tiles and to full blocks
+    padded_cols = max(num_cols, arr_row * num_tiles)
+    padded_cols = math.ceil(padded_cols / block_size) * block_size
+    if padded_cols > num_cols:
+        pad_width = [(0, 0)] * (input_matrix_np.ndim - 1) + [(0, padded_cols - num_cols)]
+        input_matrix_np = np.pad(input_matrix_np, pad_width, constant_values=-1)
+
+    num_blocks = padded_cols // block_size
+    num_copies = block_size // num_tiles
+    num_block_cols = num_blocks * num_copies
+    out_cols = num_block_cols * block_size
+
+    # Block column j of the output holds copy j % num_copies of the input block j // num_copies,
+    # delayed by j rows. Room is kept for the delay of every block column and the rows beyond the
+    # skew of the array are dropped at the end.
+    out_rows = rows + arr_row - 1
+    alloc_rows = rows + max(arr_row, num_block_cols) - 1
+    out_shape = input_matrix_np.shape[:-2] + (alloc_rows, out_cols)
+    out_matrix_np = np.full(out_shape, -1, dtype=input_matrix_np.dtype)
+
+    # View of the output indexed by (row, block, copy, element) of the input
+    item_size = out_matrix_np.itemsize
+    block_col_stride = out_cols + block_size
+    view_shape = input_matrix_np.shape[:-2] + (rows, num_blocks, num_copies, block_size)
+    view_strides = out_matrix_np.strides[:-2] + (out_cols * item_size,
+                                                 num_copies * block_col_stride * item_size,
+                                                 block_col_stride * item_size,
+                                                 item_size)
+    block_view = np.lib.stride_tricks.as_strided(out_matrix_np, shape=view_shape,
+                                                 strides=view_strides)
+
+    input_blocks = input_matrix_np.reshape(input_matrix_np.shape[:-2]
+                                           + (rows, num_blocks, 1, block_size))
+    block_view[...] = input_blocks
+
+    return out_matrix_np[..., :out_rows, :]
@@ -7,8 +7,8 @@ for IFMAP, Filter, and OFMAP operations.
 
 import math
 import numpy as np
-from tqdm import tqdm
 from scalesim.scale_config import scale_config as cfg
+from scalesim.compute.skew import diagonal_rollout, skew_matrix
 
 
 class systolic_compute_os:
@@ -26,6 +26,7 @@ class systolic_compute_os:
         self.ifmap_op_mat = np.zeros((1, 1))
         self.ofmap_op_mat = np.zeros((1, 1))
         self.filter_op_mat = np.zeros((1, 1))
+        self.addr_dtype = np.int32
 
         # Derived parameters
         self.Sr = 0
@@ -59,6 +60,7 @@ class systolic_compute_os:
         self.params_set_flag = False
         self.prefetch_mat_ready_flag = False
         self.demand_mat_ready_flag = False
+        self.demand_stats_ready_flag = False
 
     #
     def set_params(self,
@@ -75,6 +77,8 @@ class systolic_compute_os:
         self.ifmap_op_mat = ifmap_op_mat
         self.filter_op_mat = filter_op_mat
         self.ofmap_op_mat = ofmap_op_mat
+        self.addr_dtype = np.result_type(self.ifmap_op_mat.dtype, self.filter_op_mat.dtype,
+                                         self.ofmap_op_mat.dtype)
 
         ifmap_col = self.ifmap_op_mat.shape[1]
         filter_row= self.filter_op_mat.shape[0]
@@ -126,7 +130,7 @@ class systolic_compute_os:
 
             #If there is under utilization, fill them with null requests
             if delta > 0:
-                null_req_mat = np.ones((self.T, delta)) * -1
+                null_req_mat = np.full((self.T, delta), -1, dtype=self.addr_dtype)
                 this_fold_prefetch = np.concatenate((this_fold_prefetch, null_req_mat), axis=1)
 
             if fr == 0:
@@ -141,31 +145,7 @@ class systolic_compute_os:
         #print('DEBUG: create_ifmap_prefetch_mat()')
         #start_time = time.time()
 
-        M, N = self.ifmap_prefetch_matrix.shape
-        num_elems = M * N
-        num_diags = M + N
-        prefetches = np.zeros((1,num_elems))
-        idx = 0
-
-        pbar = tqdm(total=M*N, disable=True)
-        #print('DEBUG: Total = ' + str(num_elems) + ' Diags = ' + str(num_diags))
-
-        for diag_id in range(num_diags):
-            max_row_id = min(diag_id, M - 1)
-            min_row_id = max(0, diag_id - N + 1)
-            valid_rows = max_row_id - min_row_id + 1
-
-            for offset in range(valid_rows):
-                row_id = max_row_id - offset
-                col_id = diag_id - row_id
-
-                elem = self.ifmap_prefetch_matrix[row_id][col_id]
-                prefetches[0, idx] = elem
-                idx += 1
-                pbar.update(1)
-
-        pbar.close()
-        self.ifmap_prefetch_matrix = prefetches
+        self.ifmap_prefetch_matrix = diagonal_rollout(self.ifmap_prefetch_matrix, dtype=self.addr_dtype)
 
         #t = time.time() - start_time
         #print('DEBUG: create_ifmap_prefetch_mat =' + str(t))
@@ -186,7 +166,7 @@ class systolic_compute_os:
             this_fold_prefetch = self.filter_op_mat[:,col_start_id:col_end_id]
 
             if delta > 0:
-                null_req_mat = np.ones((self.T, delta)) * -1
+                null_req_mat = np.full((self.T, delta), -1, dtype=self.addr_dtype)
                 this_fold_prefetch = np.concatenate((this_fold_prefetch, null_req_mat), axis=1)
 
             if fc == 0:
@@ -201,34 +181,39 @@ class systolic_compute_os:
         #print('DEBUG: create_filter_prefetch_mat()')
         #start_time = time.time()
 
-        M, N = self.filter_prefetch_matrix.shape
-        num_elems = M * N
-        num_diags = M + N
-        prefetches = np.zeros((1, num_elems))
-        idx = 0
+        self.filter_prefetch_matrix = diagonal_rollout(self.filter_prefetch_matrix, dtype=self.addr_dtype)
 
-        pbar = tqdm(total=M * N, disable=True)
-        # print('DEBUG: Total = ' + str(num_elems) + ' Diags = ' + str(num_diags))
-
-        for diag_id in range(num_diags):
-            max_row_id = min(diag_id, M - 1)
-            min_row_id = max(0, diag_id - N + 1)
-            valid_rows = max_row_id - min_row_id + 1
+        #t = time.time() - start_time
+        #print('DEBUG: create_filter_prefetch_mat =' + str(t))
 
-            for offset in range(valid_rows):
-                row_id = max_row_id - offset
-                col_id = diag_id - row_id
+    #
+    def get_fold_ids(self):
+        """
+        Method to get the (column fold, row fold) pairs in the order the folds are run.
+        """
+        return [(fc, fr) for fc in range(self.col_fold) for fr in range(self.row_fold)]
 
-                elem = self.filter_prefetch_matrix[row_id][col_id]
-                prefetches[0, idx] = elem
-                idx += 1
-                pbar.update(1)
+    #
+    def get_num_demand_rows(self):
+        """
+        Method to get the number of rows of the demand matrices, ie. of all the folds together.
+        Each fold streams T operand rows and takes arr_row + arr_col - 2 rows to fill and drain.
+        """
+        assert self.params_set_flag, 'Parameters are not set'
+        rows_per_fold = self.T + self.arr_row + self.arr_col - 2
+        return len(self.get_fold_ids()) * rows_per_fold
 
-        pbar.close()
-        self.filter_prefetch_matrix = prefetches
+    #
+    def reset_demand_stats(self):
+        """
+        Method to clear the request counts and the per fold metrics before generating the demands.
+        """
+        self.ifmap_reads = 0
+        self.filter_reads = 0
+        self.ofmap_writes = 0
 
-        #t = time.time() - start_time
-        #print('DEBUG: create_filter_prefetch_mat =' + str(t))
+        self.mapping_efficiency_per_fold = []
+        self.compute_utility_per_fold = []
 
     #
     def create_demand_matrices(self):
@@ -239,6 +224,7 @@ class systolic_compute_os:
         """
         assert self.params_set_flag, 'Parameters are not set'
 
+        self.reset_demand_stats()
         self.create_ifmap_demand_mat()
         self.create_filter_demand_mat()
         self.create_ofmap_demand_mat()
@@ -252,6 +238,32 @@ class systolic_compute_os:
         assert self.ofmap_demand_matrix.shape[1] == self.arr_col, 'OFMAP demands exceed the cols'
 
         self.demand_mat_ready_flag = True
+        self.demand_stats_ready_flag = True
+
+    #
+    def iter_demand_folds(self):
+        """
+        Method to generate the ifmap, filter and ofmap demands one fold at a time, as aligned
+        (ifmap, filter, ofmap) chunks of rows. Unlike create_demand_matrices(), only one fold is
+        held in memory. The request counts and the per fold metrics are ready once all the folds
+        are generated.
+        """
+        assert self.params_set_flag, 'Parameters are not set'
+
+        self.reset_demand_stats()
+        self.demand_stats_ready_flag = False
+
+        for fc, fr in self.get_fold_ids():
+            ifmap_fold_demand = self.create_ifmap_demand_fold(fc, fr)
+            filter_fold_demand = self.create_filter_demand_fold(fc, fr)
+            ofmap_fold_demand = self.create_ofmap_demand_fold(fc, fr)
+
+            assert ifmap_fold_demand.shape[0] == filter_fold_demand.shape[0] \
+                   == ofmap_fold_demand.shape[0], 'Demands out of sync'
+
+            yield ifmap_fold_demand, filter_fold_demand, ofmap_fold_demand
+
+        self.demand_stats_ready_flag = True
 
     #
     def create_ifmap_demand_mat(self):
@@ -260,51 +272,42 @@ class systolic_compute_os:
         """
         assert self.params_set_flag, 'Parameters are not set'
 
+        self.ifmap_demand_matrix = np.concatenate([self.create_ifmap_demand_fold(fc, fr)
+                                                   for fc, fr in self.get_fold_ids()])
+
+    #
+    def create_ifmap_demand_fold(self, fc, fr):
+        """
+        Method to create the ifmap demands of a single fold.
+        """
         # Anand: Concatenation issue fix
         inter_fold_gap_suffix = self.arr_col - 1
-        inter_fold_gap_suffix_mat = np.ones((inter_fold_gap_suffix, self.arr_row)) * -1
+        inter_fold_gap_suffix_mat = np.full((inter_fold_gap_suffix, self.arr_row), -1, dtype=self.addr_dtype)
 
-        # DEBUG section
-        #print('DEBUG: create_ifmap_demand_mat()')
-        pbar = tqdm(total=self.col_fold * self.row_fold, disable=True)
+        row_start_id = fr * self.arr_row
+        row_end_idx = min(row_start_id + self.arr_row, self.Sr)
+        delta = self.arr_row - (row_end_idx - row_start_id)
+
+        # Indexing the cols with row start and row end idx are correct
+        # See the comment on ifmap_prefetch generation
+        this_fold_demand = self.ifmap_op_mat_trans[:,row_start_id: row_end_idx]
+        self.ifmap_reads += this_fold_demand.shape[0] * this_fold_demand.shape[1]
+
+        # Take into account under utilization
+        if delta > 0:
+            null_req_mat = np.full((self.T, delta), -1, dtype=self.addr_dtype)
+            this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
+
+        # In this computation scheme we are allowing the generated outputs to drain out
+        # before starting the next fold
+        # This portion accounts for that extra time by adding null requests
+        this_fold_demand = np.concatenate((this_fold_demand, inter_fold_gap_suffix_mat),
+                                          axis=0)
 
-        for fc in range(self.col_fold):
-            for fr in range(self.row_fold):
-                row_start_id = fr * self.arr_row
-                row_end_idx = min(row_start_id + self.arr_row, self.Sr)
-                delta = self.arr_row - (row_end_idx - row_start_id)
-
-                # Indexing the cols with row start and row end idx are correct
-                # See the comment on ifmap_prefetch generation
-                this_fold_demand = self.ifmap_op_mat_trans[:,row_start_id: row_end_idx]
-                self.ifmap_reads += this_fold_demand.shape[0] * this_fold_demand.shape[1]
-
-                # Take into account under utilization
-                if delta > 0:
-                    null_req_mat = np.ones((self.T, delta)) * -1
-                    this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
-
-                # In this computation scheme we are allowing the generated outputs to drain out
-                # before starting the next fold
-                # This portion accounts for that extra time by adding null requests
-                this_fold_demand = np.concatenate((this_fold_demand, inter_fold_gap_suffix_mat),
-                                                  axis=0)
-
-                # Add skew to the IFMAP demand matrix to reflect systolic pipeline fill
-                this_fold_demand = skew_matrix(this_fold_demand)
-
-                if fr == 0 and fc == 0:
-                    self.ifmap_demand_matrix = this_fold_demand
-                else:
-                    self.ifmap_demand_matrix = \
-                        np.concatenate((self.ifmap_demand_matrix, this_fold_demand), axis=0)
-
-                pbar.update(1)
-
-        pbar.close()
-        # TODO: cleanup
         # Add skew to the IFMAP demand matrix to reflect systolic pipeline fill
-        #self.ifmap_demand_matrix = skew_matrix(self.ifmap_demand_matrix)
+        this_fold_demand = skew_matrix(this_fold_demand)
+
+        return this_fold_demand
 
     #
     def create_filter_demand_mat(self):
@@ -313,48 +316,39 @@ class systolic_compute_os:
         """
         assert self.params_set_flag, 'Parameters are not set'
 
+        self.filter_demand_matrix = np.concatenate([self.create_filter_demand_fold(fc, fr)
+                                                    for fc, fr in self.get_fold_ids()])
+
+    #
+    def create_filter_demand_fold(self, fc, fr):
+        """
+        Method to create the filter demands of a single fold.
+        """
         inter_fold_gap_suffix = self.arr_row - 1
-        inter_fold_gap_suffix_mat = np.ones((inter_fold_gap_suffix, self.arr_col)) * -1
+        inter_fold_gap_suffix_mat = np.full((inter_fold_gap_suffix, self.arr_col), -1, dtype=self.addr_dtype)
 
-        # Debug messages
-        #print('DEBUG: create_filter_demand_mat()')
-        pbar = tqdm(total=self.col_fold * self.row_fold, disable=True)
+        col_start_id = fc * self.arr_col
+        col_end_idx = min(col_start_id + self.arr_col, self.Sc)
+        delta = self.arr_col - (col_end_idx - col_start_id)
+
+        this_fold_demand = self.filter_op_mat[:, col_start_id: col_end_idx]
+        self.filter_reads += this_fold_demand.shape[0] * this_fold_demand.shape[1]
+
+        # Take into account under utilization
+        if delta > 0:
+            null_req_mat = np.full((self.T, delta), -1, dtype=self.addr_dtype)
+            this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
+
+        # In this computation scheme we are allowing the generated outputs to drain out
+        # before starting the next fold
+        # This portion accounts for that extra time by adding null requests
+        this_fold_demand = np.concatenate((this_fold_demand, inter_fold_gap_suffix_mat),
+                                          axis=0)
 
-        for fc in range(self.col_fold):
-            for fr in range(self.row_fold):
-                col_start_id = fc * self.arr_col
-                col_end_idx = min(col_start_id + self.arr_col, self.Sc)
-                delta = self.arr_col - (col_end_idx - col_start_id)
-
-                this_fold_demand = self.filter_op_mat[:, col_start_id: col_end_idx]
-                self.filter_reads += this_fold_demand.shape[0] * this_fold_demand.shape[1]
-
-                # Take into account under utilization
-                if delta > 0:
-                    null_req_mat = np.ones((self.T, delta)) * -1
-                    this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
-
-                # In this computation scheme we are allowing the generated outputs to drain out
-                # before starting the next fold
-                # This portion accounts for that extra time by adding null requests
-                this_fold_demand = np.concatenate((this_fold_demand, inter_fold_gap_suffix_mat),
-                                                  axis=0)
-
-                # Add skew to the Filter demand matrix to reflect systolic pipeline fill
-                this_fold_demand = skew_matrix(this_fold_demand)
-
-                if fr == 0 and fc == 0:
-                    self.filter_demand_matrix = this_fold_demand
-                else:
-                    self.filter_demand_matrix = \
-                        np.concatenate((self.filter_demand_matrix, this_fold_demand), axis=0)
-
-                pbar.update(1)
-
-        pbar.close()
-        # TODO: Cleanup
         # Add skew to the Filter demand matrix to reflect systolic pipeline fill
-        #self.filter_demand_matrix = skew_matrix(self.filter_demand_matrix)
+        this_fold_demand = skew_matrix(this_fold_demand)
+
+        return this_fold_demand
 
     #
     def create_ofmap_demand_mat(self):
@@ -363,80 +357,72 @@ class systolic_compute_os:
         """
         assert self.params_set_flag, 'Parameters are not set'
 
-        inter_fold_gap_prefix = self.T  - 1
-        inter_fold_gap_prefix_mat = np.ones((inter_fold_gap_prefix, self.arr_col)) * -1
+        self.ofmap_demand_matrix = np.concatenate([self.create_ofmap_demand_fold(fc, fr)
+                                                   for fc, fr in self.get_fold_ids()])
 
-        # Debug messages
-        #print('DEBUG: create_ifmap_demand_mat()')
-        pbar = tqdm(total=self.col_fold * self.row_fold, disable=True)
+    #
+    def create_ofmap_demand_fold(self, fc, fr):
+        """
+        Method to create the ofmap demands of a single fold, and the mapping efficiency and the
+        compute utilization of the fold.
+        """
+        inter_fold_gap_prefix = self.T  - 1
+        inter_fold_gap_prefix_mat = np.full((inter_fold_gap_prefix, self.arr_col), -1, dtype=self.addr_dtype)
+
+        row_start_id = fr * self.arr_row
+        row_end_idx = min(row_start_id + self.arr_row, self.Sr)
+        row_delta = self.arr_row - (row_end_idx - row_start_id)
+
+        col_start_id = fc * self.arr_col
+        col_end_idx = min(col_start_id + self.arr_col, self.Sc)
+        col_delta = self.arr_col - (col_end_idx - col_start_id)
+
+        this_fold_demand = \
+            self.ofmap_op_mat[row_start_id: row_end_idx, col_start_id: col_end_idx]
+        self.ofmap_writes += this_fold_demand.shape[0] * this_fold_demand.shape[1]
+
+        # Adding null requests when there is under utilization ie. no mapping along a few
+        # rows or cols
+        if col_delta > 0:
+            null_req_mat = np.full((this_fold_demand.shape[0], col_delta), -1, dtype=self.addr_dtype)
+            this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
+
+        if row_delta > 0:
+            null_req_mat = np.full((row_delta, self.arr_col), -1, dtype=self.addr_dtype)
+            this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=0)
+
+        # Reflect along the rows
+        # This is a characteristic of the fact that the outputs are streamed out from the
+        # bottom edge.
+        # If the outputs are streamed out from the top edge instead, then this step is not
+        # needed.
+        this_fold_demand = np.flip(this_fold_demand, 0)
+        self.ofmap_writes += this_fold_demand.shape[0] + this_fold_demand.shape[1]
+
+        # Now add the prefix matrix
+        # These are the null demands to account for when the operands are streamed in
+        # and the OFMAPS are not ready
+        this_fold_demand = np.concatenate((inter_fold_gap_prefix_mat, this_fold_demand),
+                                          axis=0)
+
+        # Calculate the mapping efficiency
+        row_used = min(self.arr_row, row_end_idx - row_start_id)
+        col_used = min(self.arr_col, col_end_idx - col_start_id)
+        mac_used = row_used * col_used
+        mapping_eff_this_fold = mac_used / (self.arr_row * self.arr_col)
+
+        cycles_this_fold = this_fold_demand.shape[0] + this_fold_demand.shape[1] - 1
+        compute_cycles_this_fold = mac_used * self.T
+        compute_util_this_fold = \
+            compute_cycles_this_fold / (self.arr_row * self.arr_col * cycles_this_fold)
+
+        self.mapping_efficiency_per_fold.append(mapping_eff_this_fold)
+        self.compute_utility_per_fold.append(compute_util_this_fold)
 
-        for fc in range(self.col_fold):
-            for fr in range(self.row_fold):
-                row_start_id = fr * self.arr_row
-                row_end_idx = min(row_start_id + self.arr_row, self.Sr)
-                row_delta = self.arr_row - (row_end_idx - row_start_id)
-
-                col_start_id = fc * self.arr_col
-                col_end_idx = min(col_start_id + self.arr_col, self.Sc)
-                col_delta = self.arr_col - (col_end_idx - col_start_id)
-
-                this_fold_demand = \
-                    self.ofmap_op_mat[row_start_id: row_end_idx, col_start_id: col_end_idx]
-                self.ofmap_writes += this_fold_demand.shape[0] * this_fold_demand.shape[1]
-
-                # Adding null requests when there is under utilization ie. no mapping along a few
-                # rows or cols
-                if col_delta > 0:
-                    null_req_mat = np.ones((this_fold_demand.shape[0], col_delta)) * -1
-                    this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=1)
-
-                if row_delta > 0:
-                    null_req_mat = np.ones((row_delta, self.arr_col)) * -1
-                    this_fold_demand = np.concatenate((this_fold_demand, null_req_mat), axis=0)
-
-                # Reflect along the rows
-                # This is a characteristic of the fact that the outputs are streamed out from the
-                # bottom edge.
-                # If the outputs are streamed out from the top edge instead, then this step is not
-                # needed.
-                this_fold_demand = np.flip(this_fold_demand, 0)
-                self.ofmap_writes += this_fold_demand.shape[0] + this_fold_demand.shape[1]
-
-                # Now add the prefix matrix
-                # These are the null demands to account for when the operands are streamed in
-                # and the OFMAPS are not ready
-                this_fold_demand = np.concatenate((inter_fold_gap_prefix_mat, this_fold_demand),
-                                                  axis=0)
-
-                # Calculate the mapping efficiency
-                row_used = min(self.arr_row, row_end_idx - row_start_id)
-                col_used = min(self.arr_col, col_end_idx - col_start_id)
-                mac_used = row_used * col_used
-                mapping_eff_this_fold = mac_used / (self.arr_row * self.arr_col)
-
-                cycles_this_fold = this_fold_demand.shape[0] + this_fold_demand.shape[1] - 1
-                compute_cycles_this_fold = mac_used * self.T
-                compute_util_this_fold = \
-                    compute_cycles_this_fold / (self.arr_row * self.arr_col * cycles_this_fold)
-
-                self.mapping_efficiency_per_fold.append(mapping_eff_this_fold)
-                self.compute_utility_per_fold.append(compute_util_this_fold)
-
-                # Add skew to the OFMAP demand matrix to reflect systolic pipeline fill
-                this_fold_demand = skew_matrix(this_fold_demand)
-
-                if fr == 0 and fc == 0:
-                    self.ofmap_demand_matrix = this_fold_demand
-                else:
-                    self.ofmap_demand_matrix = \
-                        np.concatenate((self.ofmap_demand_matrix, this_fold_demand), axis=0)
-
-                pbar.update(1)
-
-        pbar.close()
-        # TODO: cleanup
         # Add skew to the OFMAP demand matrix to reflect systolic pipeline fill
-        #self.ofmap_demand_matrix = skew_matrix(self.ofmap_demand_matrix)
+        this_fold_demand = skew_matrix(this_fold_demand)
+
+        return this_fold_demand
 
     #
     def get_ifmap_prefetch_mat(self):
@@ -513,7 +499,7 @@ class systolic_compute_os:
         """
         Method to get average mapping efficincy on the systolic array.
         """
-        assert self.demand_mat_ready_flag, 'Computes not ready yet'
+        assert self.demand_stats_ready_flag, 'Computes not ready yet'
 
         agg = sum(self.mapping_efficiency_per_fold)
         num = len(self.mapping_efficiency_per_fold)
@@ -527,7 +513,7 @@ class systolic_compute_os:
         """
         Method to get average compute utilization on the systolic array.
         """
-        assert self.demand_mat_ready_flag, 'Computes not ready yet'
+        assert self.demand_stats_ready_flag, 'Computes not ready yet'
 
         agg = sum(self.compute_utility_per_fold)
         num = len(self.compute_utility_per_fold)
@@ -541,7 +527,7 @@ class systolic_compute_os:
         """
         Method to get ifmap read requests.
         """
-        assert self.demand_mat_ready_flag, 'Computes not ready yet'
+        assert self.demand_stats_ready_flag, 'Computes not ready yet'
         return self.ifmap_reads
 
     #
@@ -549,7 +535,7 @@ class systolic_compute_os:
         """
         Method to get filter read requests.
         """
-        assert self.demand_mat_ready_flag, 'Computes not ready yet'
+        assert self.demand_stats_ready_flag, 'Computes not ready yet'
         return self.filter_reads
 
     #
@@ -557,27 +543,5 @@ class systolic_compute_os:
         """
         Method to get ofmap write requests.
         """
-        assert self.demand_mat_ready_flag, 'Computes not ready yet'
+        assert self.demand_stats_ready_flag, 'Computes not ready yet'
         return self.ofmap_writes
-
-#
-def skew_matrix(input_matrix_np):
-    """
-    Method to add skew to the input matix to maintain systolic array flow.
-    Example:
-        Input matrix:
-        1 1 1 1 1 1 1 1 1
-
-        Output matrix:
-            1 1 1
-          1 1 1
-        1 1 1
-    """
-    rows, cols = input_matrix_np.shape
-
-    out_matrix_np = np.full((rows + cols - 1, cols), -1, dtype=input_matrix_np.dtype)
-
-    for c in range(cols):
-        out_matrix_np[c:c + rows, c] = input_matrix_np[:, c]
-
-    return out_matrix_np
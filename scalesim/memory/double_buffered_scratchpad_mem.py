@@ -15,6 +15,8 @@ from scalesim.memory.read_buffer_estimate_bw import ReadBufferEstimateBw as rdbu
 from scalesim.memory.read_port import read_port as rdport
 from scalesim.memory.write_buffer import write_buffer as wrbuf
 from scalesim.memory.write_port import write_port as wrport
+from scalesim.memory.sram_trace_collector import sram_trace_collector
+from scalesim.utilities.trace_io import save_trace, cycle_dtype
 
 class double_buffered_scratchpad:
     """
@@ -44,6 +46,19 @@ class double_buffered_scratchpad:
         self.filter_trace_matrix = np.zeros((1,1), dtype=int)
         self.ofmap_trace_matrix = np.zeros((1,1), dtype=int)
 
+        self.ifmap_trace = sram_trace_collector()
+        self.filter_trace = sram_trace_collector()
+        self.ofmap_trace = sram_trace_collector()
+
+        # Streaming mode: the SRAM traces are written to these files in chunks of rows while the
+        # requests are serviced, instead of being kept in memory
+        self.stream_sram_traces = False
+        self.sram_trace_chunk_rows = 0
+        self.sram_trace_format = 'csv'
+        self.ifmap_sram_trace_filename = ''
+        self.filter_sram_trace_filename = ''
+        self.ofmap_sram_trace_filename = ''
+
         # Metrics to gather for generating run reports
         self.total_cycles = 0
         self.compute_cycles = 0
@@ -89,16 +104,18 @@ class double_buffered_scratchpad:
                    ifmap_backing_buf_bw=1, filter_backing_buf_bw=1, ofmap_backing_buf_bw=1,
                    ifmap_sram_bank_num=1, ifmap_sram_bank_port=2, filter_sram_bank_num=1, filter_sram_bank_port=2,
                    using_ifmap_custom_layout=False, using_filter_custom_layout=False,
-                   config=cfg(), topo=topo()
+                   config=cfg(), topo=topo(), dram_latencies=None
                    ):
 
         """
-        Method to set the double buffered memory simulation parameters for housekeeping.
+        Method to set the double buffered memory simulation parameters for housekeeping. The DRAM
+        latencies of the ifmap, filter and ofmap request lines can be given as arrays, eg. by the
+        Ramulator bridge, instead of being loaded from the Ramulator latency files.
         """
         self.layer_id = layer_id
         self.topo = topo
         self.config = config
-        self.use_ramulator_trace = config.get_ramulator_trace()
+        self.use_ramulator_trace = config.get_ramulator_trace() or dram_latencies is not None
 
         self.estimate_bandwidth_mode = estimate_bandwidth_mode
 
@@ -125,7 +142,12 @@ class double_buffered_scratchpad:
             self.ifmap_buf = rdbuf()
             self.filter_buf = rdbuf()
             
-            if self.use_ramulator_trace == True:
+            if dram_latencies is not None:
+                ifmap_latencies, filter_latencies, ofmap_latencies = dram_latencies
+                self.ifmap_port.def_params(config=self.config, latency_matrix=ifmap_latencies)
+                self.filter_port.def_params(config=self.config, latency_matrix=filter_latencies)
+                self.ofmap_port.def_params(config=self.config, latency_matrix=ofmap_latencies)
+            elif self.use_ramulator_trace == True:
                 root_path = os.getcwd()
                 #topology_file = self.topo.split('.')[0]
                 topology_file =''
@@ -171,6 +193,30 @@ class double_buffered_scratchpad:
         self.params_valid_flag = True
 
 
+    #
+    def set_sram_trace_streaming(self,
+                                 ifmap_filename, filter_filename, ofmap_filename,
+                                 trace_format='csv', chunk_rows=65536):
+        """
+        Method to stream the SRAM traces to the given files in chunks of chunk_rows rows while the
+        requests are serviced. The trace matrices are not kept in memory in this mode.
+        """
+        assert chunk_rows > 0, 'Chunk size should be positive'
+
+        self.stream_sram_traces = True
+        self.sram_trace_chunk_rows = chunk_rows
+        self.sram_trace_format = trace_format
+        self.ifmap_sram_trace_filename = ifmap_filename
+        self.filter_sram_trace_filename = filter_filename
+        self.ofmap_sram_trace_filename = ofmap_filename
+
+    #
+    def is_sram_trace_streamed(self):
+        """
+        Method to check if the SRAM traces are written to files while servicing the requests.
+        """
+        return self.stream_sram_traces
+
     #
     def set_read_buf_prefetch_matrices(self,
                                        ifmap_prefetch_mat=np.zeros((1,1)),
@@ -236,9 +282,17 @@ class double_buffered_scratchpad:
         Method to run the memory simulation of ifmap, filter and ofmap SRAMs together and generate
         the traces.
         """
-        assert self.params_valid_flag, 'Memories not initialized yet'
+        self.service_demand_folds([(ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat)],
+                                  num_rows=ofmap_demand_mat.shape[0])
 
-        ofmap_lines = ofmap_demand_mat.shape[0]
+    #
+    def service_demand_folds(self, demand_folds, num_rows):
+        """
+        Method to run the memory simulation of ifmap, filter and ofmap SRAMs together and generate
+        the traces, with the demands coming in as aligned (ifmap, filter, ofmap) chunks of rows,
+        eg. one fold at a time. num_rows is the total number of rows in all the chunks.
+        """
+        assert self.params_valid_flag, 'Memories not initialized yet'
 
         self.total_cycles = 0
         self.stall_cycles = 0
@@ -246,38 +300,114 @@ class double_buffered_scratchpad:
         ifmap_hit_latency = self.ifmap_buf.get_hit_latency()
         filter_hit_latency = self.filter_buf.get_hit_latency()
 
-        ifmap_serviced_cycles = []
-        filter_serviced_cycles = []
-        ofmap_serviced_cycles = []
+        chunk_rows = 0
+        if self.stream_sram_traces:
+            chunk_rows = self.sram_trace_chunk_rows
+
+        self.ifmap_trace.set_params(num_rows,
+                                    filename=self.ifmap_sram_trace_filename,
+                                    trace_format=self.sram_trace_format,
+                                    chunk_rows=chunk_rows)
+        self.filter_trace.set_params(num_rows,
+                                     filename=self.filter_sram_trace_filename,
+                                     trace_format=self.sram_trace_format,
+                                     chunk_rows=chunk_rows)
+        self.ofmap_trace.set_params(num_rows,
+                                    filename=self.ofmap_sram_trace_filename,
+                                    trace_format=self.sram_trace_format,
+                                    chunk_rows=chunk_rows)
 
         pbar_disable = not self.verbose
-        for i in tqdm(range(ofmap_lines), disable=pbar_disable):
-
-            cycle_arr = np.zeros((1,1)) + i + self.stall_cycles
-
-            ifmap_demand_line = ifmap_demand_mat[i, :].reshape((1,ifmap_demand_mat.shape[1]))
-            ifmap_cycle_out = \
-                self.ifmap_buf.service_reads(incoming_requests_arr_np=ifmap_demand_line,
-                                             incoming_cycles_arr=cycle_arr)
-            ifmap_serviced_cycles += [ifmap_cycle_out[0]]
-            ifmap_stalls = ifmap_cycle_out[0] - cycle_arr[0] - ifmap_hit_latency
-
-            filter_demand_line = filter_demand_mat[i, :].reshape((1, filter_demand_mat.shape[1]))
-            filter_cycle_out = \
-                self.filter_buf.service_reads(incoming_requests_arr_np=filter_demand_line,
-                                              incoming_cycles_arr=cycle_arr)
-            filter_serviced_cycles += [filter_cycle_out[0]]
-            filter_stalls = filter_cycle_out[0] - cycle_arr[0] - filter_hit_latency
-
-            ofmap_demand_line = ofmap_demand_mat[i, :].reshape((1, ofmap_demand_mat.shape[1]))
-            ofmap_cycle_out = \
-                self.ofmap_buf.service_writes(incoming_requests_arr_np=ofmap_demand_line,
-                                              incoming_cycles_arr_np=cycle_arr)
-            ofmap_serviced_cycles += [ofmap_cycle_out[0]]
-            ofmap_stalls = ofmap_cycle_out[0] - cycle_arr[0]
-
-            self.stall_cycles += int(max(ifmap_stalls[0], filter_stalls[0], ofmap_stalls[0]))
-            #self.stall_cycles += ifmap_stalls[0] + filter_stalls[0] + ofmap_stalls[0]
+        pbar = tqdm(total=num_rows, disable=pbar_disable)
+
+        min_scan_rows = 64
+        max_scan_rows = 8192
+        scan_rows = min_scan_rows
+
+        # Row of the current chunk in the complete demand matrices
+        row_offset = 0
+        for ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat in demand_folds:
+            ofmap_lines = ofmap_demand_mat.shape[0]
+
+            i = 0
+            while i < ofmap_lines:
+                # Rows which hit in both the read buffers see no read stalls, and are serviced in
+                # a single batch by each of the buffers
+                end = min(i + scan_rows, ofmap_lines)
+                num_hit_rows = min(self.ifmap_buf.get_num_hit_rows(ifmap_demand_mat[i:end, :]),
+                                   self.filter_buf.get_num_hit_rows(filter_demand_mat[i:end, :]))
+
+                if num_hit_rows == end - i:
+                    scan_rows = min(2 * scan_rows, max_scan_rows)
+                else:
+                    scan_rows = min_scan_rows
+
+                if num_hit_rows > 0:
+                    end = i + num_hit_rows
+                    cycle_arr = np.arange(row_offset + i, row_offset + end,
+                                          dtype=cycle_dtype).reshape((-1, 1)) + self.stall_cycles
+
+                    ofmap_demands = ofmap_demand_mat[i:end, :]
+                    ofmap_cycle_out = \
+                        self.ofmap_buf.service_writes(incoming_requests_arr_np=ofmap_demands,
+                                                      incoming_cycles_arr_np=cycle_arr)
+                    self.ofmap_trace.add_serviced_rows(ofmap_cycle_out, ofmap_demands)
+
+                    # The ofmap stalls accumulate over the batch and delay each of the following
+                    # rows
+                    ofmap_stalls = ofmap_cycle_out - cycle_arr
+                    cycle_arr[1:] += ofmap_stalls[:-1]
+
+                    ifmap_demands = ifmap_demand_mat[i:end, :]
+                    ifmap_cycle_out = \
+                        self.ifmap_buf.service_reads(incoming_requests_arr_np=ifmap_demands,
+                                                     incoming_cycles_arr=cycle_arr)
+                    self.ifmap_trace.add_serviced_rows(ifmap_cycle_out, ifmap_demands)
+
+                    filter_demands = filter_demand_mat[i:end, :]
+                    filter_cycle_out = \
+                        self.filter_buf.service_reads(incoming_requests_arr_np=filter_demands,
+                                                      incoming_cycles_arr=cycle_arr)
+                    self.filter_trace.add_serviced_rows(filter_cycle_out, filter_demands)
+
+                    self.stall_cycles += int(ofmap_stalls[-1][0])
+
+                    pbar.update(num_hit_rows)
+                    i = end
+                    continue
+
+                cycle_arr = np.full((1,1), row_offset + i + self.stall_cycles, dtype=cycle_dtype)
+
+                ifmap_demand_line = ifmap_demand_mat[i:i + 1, :]
+                ifmap_cycle_out = \
+                    self.ifmap_buf.service_reads(incoming_requests_arr_np=ifmap_demand_line,
+                                                 incoming_cycles_arr=cycle_arr)
+                self.ifmap_trace.add_serviced_rows(ifmap_cycle_out, ifmap_demand_line)
+                ifmap_stalls = ifmap_cycle_out[0] - cycle_arr[0] - ifmap_hit_latency
+
+                filter_demand_line = filter_demand_mat[i:i + 1, :]
+                filter_cycle_out = \
+                    self.filter_buf.service_reads(incoming_requests_arr_np=filter_demand_line,
+                                                  incoming_cycles_arr=cycle_arr)
+                self.filter_trace.add_serviced_rows(filter_cycle_out, filter_demand_line)
+                filter_stalls = filter_cycle_out[0] - cycle_arr[0] - filter_hit_latency
+
+                ofmap_demand_line = ofmap_demand_mat[i:i + 1, :]
+                ofmap_cycle_out = \
+                    self.ofmap_buf.service_writes(incoming_requests_arr_np=ofmap_demand_line,
+                                                  incoming_cycles_arr_np=cycle_arr)
+                self.ofmap_trace.add_serviced_rows(ofmap_cycle_out, ofmap_demand_line)
+                ofmap_stalls = ofmap_cycle_out[0] - cycle_arr[0]
+
+                self.stall_cycles += int(max(ifmap_stalls[0], filter_stalls[0], ofmap_stalls[0]))
+                #self.stall_cycles += ifmap_stalls[0] + filter_stalls[0] + ofmap_stalls[0]
+
+                pbar.update(1)
+                i += 1
+
+            row_offset += ofmap_lines
+
+        pbar.close()
 
         if self.estimate_bandwidth_mode:
             # IDE shows warning as complete_all_prefetches is not implemented in read_buffer class
@@ -285,26 +415,21 @@ class double_buffered_scratchpad:
             self.ifmap_buf.complete_all_prefetches()
             self.filter_buf.complete_all_prefetches()
 
-        self.ofmap_buf.empty_all_buffers(ofmap_serviced_cycles[-1])
-
         # Prepare the traces
-        ifmap_services_cycles_np = \
-            np.asarray(ifmap_serviced_cycles).reshape((len(ifmap_serviced_cycles), 1))
-        self.ifmap_trace_matrix = np.concatenate((ifmap_services_cycles_np, ifmap_demand_mat),
-                                                 axis=1)
-
-        filter_services_cycles_np = \
-            np.asarray(filter_serviced_cycles).reshape((len(filter_serviced_cycles), 1))
-        self.filter_trace_matrix = np.concatenate((filter_services_cycles_np, filter_demand_mat),
-                                                  axis=1)
-
-        ofmap_services_cycles_np = \
-            np.asarray(ofmap_serviced_cycles).reshape((len(ofmap_serviced_cycles), 1))
-        self.ofmap_trace_matrix = np.concatenate((ofmap_services_cycles_np, ofmap_demand_mat),
-                                                 axis=1)
+        self.ifmap_trace.finish()
+        self.filter_trace.finish()
+        self.ofmap_trace.finish()
+
+        if not self.stream_sram_traces:
+            self.ifmap_trace_matrix = self.ifmap_trace.get_trace_matrix()
+            self.filter_trace_matrix = self.filter_trace.get_trace_matrix()
+            self.ofmap_trace_matrix = self.ofmap_trace.get_trace_matrix()
+
+        self.ofmap_buf.empty_all_buffers(self.ofmap_trace.get_last_cycle())
+
         #self.total_cycles = int(ofmap_serviced_cycles[-1][0])
         ## Probable fault in sanity check
-        self.total_cycles = int(max(ofmap_serviced_cycles))
+        self.total_cycles = int(self.ofmap_trace.get_max_cycle())
 
         # END of serving demands from memory
         self.traces_valid = True
@@ -491,28 +616,8 @@ class double_buffered_scratchpad:
         """
         assert self.traces_valid, 'Traces not generated yet'
 
-        done = False
-        for ridx in range(self.ifmap_trace_matrix.shape[0]):
-            if done:
-                break
-            row = self.ifmap_trace_matrix[ridx,1:]
-            for addr in row:
-                if not addr == -1:
-                    self.ifmap_sram_start_cycle = self.ifmap_trace_matrix[ridx][0]
-                    done = True
-                    break
-
-        done = False
-        for ridx in range(self.ifmap_trace_matrix.shape[0]):
-            if done:
-                break
-            ridx = -1 * (ridx + 1)
-            row = self.ifmap_trace_matrix[ridx,1:]
-            for addr in row:
-                if not addr == -1:
-                    self.ifmap_sram_stop_cycle  = self.ifmap_trace_matrix[ridx][0]
-                    done = True
-                    break
+        self.ifmap_sram_start_cycle, self.ifmap_sram_stop_cycle \
+            = self.ifmap_trace.get_start_stop_cycles()
 
         return self.ifmap_sram_start_cycle, self.ifmap_sram_stop_cycle
 
@@ -524,30 +629,8 @@ class double_buffered_scratchpad:
         """
         assert self.traces_valid, 'Traces not generated yet'
 
-        done = False
-        for ridx in range(self.filter_trace_matrix.shape[0]):
-
-            if done:
-                break
-            row = self.filter_trace_matrix[ridx, 1:]
-            for addr in row:
-                if not addr == -1:
-                    self.filter_sram_start_cycle = self.filter_trace_matrix[ridx][0]
-                    done = True
-                    break
-
-        done = False
-        for ridx in range(self.filter_trace_matrix.shape[0]):
-            if done:
-                break
-            ridx = -1 * (ridx + 1)
-
-            row = self.filter_trace_matrix[ridx, 1:]
-            for addr in row:
-                if not addr == -1:
-                    self.filter_sram_stop_cycle = self.filter_trace_matrix[ridx][0]
-                    done = True
-                    break
+        self.filter_sram_start_cycle, self.filter_sram_stop_cycle \
+            = self.filter_trace.get_start_stop_cycles()
 
         return self.filter_sram_start_cycle, self.filter_sram_stop_cycle
 
@@ -559,28 +642,8 @@ class double_buffered_scratchpad:
         """
         assert self.traces_valid, 'Traces not generated yet'
 
-        done = False
-        for ridx in range(self.ofmap_trace_matrix.shape[0]):
-            if done:
-                break
-            row = self.ofmap_trace_matrix[ridx, 1:]
-            for addr in row:
-                if not addr == -1:
-                    self.ofmap_sram_start_cycle = self.ofmap_trace_matrix[ridx][0]
-                    done = True
-                    break
-
-        done = False
-        for ridx in range(self.ofmap_trace_matrix.shape[0]):
-            if done:
-                break
-            ridx = -1 * (ridx + 1)
-            row = self.ofmap_trace_matrix[ridx, 1:]
-            for addr in row:
-                if not addr == -1:
-                    self.ofmap_sram_stop_cycle = self.ofmap_trace_matrix[ridx][0]
-                    done = True
-                    break
+        self.ofmap_sram_start_cycle, self.ofmap_sram_stop_cycle \
+            = self.ofmap_trace.get_start_stop_cycles()
 
         return self.ofmap_sram_start_cycle, self.ofmap_sram_stop_cycle
 
@@ -633,6 +696,7 @@ class double_buffered_scratchpad:
         array and the cycles (first column) at which the requests are made.
         """
         assert self.traces_valid, 'Traces not generated yet'
+        assert not self.stream_sram_traces, 'SRAM traces are streamed to files'
         return self.ifmap_trace_matrix
 
     #
@@ -642,6 +706,7 @@ class double_buffered_scratchpad:
         array and the cycles (first column) at which the requests are made.
         """
         assert self.traces_valid, 'Traces not generated yet'
+        assert not self.stream_sram_traces, 'SRAM traces are streamed to files'
         return self.filter_trace_matrix
 
     #
@@ -651,6 +716,7 @@ class double_buffered_scratchpad:
         array and the cycles (first column) at which the requests are made.
         """
         assert self.traces_valid, 'Traces not generated yet'
+        assert not self.stream_sram_traces, 'SRAM traces are streamed to files'
         return self.ofmap_trace_matrix
 
     #
@@ -659,6 +725,7 @@ class double_buffered_scratchpad:
         Method to get the ifmap, filter and ofmap SRAM trace matrices.
         """
         assert self.traces_valid, 'Traces not generated yet'
+        assert not self.stream_sram_traces, 'SRAM traces are streamed to files'
         return self.ifmap_trace_matrix, self.filter_trace_matrix, self.ofmap_trace_matrix
 
     #
@@ -697,47 +764,50 @@ class double_buffered_scratchpad:
         return dram_ifmap_trace, dram_filter_trace, dram_ofmap_trace
 
     #
-    def print_ifmap_sram_trace(self, filename):
+    def print_ifmap_sram_trace(self, filename, trace_format='csv'):
         """
         Method to write the ifmap SRAM trace matrix to a file if trace_valid flag is set.
         """
         assert self.traces_valid, 'Traces not generated yet'
+        assert not self.stream_sram_traces, 'SRAM traces are streamed to files'
         os.makedirs(os.path.dirname(filename), exist_ok=True)
-        np.savetxt(filename, self.ifmap_trace_matrix, fmt='%i', delimiter=",")
+        save_trace(filename, self.ifmap_trace_matrix, trace_format=trace_format, csv_fmt='%i')
 
     #
-    def print_filter_sram_trace(self, filename):
+    def print_filter_sram_trace(self, filename, trace_format='csv'):
         """
         Method to write the filter SRAM trace matrix to a file if trace_valid flag is set.
         """
         assert self.traces_valid, 'Traces not generated yet'
-        np.savetxt(filename, self.filter_trace_matrix, fmt='%i', delimiter=",")
+        assert not self.stream_sram_traces, 'SRAM traces are streamed to files'
+        save_trace(filename, self.filter_trace_matrix, trace_format=trace_format, csv_fmt='%i')
 
     #
-    def print_ofmap_sram_trace(self, filename):
+    def print_ofmap_sram_trace(self, filename, trace_format='csv'):
         """
         Method to write the Ofmap SRAM trace matrix to a file if trace_valid flag is set.
         """
         assert self.traces_valid, 'Traces not generated yet'
-        np.savetxt(filename, self.ofmap_trace_matrix, fmt='%i', delimiter=",")
+        assert not self.stream_sram_traces, 'SRAM traces are streamed to files'
+        save_trace(filename, self.ofmap_trace_matrix, trace_format=trace_format, csv_fmt='%i')
 
     #
-    def print_ifmap_dram_trace(self, filename):
+    def print_ifmap_dram_trace(self, filename, trace_format='csv'):
         """
         Method to write the ifmap DRAM trace matrix to a file.
         """
-        self.ifmap_buf.print_trace(filename)
+        self.ifmap_buf.print_trace(filename, trace_format=trace_format)
 
     #
-    def print_filter_dram_trace(self, filename):
+    def print_filter_dram_trace(self, filename, trace_format='csv'):
         """
         Method to write the filter DRAM trace matrix to a file.
         """
-        self.filter_buf.print_trace(filename)
+        self.filter_buf.print_trace(filename, trace_format=trace_format)
 
     #
-    def print_ofmap_dram_trace(self, filename):
+    def print_ofmap_dram_trace(self, filename, trace_format='csv'):
         """
         Method to write the iomap DRAM trace matrix to a file.
         """
-        self.ofmap_buf.print_trace(filename)
+        self.ofmap_buf.print_trace(filename, trace_format=trace_format)
@@ -0,0 +1,338 @@
+"""
+This file contains the 'dram_model' class, a vectorized DRAM timing model which can be used instead
+of Ramulator to get the latency of the DRAM requests. It models the read and write queues of the
+controller, the channels and the banks with their row buffers (tRCD/tRP/tCL) and the data bus of
+each channel, with an open or closed page policy.
+"""
+
+import numpy as np
+
+
+valid_page_policies = ['open', 'closed']
+
+# Cycle before any request, the initial free cycle of the banks and buses
+no_cycle = np.iinfo(np.int64).min // 4
+
+
+#
+def get_group_ids(sorted_keys_np):
+    """
+    Method to number the groups of equal keys in a sorted array, counting up from 0.
+    """
+    return np.cumsum(np.diff(sorted_keys_np, prepend=sorted_keys_np[:1]) != 0)
+
+
+#
+def serve_in_order(arrive_cycles_np, service_cycles_np, group_ids_np):
+    """
+    Method to get the cycles at which a sequence of requests finishes, when the requests of each
+    group are served one after the other in the given order. The requests need to be sorted by
+    group, with the group ids counting up from 0. Each request starts once it arrives and the
+    previous request of the group finishes, so
+        finish[i] = max(arrive[i], finish[i - 1]) + service[i]
+    which is evaluated for all the requests at once as
+        finish[i] = max over j <= i of (arrive[j] - service[start..j-1]) + service[start..i]
+    """
+    num_requests = arrive_cycles_np.shape[0]
+    if num_requests == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    group_starts = np.flatnonzero(np.diff(group_ids_np, prepend=-1))
+    group_lens = np.diff(np.append(group_starts, num_requests))
+
+    cum_service = np.cumsum(service_cycles_np)
+    cum_service -= np.repeat(cum_service[group_starts] - service_cycles_np[group_starts],
+                             group_lens)
+
+    start_bound = arrive_cycles_np - (cum_service - service_cycles_np)
+
+    # Shift each group above the previous ones, so one running max does not cross the groups
+    group_rank = np.repeat(np.arange(group_starts.shape[0], dtype=np.int64), group_lens)
+    group_shift = int(start_bound.max() - start_bound.min()) + 1
+    running_max = np.maximum.accumulate(start_bound + group_rank * group_shift) \
+                  - group_rank * group_shift
+
+    return running_max + cum_service
+
+
+class dram_model:
+    """
+    Class which estimates the latency of every line of the DRAM traces of a layer. The requests
+    arrive at the cycles of their lines, and the addresses of a line which fall in the same burst
+    are served together. Like the read and write queues of a DRAM controller, at most queue depth
+    reads and queue depth writes are outstanding: a request enters the controller once it arrives
+    and the request of its queue one queue depth ahead is done, and its latency counts from there.
+    An address maps to (row, bank, column, channel) from the most to the least significant bits,
+    so consecutive bursts go to different channels. Each bank serves its requests in the order
+    they enter: a row buffer hit takes tBurst, while opening a row takes tRCD more and closing the
+    open row tRP more. The bursts of a channel then share its data bus, and the data returns tCL
+    after the burst is sent.
+    """
+    #
+    def __init__(self):
+        """
+        __init__ method.
+        """
+        self.num_channels = 1
+        self.num_banks = 16
+        self.row_size_bytes = 8192
+        self.burst_size_bytes = 64
+        self.word_size_bytes = 1
+
+        # Timings in cycles
+        self.t_rcd = 16
+        self.t_rp = 16
+        self.t_cl = 16
+        self.t_burst = 4
+
+        self.page_policy = 'open'
+
+        # Outstanding requests per read and write queue, 0 does not bound them
+        self.queue_depth = 32
+
+        self.params_set_flag = False
+
+    #
+    def set_params(self,
+                   num_channels=1, num_banks=16,
+                   row_size_bytes=8192, burst_size_bytes=64, word_size_bytes=1,
+                   t_rcd=16, t_rp=16, t_cl=16, t_burst=4,
+                   page_policy='open', queue_depth=32):
+        """
+        Method to set the DRAM organization, timings and controller queue depth.
+        """
+        assert num_channels > 0 and num_banks > 0, 'Invalid number of channels or banks'
+        assert burst_size_bytes > 0 and row_size_bytes % burst_size_bytes == 0, \
+            'The row size should be a multiple of the burst size'
+        assert min(t_rcd, t_rp, t_cl) >= 0 and t_burst > 0, 'Invalid DRAM timings'
+        assert page_policy in valid_page_policies, 'Invalid page policy: ' + str(page_policy)
+        assert queue_depth >= 0, 'Invalid queue depth'
+
+        self.num_channels = num_channels
+        self.num_banks = num_banks
+        self.row_size_bytes = row_size_bytes
+        self.burst_size_bytes = burst_size_bytes
+        self.word_size_bytes = word_size_bytes
+
+        self.t_rcd = t_rcd
+        self.t_rp = t_rp
+        self.t_cl = t_cl
+        self.t_burst = t_burst
+
+        self.page_policy = page_policy
+        self.queue_depth = queue_depth
+
+        self.params_set_flag = True
+
+    #
+    def get_dram_latencies(self, ifmap_trace_np, filter_trace_np, ofmap_trace_np):
+        """
+        Method to get the latency of each line of the ifmap, filter and ofmap DRAM traces, with the
+        cycles in the first column. The latency of a line is the one of its slowest request, and
+        lines without requests have no latency.
+        """
+        assert self.params_set_flag, 'Parameters are not set'
+
+        traces = [np.asarray(ifmap_trace_np), np.asarray(filter_trace_np),
+                  np.asarray(ofmap_trace_np)]
+        num_lines = [trace.shape[0] for trace in traces]
+
+        # One request per burst of each line, the ofmap ones are writes
+        line_ids_list = []
+        burst_ids_list = []
+        is_write_list = []
+        line_offset = 0
+        for trace_id, trace in enumerate(traces):
+            addr_np = trace[:, 1:].astype(np.int64)
+            bursts = np.where(addr_np != -1,
+                              addr_np * self.word_size_bytes // self.burst_size_bytes, -1)
+            bursts.sort(axis=1)
+            new_burst = bursts != -1
+            new_burst[:, 1:] &= bursts[:, 1:] != bursts[:, :-1]
+
+            row_ids, _ = np.nonzero(new_burst)
+            line_ids_list.append(row_ids + line_offset)
+            burst_ids_list.append(bursts[new_burst])
+            is_write_list.append(np.full(row_ids.shape[0], trace_id == 2))
+            line_offset += trace.shape[0]
+
+        line_cycles = np.concatenate([trace[:, 0] for trace in traces]).astype(np.int64)
+        line_ids = np.concatenate(line_ids_list)
+        burst_ids = np.concatenate(burst_ids_list)
+        is_write = np.concatenate(is_write_list)
+
+        request_latencies = self.get_request_latencies(line_cycles[line_ids], burst_ids, is_write)
+
+        # The requests are sorted by line
+        line_latencies = np.zeros(line_cycles.shape[0], dtype=np.int64)
+        if line_ids.shape[0] > 0:
+            line_starts = np.flatnonzero(np.diff(line_ids, prepend=-1))
+            line_latencies[line_ids[line_starts]] = \
+                np.maximum.reduceat(request_latencies, line_starts)
+
+        split_ids = np.cumsum(num_lines)[:-1]
+        ifmap_latencies, filter_latencies, ofmap_latencies = np.split(line_latencies, split_ids)
+
+        return ifmap_latencies, filter_latencies, ofmap_latencies
+
+    #
+    def get_request_latencies(self, arrive_cycles_np, burst_ids_np, is_write_np=None):
+        """
+        Method to get the latency of each burst request, from the cycle it enters the controller to
+        its data. The request one queue depth ahead in the same queue is always in an earlier
+        block of queue depth requests, so the requests are admitted one block at a time. When the
+        queues never fill, all the requests are served as a single block, with array operations.
+        """
+        num_requests = arrive_cycles_np.shape[0]
+        if num_requests == 0:
+            return np.zeros(0, dtype=np.int64)
+        if is_write_np is None:
+            is_write_np = np.zeros(num_requests, dtype=bool)
+
+        # 1. Map the bursts to the DRAM
+        bursts_per_row = self.row_size_bytes // self.burst_size_bytes
+        channel = burst_ids_np % self.num_channels
+        rest = burst_ids_np // self.num_channels // bursts_per_row
+        bank = channel * self.num_banks + rest % self.num_banks
+        row = rest // self.num_banks
+
+        # 2. Admit the requests in arrival order
+        order = np.argsort(arrive_cycles_np, kind='stable')
+        arrive = np.asarray(arrive_cycles_np, dtype=np.int64)[order]
+        channel = channel[order]
+        bank = bank[order]
+        row = row[order]
+        slot_ids = self.get_slot_ids(np.asarray(is_write_np, dtype=bool)[order])
+
+        # 3. Serve them as they arrive, unless a request would find its queue full
+        enter_cycles = arrive
+        data_cycles = self.serve_block(arrive, bank, row, channel)
+        has_slot = slot_ids >= 0
+        if np.any(data_cycles[slot_ids[has_slot]] > arrive[has_slot]):
+            enter_cycles, data_cycles = self.serve_queued(arrive, bank, row, channel, slot_ids)
+
+        latencies = np.empty(num_requests, dtype=np.int64)
+        latencies[order] = data_cycles - enter_cycles
+        return latencies
+
+    #
+    def get_slot_ids(self, is_write_np):
+        """
+        Method to get, for each request in arrival order, the index of the request of the same
+        queue one queue depth ahead, or -1 when the queue has room for it anyway.
+        """
+        slot_ids = np.full(is_write_np.shape[0], -1, dtype=np.int64)
+        if self.queue_depth < 1:
+            return slot_ids
+        for queue_mask in [~is_write_np, is_write_np]:
+            queue_ids = np.flatnonzero(queue_mask)
+            slot_ids[queue_ids[self.queue_depth:]] = queue_ids[:-self.queue_depth]
+        return slot_ids
+
+    #
+    def serve_block(self, enter_cycles_np, bank_np, row_np, channel_np):
+        """
+        Method to get the data cycles of requests, sorted by the cycle they enter, served together
+        by the idle DRAM.
+        """
+        num_requests = enter_cycles_np.shape[0]
+
+        # 1. Serve the requests of each bank in order
+        bank_order = np.argsort(bank_np, kind='stable')
+        sorted_bank = bank_np[bank_order]
+        sorted_row = row_np[bank_order]
+
+        if self.page_policy == 'open':
+            first_access = np.diff(sorted_bank, prepend=-1) != 0
+            row_hit = np.logical_and(~first_access,
+                                     np.diff(sorted_row, prepend=-1) == 0)
+            row_conflict = np.logical_and(~first_access, ~row_hit)
+            service = np.full(num_requests, self.t_burst, dtype=np.int64)
+            service[~row_hit] += self.t_rcd
+            service[row_conflict] += self.t_rp
+            precharge = 0
+        else:
+            # The row is opened for each request and closed right after
+            service = np.full(num_requests, self.t_rcd + self.t_burst + self.t_rp,
+                              dtype=np.int64)
+            precharge = self.t_rp
+
+        bank_finish = serve_in_order(enter_cycles_np[bank_order], service,
+                                     get_group_ids(sorted_bank))
+
+        # 2. Send the bursts of each channel on its data bus, in the order they are ready
+        burst_ready = np.empty(num_requests, dtype=np.int64)
+        burst_ready[bank_order] = bank_finish - precharge - self.t_burst
+
+        bus_order = np.lexsort((burst_ready, channel_np))
+        bus_finish = serve_in_order(burst_ready[bus_order],
+                                    np.full(num_requests, self.t_burst, dtype=np.int64),
+                                    get_group_ids(channel_np[bus_order]))
+
+        data_cycles = np.empty(num_requests, dtype=np.int64)
+        data_cycles[bus_order] = bus_finish + self.t_cl
+        return data_cycles
+
+    #
+    def serve_queued(self, arrive_cycles_np, bank_np, row_np, channel_np, slot_ids_np):
+        """
+        Method to get the enter and data cycles of requests, sorted by arrival, admitted one block
+        of queue depth requests at a time. A request enters once it arrives, the previous request
+        entered and its slot is free. Within a block, the banks serve their requests in order and
+        the data buses their bursts in the order they are ready, like serve_block() does, after the
+        requests of the previous blocks. The blocks are small, so the requests are served one at a
+        time rather than with array operations.
+        """
+        num_requests = arrive_cycles_np.shape[0]
+        arrive = arrive_cycles_np.tolist()
+        bank = bank_np.tolist()
+        row = row_np.tolist()
+        channel = channel_np.tolist()
+        slot_ids = slot_ids_np.tolist()
+
+        num_all_banks = self.num_channels * self.num_banks
+        bank_free = [no_cycle] * num_all_banks
+        open_row = [-1] * num_all_banks
+        bus_free = [no_cycle] * self.num_channels
+
+        open_page = self.page_policy == 'open'
+        t_rcd, t_rp, t_cl, t_burst = self.t_rcd, self.t_rp, self.t_cl, self.t_burst
+
+        enter_cycles = [0] * num_requests
+        data_cycles = [0] * num_requests
+        last_enter = no_cycle
+        for start in range(0, num_requests, self.queue_depth):
+            bursts = []
+            for idx in range(start, min(start + self.queue_depth, num_requests)):
+                # 1. Enter the controller
+                enter = max(arrive[idx], last_enter)
+                if slot_ids[idx] >= 0:
+                    enter = max(enter, data_cycles[slot_ids[idx]])
+                enter_cycles[idx] = enter
+                last_enter = enter
+
+                # 2. Access the bank
+                this_bank = bank[idx]
+                finish = max(enter, bank_free[this_bank])
+                if not open_page:
+                    finish += t_rcd + t_burst + t_rp
+                    ready = finish - t_rp - t_burst
+                else:
+                    if open_row[this_bank] == -1:
+                        finish += t_rcd + t_burst
+                    elif open_row[this_bank] != row[idx]:
+                        finish += t_rp + t_rcd + t_burst
+                    else:
+                        finish += t_burst
+                    open_row[this_bank] = row[idx]
+                    ready = finish - t_burst
+                bank_free[this_bank] = finish
+                bursts.append((channel[idx], ready, idx))
+
+            # 3. Send the bursts of the block on the data buses
+            bursts.sort()
+            for this_channel, ready, idx in bursts:
+                bus_free[this_channel] = max(ready, bus_free[this_channel]) + t_burst
+                data_cycles[idx] = bus_free[this_channel] + t_cl
+
+        return np.asarray(enter_cycles, dtype=np.int64), np.asarray(data_cycles, dtype=np.int64)
@@ -0,0 +1,78 @@
+"""
+This file contains the 'dram_request_queue' class, the queue of outstanding DRAM requests used by
+the read and write ports when the Ramulator latencies are used.
+"""
+
+import heapq
+
+import numpy as np
+
+from scalesim.utilities.trace_io import cycle_dtype
+
+
+class dram_request_queue:
+    """
+    Class which holds the completion cycles of the outstanding DRAM requests in a min heap. When
+    the queue is full, a new request either waits for the earliest outstanding request to complete
+    or retires all the requests which completed before it was issued. Each request is pushed and
+    popped once, so servicing N requests costs O(N log Q) instead of sorting the queue every time.
+    """
+    #
+    def __init__(self, queue_size=100):
+        """
+        __init__ method.
+        """
+        self.queue_size = queue_size
+        self.request_heap = []
+
+    #
+    def set_queue_size(self, queue_size):
+        """
+        Method to set the number of outstanding requests which fill the queue.
+        """
+        self.queue_size = queue_size
+
+    #
+    def get_num_outstanding(self):
+        """
+        Method to get the number of requests in the queue.
+        """
+        return len(self.request_heap)
+
+    #
+    def service_requests(self, incoming_cycles_np, latencies_np):
+        """
+        Method to get the completion cycles of a batch of requests, issued at the incoming cycles
+        and taking the given DRAM latencies. The stalls caused by a full queue delay the remaining
+        requests of the batch. The outstanding requests are kept for the following batches.
+        """
+        incoming_cycles = np.asarray(incoming_cycles_np).reshape(-1).tolist()
+        latencies = np.asarray(latencies_np).reshape(-1).tolist()
+        assert len(incoming_cycles) == len(latencies), 'Each request needs a latency'
+
+        # The queue never fills, there are no stalls
+        if self.queue_size < 1:
+            return np.asarray([int(cycle + latency)
+                               for cycle, latency in zip(incoming_cycles, latencies)],
+                              dtype=cycle_dtype)
+
+        request_heap = self.request_heap
+        queue_size = self.queue_size
+        stall_cycles = 0
+        out_cycles = []
+        for cycle, latency in zip(incoming_cycles, latencies):
+            out_cycle = int(cycle + stall_cycles + latency)
+            out_cycles.append(out_cycle)
+            heapq.heappush(request_heap, out_cycle)
+
+            if len(request_heap) == queue_size:
+                issue_cycle = cycle + stall_cycles
+                if request_heap[0] >= issue_cycle:
+                    # Wait for the earliest request to make room
+                    stall_cycles += request_heap[0] - issue_cycle
+                    heapq.heappop(request_heap)
+                else:
+                    while request_heap and request_heap[0] < issue_cycle:
+                        heapq.heappop(request_heap)
+
+        return np.asarray(out_cycles, dtype=cycle_dtype)
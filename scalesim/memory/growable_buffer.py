@@ -0,0 +1,95 @@
+"""
+This file contains the 'growable_buffer' class, a row wise growable 2D array used to accumulate the
+traces generated during the memory simulation.
+"""
+
+import numpy as np
+
+
+class growable_buffer:
+    """
+    Class which holds a 2D array that grows by appending rows. The storage doubles its capacity
+    whenever it runs out of space, so appending N rows costs amortized O(N) instead of the O(N^2)
+    of growing an array with repeated concatenation.
+    """
+    #
+    def __init__(self, num_cols=1, dtype=None, init_rows=1024):
+        """
+        __init__ method. When dtype is not given, it is taken from the first appended rows.
+        """
+        assert num_cols > 0, 'Number of columns should be positive'
+        assert init_rows > 0, 'Initial capacity should be positive'
+
+        self.num_cols = num_cols
+        self.dtype = dtype
+        self.init_rows = init_rows
+
+        storage_dtype = np.float64 if dtype is None else dtype
+        self.storage = np.zeros((0, num_cols), dtype=storage_dtype)
+        self.num_rows = 0
+
+    #
+    def append(self, rows_np):
+        """
+        Method to append rows at the end of the buffer. A 1D input is treated as a column when the
+        buffer has a single column and as a single row otherwise. Like np.concatenate, the contents
+        are upcast if the new rows need a wider dtype.
+        """
+        rows_np = np.asarray(rows_np)
+        if rows_np.ndim == 1:
+            if self.num_cols == 1:
+                rows_np = rows_np.reshape((-1, 1))
+            else:
+                rows_np = rows_np.reshape((1, -1))
+
+        assert rows_np.shape[1] == self.num_cols, 'Number of columns do not match'
+
+        if self.dtype is None:
+            self.dtype = rows_np.dtype
+            self.storage = self.storage.astype(self.dtype)
+        elif not np.can_cast(rows_np.dtype, self.dtype, casting='safe'):
+            self.dtype = np.result_type(self.dtype, rows_np.dtype)
+            self.storage = self.storage.astype(self.dtype)
+
+        new_num_rows = self.num_rows + rows_np.shape[0]
+        if new_num_rows > self.storage.shape[0]:
+            capacity = max(self.storage.shape[0], self.init_rows)
+            while capacity < new_num_rows:
+                capacity *= 2
+
+            new_storage = np.zeros((capacity, self.num_cols), dtype=self.dtype)
+            new_storage[:self.num_rows] = self.storage[:self.num_rows]
+            self.storage = new_storage
+
+        self.storage[self.num_rows:new_num_rows] = rows_np
+        self.num_rows = new_num_rows
+
+    #
+    def get_matrix(self):
+        """
+        Method to get the rows appended so far. The returned array is a view into the buffer and
+        is valid until the next append.
+        """
+        return self.storage[:self.num_rows]
+
+    #
+    def get_num_rows(self):
+        """
+        Method to get the number of rows appended so far.
+        """
+        return self.num_rows
+
+    #
+    def is_empty(self):
+        """
+        Method to check if no rows have been appended yet.
+        """
+        return self.num_rows == 0
+
+    #
+    def reset(self):
+        """
+        Method to drop all the rows, keeping the number of columns and the dtype.
+        """
+        self.storage = np.zeros((0, self.num_cols), dtype=self.storage.dtype)
+        self.num_rows = 0
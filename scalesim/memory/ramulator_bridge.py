@@ -0,0 +1,249 @@
+"""
+This file contains the 'ramulator_bridge' class, which simulates the DRAM requests of a layer with
+Ramulator in the same run. The requests are streamed to a Ramulator subprocess over a pipe and the
+latencies are read back from its output, instead of going through trace and latency files.
+"""
+
+import os
+import subprocess
+import threading
+
+import numpy as np
+
+
+#
+def get_ramulator_trace_bytes(addr_np, is_write_np):
+    """
+    Method to format requests as lines of a Ramulator dram mode trace, '0x<hex address> R' for the
+    reads and '0x<hex address> W' for the writes. The lines are assembled as a matrix of characters
+    with the hex digits of each address, from which the leading zeros are masked out, so no Python
+    string is built per request.
+    """
+    addr_np = np.asarray(addr_np, dtype=np.uint64).reshape(-1)
+    num_requests = addr_np.shape[0]
+    if num_requests == 0:
+        return b''
+    num_digits = max(1, (int(addr_np.max()).bit_length() + 3) // 4)
+
+    shifts = np.arange(4 * (num_digits - 1), -1, -4, dtype=np.uint64)
+    # Smallest address with each number of digits, 0x10, 0x100, ...
+    digit_limits = np.uint64(1) << (np.uint64(4) * np.arange(1, num_digits, dtype=np.uint64))
+    digits = ((addr_np[:, None] >> shifts) & np.uint64(0xF)).astype(np.uint8)
+
+    hex_chars = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+    chars = np.empty((num_requests, num_digits + 5), dtype=np.uint8)
+    chars[:, 0] = ord('0')
+    chars[:, 1] = ord('x')
+    chars[:, 2:num_digits + 2] = hex_chars[digits]
+    chars[:, num_digits + 2] = ord(' ')
+    chars[:, num_digits + 3] = np.where(np.asarray(is_write_np).reshape(-1),
+                                        ord('W'), ord('R'))
+    chars[:, num_digits + 4] = ord('\n')
+
+    # Keep the significant digits, and a single 0 for the address 0
+    num_leading_zeros = num_digits - 1 - np.searchsorted(digit_limits, addr_np, side='right')
+    keep = np.ones(chars.shape, dtype=bool)
+    keep[:, 2:num_digits + 2] = np.arange(num_digits) >= num_leading_zeros[:, None]
+
+    return chars[keep].tobytes()
+
+
+class ramulator_bridge:
+    """
+    Class which runs the patched Ramulator (see scripts/ramulator_patch) in dram mode on the DRAM
+    traces of a layer and returns the latency of every line of the traces. The lines are sent in
+    the order of their cycles, like scripts/dram_sim.py does, and each reported request is matched
+    back to the line it belongs to.
+    """
+    #
+    def __init__(self):
+        """
+        __init__ method.
+        """
+        self.ramulator_path = ''
+        self.ramulator_config = ''
+        self.stats_filename = os.devnull
+
+        # Requests written to the pipe at a time
+        self.chunk_requests = 1 << 16
+
+        # Latency of the requests Ramulator does not report, the reads served from the queues
+        self.default_latency = 1
+
+        self.params_set_flag = False
+
+    #
+    def set_params(self, ramulator_path, ramulator_config, stats_filename=''):
+        """
+        Method to set the Ramulator binary, its DRAM config file and the file the Ramulator stats
+        are written to.
+        """
+        assert os.path.isfile(ramulator_path), \
+            'ERROR: Ramulator binary not found: ' + ramulator_path
+        assert os.path.isfile(ramulator_config), \
+            'ERROR: Ramulator config not found: ' + ramulator_config
+
+        self.ramulator_path = ramulator_path
+        self.ramulator_config = ramulator_config
+        if not stats_filename == '':
+            self.stats_filename = stats_filename
+
+        self.params_set_flag = True
+
+    #
+    def get_dram_latencies(self, ifmap_trace_np, filter_trace_np, ofmap_trace_np):
+        """
+        Method to get the latency of each line of the ifmap, filter and ofmap DRAM traces, with the
+        cycles in the first column. The latency of a line is the one of its slowest request, and
+        lines without requests have no latency.
+        """
+        assert self.params_set_flag, 'Parameters are not set'
+
+        traces = [np.asarray(ifmap_trace_np), np.asarray(filter_trace_np),
+                  np.asarray(ofmap_trace_np)]
+        num_lines = [trace.shape[0] for trace in traces]
+
+        # Merge the lines of the traces by cycle, ifmap then filter then ofmap within a cycle
+        cycles = np.concatenate([trace[:, 0] for trace in traces])
+        trace_ids = np.repeat(np.arange(3), num_lines)
+        line_order = np.lexsort((trace_ids, cycles))
+
+        # The requests of each line are sent in the order of the addresses in the line
+        addr_list = []
+        is_write_list = []
+        line_ids_list = []
+        line_offset = 0
+        for trace_id, trace in enumerate(traces):
+            addr_np = trace[:, 1:]
+            valid = addr_np != -1
+            row_ids, _ = np.nonzero(valid)
+            addr_list.append(addr_np[valid])
+            is_write_list.append(np.full(row_ids.shape[0], trace_id == 2))
+            line_ids_list.append(row_ids + line_offset)
+            line_offset += trace.shape[0]
+
+        addr = np.concatenate(addr_list).astype(np.int64)
+        is_write = np.concatenate(is_write_list)
+        line_ids = np.concatenate(line_ids_list)
+
+        line_rank = np.empty(line_order.shape[0], dtype=np.int64)
+        line_rank[line_order] = np.arange(line_order.shape[0])
+        request_order = np.argsort(line_rank[line_ids], kind='stable')
+
+        request_latencies = np.zeros(addr.shape[0], dtype=np.int64)
+        request_latencies[request_order] = self.simulate_requests(addr[request_order],
+                                                                  is_write[request_order])
+
+        line_latencies = np.zeros(line_order.shape[0], dtype=np.int64)
+        np.maximum.at(line_latencies, line_ids, request_latencies)
+
+        split_ids = np.cumsum(num_lines)[:-1]
+        ifmap_latencies, filter_latencies, ofmap_latencies = np.split(line_latencies, split_ids)
+
+        return ifmap_latencies, filter_latencies, ofmap_latencies
+
+    #
+    def simulate_requests(self, addr_np, is_write_np):
+        """
+        Method to get the latency of each request, in the order they are sent to Ramulator. The
+        requests are written to the pipe from a separate thread while the reported latencies are
+        read back, so neither side blocks on a full pipe. Raises a RuntimeError when Ramulator
+        fails or reports no responses, instead of running the layer with default latencies.
+        """
+        num_requests = addr_np.shape[0]
+        if num_requests == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        cmd = [self.ramulator_path, self.ramulator_config, '--mode=dram',
+               '--stats', self.stats_filename, '/dev/stdin']
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+
+        # stderr is drained in the background, so Ramulator never blocks on it
+        stderr_chunks = []
+        stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()))
+        stderr_reader.start()
+
+        writer = threading.Thread(target=self.write_requests,
+                                  args=(process.stdin, addr_np, is_write_np))
+        writer.start()
+
+        resp_addr = []
+        resp_is_write = []
+        resp_arrive = []
+        resp_latency = []
+        for line in process.stdout:
+            if not (line.startswith(b'RD:') or line.startswith(b'WR:')):
+                continue
+            fields = line.split()
+            arrive = int(fields[2])
+            resp_addr.append(int(fields[1], 16))
+            resp_is_write.append(line.startswith(b'WR:'))
+            resp_arrive.append(arrive)
+            resp_latency.append(int(fields[3]) - arrive)
+
+        writer.join()
+        stderr_reader.join()
+        return_code = process.wait()
+        stderr_text = b''.join(stderr_chunks).decode('utf-8', errors='replace').strip()
+        if not return_code == 0:
+            raise RuntimeError('Ramulator exited with code ' + str(return_code)
+                               + ': ' + ' '.join(cmd) + '\n' + stderr_text)
+        if len(resp_addr) == 0:
+            raise RuntimeError('Ramulator reported no RD/WR responses for '
+                               + str(num_requests) + ' requests, check that it is the patched '
+                               + 'build (scripts/ramulator_patch): ' + ' '.join(cmd)
+                               + '\n' + stderr_text)
+
+        return self.match_responses(addr_np, is_write_np,
+                                    np.asarray(resp_addr, dtype=np.int64),
+                                    np.asarray(resp_is_write, dtype=bool),
+                                    np.asarray(resp_arrive, dtype=np.int64),
+                                    np.asarray(resp_latency, dtype=np.int64))
+
+    #
+    def write_requests(self, pipe, addr_np, is_write_np):
+        """
+        Method to write the requests to the Ramulator trace pipe, one '<hex address> <R/W>' line
+        per request.
+        """
+        try:
+            for start in range(0, addr_np.shape[0], self.chunk_requests):
+                end = start + self.chunk_requests
+                pipe.write(get_ramulator_trace_bytes(addr_np[start:end], is_write_np[start:end]))
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+    #
+    def match_responses(self, addr_np, is_write_np, resp_addr_np, resp_is_write_np,
+                        resp_arrive_np, resp_latency_np):
+        """
+        Method to map the reported latencies back to the sent requests. The responses come in the
+        order they complete, so the n-th response to an address, by arrival, is matched to the n-th
+        request sent to that address. The requests without a response get the default latency.
+        """
+        sent_keys = 2 * addr_np + is_write_np
+        sent_order = np.argsort(sent_keys, kind='stable')
+        sorted_sent_keys = sent_keys[sent_order]
+
+        resp_keys = 2 * resp_addr_np + resp_is_write_np
+        resp_order = np.lexsort((resp_arrive_np, resp_keys))
+        sorted_resp_keys = resp_keys[resp_order]
+
+        # Rank of each response among the responses to the same address
+        group_starts = np.searchsorted(sorted_resp_keys, sorted_resp_keys, side='left')
+        resp_rank = np.arange(sorted_resp_keys.shape[0]) - group_starts
+
+        sent_pos = np.searchsorted(sorted_sent_keys, sorted_resp_keys, side='left') + resp_rank
+        in_range = sent_pos < sorted_sent_keys.shape[0]
+        matched = np.zeros(sent_pos.shape[0], dtype=bool)
+        matched[in_range] = sorted_sent_keys[sent_pos[in_range]] == sorted_resp_keys[in_range]
+        if not np.all(matched):
+            print('WARNING: ramulator_bridge: ' + str(np.count_nonzero(~matched))
+                  + ' responses do not match any request')
+
+        latencies = np.full(addr_np.shape[0], self.default_latency, dtype=np.int64)
+        latencies[sent_order[sent_pos[matched]]] = resp_latency_np[resp_order][matched]
+
+        return latencies
@@ -3,10 +3,13 @@ Double buffer read memory implementation
 """
 # TODO: Verification Pending
 import math
+from bisect import bisect_left
 import numpy as np
 from tqdm import tqdm
 
 from scalesim.memory.read_port import read_port
+from scalesim.utilities.trace_io import save_trace, get_min_int_dtype, cycle_dtype, \
+    dram_trace_csv_fmt
 
 
 class read_buffer:
@@ -37,6 +40,12 @@ class read_buffer:
 
         # Status of the buffer
         self.hashed_buffer = {}
+        self.addr_line_index = {}       # addr -> sorted list of the hashed buffer lines holding it
+        self.line_col_index = {}        # line -> {addr: column}, used in layout evaluation
+        self.valid_fetch_elems = np.zeros(0)
+        self.elems_per_set = 1
+        self.active_buffer_contents = np.zeros(0)
+        self.active_buffer_contents_limits = []
         self.num_lines = 0
         self.num_active_buf_lines = 1
         self.num_prefetch_buf_lines = 1
@@ -49,6 +58,10 @@ class read_buffer:
         self.next_line_prefetch_idx = 0
         self.next_col_prefetch_idx = 0
 
+        # Number of rows checked at once for hits when servicing a batch of requests
+        self.min_hit_scan_rows = 64
+        self.max_hit_scan_rows = 8192
+
         # Access counts
         self.num_access = 0
 
@@ -120,6 +133,12 @@ class read_buffer:
 
         # Status of the buffer
         self.hashed_buffer = {}
+        self.addr_line_index = {}
+        self.line_col_index = {}
+        self.valid_fetch_elems = np.zeros(0)
+        self.elems_per_set = 1
+        self.active_buffer_contents = np.zeros(0)
+        self.active_buffer_contents_limits = []
         self.active_buffer_set_limits = []
         self.prefetch_buffer_set_limits = []
 
@@ -151,19 +170,13 @@ class read_buffer:
 
         num_elems = fetch_matrix_np.shape[0] * fetch_matrix_np.shape[1]
         num_lines = int(math.ceil(num_elems / self.req_gen_bandwidth))
-        self.fetch_matrix = np.ones((num_lines, self.req_gen_bandwidth)) * -1
-
-        # Put stuff into the fetch matrix
-        # This is done to ensure that there is no shape mismatch
-        # Not sure if this is the optimal way to do it or not
-        for i in range(num_elems):
-            src_row = math.floor(i / fetch_matrix_np.shape[1])
-            src_col = math.floor(i % fetch_matrix_np.shape[1])
-
-            dest_row = math.floor(i / self.req_gen_bandwidth)
-            dest_col = math.floor(i % self.req_gen_bandwidth)
 
-            self.fetch_matrix[dest_row][dest_col] = fetch_matrix_np[src_row][src_col]
+        # Lay the operand matrix out row major into lines of req_gen_bandwidth elements,
+        # padding the tail of the last line with -1 (null requests)
+        fetch_elems = np.full(num_lines * self.req_gen_bandwidth, -1,
+                              dtype=get_min_int_dtype(fetch_matrix_np))
+        fetch_elems[:num_elems] = fetch_matrix_np.reshape(-1)
+        self.fetch_matrix = fetch_elems.reshape((num_lines, self.req_gen_bandwidth))
 
         # Once the fetch matrices are set, populate the data structure for faster lookups and
         # servicing
@@ -179,32 +192,28 @@ class read_buffer:
         if self.enable_layout_evaluation:
             elems_per_set = self.req_gen_bandwidth
         
-        prefetch_rows = self.fetch_matrix.shape[0]
-        prefetch_cols = self.fetch_matrix.shape[1]
-
-        line_id = 0
-        elem_ctr = 0
-        current_line = set()
-
-        for r in range(prefetch_rows):
-            for c in range(prefetch_cols):
-                elem = self.fetch_matrix[r][c]
-
-                if not elem == -1:
-                    current_line.add(elem)
-                    elem_ctr += 1
-
-                if not elem_ctr < elems_per_set:    # ie > or =
-                    self.hashed_buffer[line_id] = current_line
-                    line_id += 1
-                    elem_ctr = 0
-                    current_line = set()        # new set
-
-        self.hashed_buffer[line_id] = current_line
+        # Every line of the hashed buffer holds the next elems_per_set valid elements of the fetch
+        # matrix. When the valid elements divide evenly into lines, the last line is empty.
+        fetch_elems = self.fetch_matrix.reshape(-1)
+        valid_elems = fetch_elems[fetch_elems != -1]
+        num_lines = valid_elems.shape[0] // elems_per_set + 1
+
+        for line_id in range(num_lines):
+            start_idx = line_id * elems_per_set
+            end_idx = start_idx + elems_per_set
+            self.hashed_buffer[line_id] = set(valid_elems[start_idx:end_idx].tolist())
+
+            # The column of an address is its position in the line
+            if self.enable_layout_evaluation:
+                self.line_col_index[line_id] = \
+                    {addr: col for col, addr in enumerate(self.hashed_buffer[line_id])}
+
+        self.prepare_addr_line_index(valid_elems, elems_per_set)
+        self.valid_fetch_elems = valid_elems
+        self.elems_per_set = elems_per_set
 
         max_num_active_buf_lines = int(math.ceil(self.active_buf_size / elems_per_set))
         max_num_prefetch_buf_lines = int(math.ceil(self.prefetch_buf_size / elems_per_set))
-        num_lines = line_id + 1
 
         if num_lines > max_num_active_buf_lines:
             self.num_active_buf_lines = max_num_active_buf_lines
@@ -221,6 +230,36 @@ class read_buffer:
         self.num_lines = num_lines
         self.hashed_buffer_valid = True
 
+    #
+    def prepare_addr_line_index(self, valid_elems, elems_per_set):
+        """
+        Method to build the index from every address in the fetch matrix to the sorted list of
+        hashed buffer lines which contain it.
+        """
+        self.addr_line_index = {}
+        if valid_elems.shape[0] == 0:
+            return
+
+        line_ids = np.arange(valid_elems.shape[0]) // elems_per_set
+
+        # Sort by address, the stable sort keeps the lines of every address in ascending order
+        order = np.argsort(valid_elems, kind='stable')
+        sorted_elems = valid_elems[order]
+        sorted_line_ids = line_ids[order]
+
+        # Drop the repeats of an address within the same line
+        keep = np.ones(sorted_elems.shape[0], dtype=bool)
+        keep[1:] = (sorted_elems[1:] != sorted_elems[:-1]) | \
+                   (sorted_line_ids[1:] != sorted_line_ids[:-1])
+        sorted_elems = sorted_elems[keep]
+        sorted_line_ids = sorted_line_ids[keep]
+
+        group_starts = np.flatnonzero(sorted_elems[1:] != sorted_elems[:-1]) + 1
+        addrs = sorted_elems[np.concatenate(([0], group_starts))].tolist()
+        line_groups = np.split(sorted_line_ids, group_starts)
+
+        self.addr_line_index = dict(zip(addrs, [group.tolist() for group in line_groups]))
+
     #
     def active_buffer_hit(self, addr):
         """
@@ -229,46 +268,80 @@ class read_buffer:
         assert self.active_buf_full_flag, 'Active buffer is not ready yet'
 
         start_id, end_id = self.active_buffer_set_limits
+
+        # The lines are looked up in the order the active buffer is scanned: from start_id to
+        # end_id, wrapping around the end of the buffer when start_id is not less than end_id
+        hit_line_id = -1
+        line_ids = self.addr_line_index.get(addr)
+        if line_ids is not None:
+            idx = bisect_left(line_ids, start_id)
+            if start_id < end_id:
+                if idx < len(line_ids) and line_ids[idx] < end_id:
+                    hit_line_id = line_ids[idx]
+            elif idx < len(line_ids):
+                hit_line_id = line_ids[idx]
+            elif line_ids[0] < end_id:
+                hit_line_id = line_ids[0]
+
         if self.enable_layout_evaluation:
-          if start_id < end_id:
-              for line_id in range(start_id, end_id):
-                  this_set = self.hashed_buffer[line_id]      # O(1) --> accessing hash
-                  if addr in this_set:                        # Checking in a set(), O(1) lookup
-                      return line_id, list(this_set).index(addr)
-
-          else:
-              for line_id in range(start_id, self.num_lines):
-                  this_set = self.hashed_buffer[line_id]  # O(1) --> accessing hash
-                  if addr in this_set:  # Checking in a set(), O(1) lookup
-                      return line_id, list(this_set).index(addr)
-
-              for line_id in range(end_id):
-                  this_set = self.hashed_buffer[line_id]  # O(1) --> accessing hash
-                  if addr in this_set:  # Checking in a set(), O(1) lookup
-                      return line_id, list(this_set).index(addr)
-          # Fixing for ISSUE #14
-          # return True
-          return -1, -1
+            # Fixing for ISSUE #14
+            # return True
+            if hit_line_id == -1:
+                return -1, -1
+            return hit_line_id, self.line_col_index[hit_line_id][addr]
+
+        return not hit_line_id == -1
+
+    #
+    def get_active_buffer_contents(self):
+        """
+        Method to get the sorted unique addresses held in the active buffer. The contents are
+        recomputed only when the active buffer limits move, ie. after a new prefetch.
+        """
+        assert self.active_buf_full_flag, 'Active buffer is not ready yet'
+
+        start_id, end_id = self.active_buffer_set_limits
+        if not self.active_buffer_contents_limits == [start_id, end_id]:
+            start_idx = start_id * self.elems_per_set
+            end_idx = end_id * self.elems_per_set
+            if start_id < end_id:
+                contents = self.valid_fetch_elems[start_idx:end_idx]
+            else:
+                contents = np.concatenate((self.valid_fetch_elems[start_idx:],
+                                           self.valid_fetch_elems[:end_idx]))
+
+            self.active_buffer_contents = np.unique(contents)
+            self.active_buffer_contents_limits = [start_id, end_id]
+
+        return self.active_buffer_contents
+
+    #
+    def get_num_hit_rows(self, incoming_requests_arr_np):
+        """
+        Method to get the number of leading rows of the requests which hit entirely in the active
+        buffer. These rows can be serviced with the hit latency without any new prefetch. Always
+        returns 0 in layout evaluation mode, where hits can still stall on bank conflicts.
+        """
+        if not self.active_buf_full_flag or self.enable_layout_evaluation:
+            return 0
+
+        num_rows = incoming_requests_arr_np.shape[0]
+        contents = self.get_active_buffer_contents()
+        valid_requests = incoming_requests_arr_np != -1
+        if contents.shape[0] == 0:
+            row_hits = np.logical_not(np.any(valid_requests, axis=1))
         else:
-          if start_id < end_id:
-              for line_id in range(start_id, end_id):
-                  this_set = self.hashed_buffer[line_id]      # O(1) --> accessing hash
-                  if addr in this_set:                        # Checking in a set(), O(1) lookup
-                      return True
-
-          else:
-              for line_id in range(start_id, self.num_lines):
-                  this_set = self.hashed_buffer[line_id]  # O(1) --> accessing hash
-                  if addr in this_set:  # Checking in a set(), O(1) lookup
-                      return True
-
-              for line_id in range(end_id):
-                  this_set = self.hashed_buffer[line_id]  # O(1) --> accessing hash
-                  if addr in this_set:  # Checking in a set(), O(1) lookup
-                      return True
-          # Fixing for ISSUE #14
-          # return True
-          return False
+            # Membership test against the sorted contents of the active buffer
+            idx = np.searchsorted(contents, incoming_requests_arr_np)
+            idx[idx == contents.shape[0]] = contents.shape[0] - 1
+            hits = np.logical_or(contents[idx] == incoming_requests_arr_np,
+                                 np.logical_not(valid_requests))
+            row_hits = np.all(hits, axis=1)
+
+        if np.all(row_hits):
+            return num_rows
+
+        return int(np.argmin(row_hits))
 
     #
     def service_reads(self,
@@ -299,7 +372,7 @@ class read_buffer:
               cycle = incoming_cycles_arr[i]
               # Fixing for ISSUE #14
               # request_line = set(incoming_requests_arr_np[i]) #shaves off a few seconds
-              request_line = incoming_requests_arr_np[i]
+              request_line = incoming_requests_arr_np[i].tolist()
 
               concurrent_line_addr = [[] for _ in range(self.num_bank)] # bank conflict modeling
               for addr in request_line:
@@ -343,11 +416,37 @@ class read_buffer:
           return out_cycles_arr_np
         
         else:
-          for i in tqdm(range(incoming_requests_arr_np.shape[0]), disable=True):
-              cycle = incoming_cycles_arr[i]
+          num_rows = incoming_requests_arr_np.shape[0]
+          out_cycles_chunks = []
+          scan_rows = self.min_hit_scan_rows
+
+          row_id = 0
+          while row_id < num_rows:
+              # Runs of rows which hit entirely in the active buffer do not need any prefetch
+              # and are serviced together with the current offset
+              end_id = min(row_id + scan_rows, num_rows)
+              num_hit_rows = self.get_num_hit_rows(incoming_requests_arr_np[row_id:end_id])
+              if num_hit_rows > 0:
+                  hit_end_id = row_id + num_hit_rows
+                  if self.use_ramulator_trace == True:
+                      out_cycles = incoming_cycles_arr[row_id:hit_end_id] + offset \
+                                   + dram_stall_cycles
+                  else:
+                      out_cycles = incoming_cycles_arr[row_id:hit_end_id] + offset
+                  out_cycles_chunks.append(out_cycles)
+
+                  if hit_end_id == end_id:
+                      scan_rows = min(2 * scan_rows, self.max_hit_scan_rows)
+                      row_id = hit_end_id
+                      continue
+                  row_id = hit_end_id
+
+              # This row needs at least one new prefetch
+              scan_rows = self.min_hit_scan_rows
+              cycle = incoming_cycles_arr[row_id]
               # Fixing for ISSUE #14
               # request_line = set(incoming_requests_arr_np[i]) #shaves off a few seconds
-              request_line = incoming_requests_arr_np[i]
+              request_line = incoming_requests_arr_np[row_id].tolist()
 
               for addr in request_line:
                   if addr == -1:
@@ -362,14 +461,15 @@ class read_buffer:
                       offset += potential_stall_cycles        # Offset increments if there were potential stalls
                       if potential_stall_cycles > 0:
                           offset += potential_stall_cycles
-                    
+
               if self.use_ramulator_trace == True:
                   out_cycles = cycle + offset + dram_stall_cycles
               else:
                   out_cycles = cycle + offset
-              out_cycles_arr.append(out_cycles)
+              out_cycles_chunks.append(np.reshape(out_cycles, (1, -1)))
+              row_id += 1
 
-          out_cycles_arr_np = np.asarray(out_cycles_arr).reshape((len(out_cycles_arr), 1))
+          out_cycles_arr_np = np.concatenate(out_cycles_chunks, axis=0).reshape((num_rows, 1))
 
           return out_cycles_arr_np
 
@@ -408,7 +508,7 @@ class read_buffer:
         # 2. Preparing the cycles array
         #    The start_cycle variable ensures that all the requests have been made before any
         #    incoming reads came
-        cycles_arr = np.zeros((num_lines, 1))
+        cycles_arr = np.zeros((num_lines, 1), dtype=cycle_dtype)
         for i in range(cycles_arr.shape[0]):
             cycles_arr[i][0] = \
                 -1 * (num_lines - start_cycle - (i - self.backing_buffer.get_latency()))
@@ -502,7 +602,7 @@ class read_buffer:
                 prefetch_requests[row][col] = -1
 
         # 3. Create the request cycles
-        cycles_arr = np.zeros((num_lines, 1))
+        cycles_arr = np.zeros((num_lines, 1), dtype=cycle_dtype)
         for i in range(cycles_arr.shape[0]):
             # Fixing ISSUE #14
             # cycles_arr[i][0] = self.last_prefetch_cycle + i
@@ -575,7 +675,7 @@ class read_buffer:
         return start_cycle, end_cycle
 
     #
-    def print_trace(self, filename):
+    def print_trace(self, filename, trace_format='csv'):
         """
         Method to write the read buffer trace matrix to a file.
         """
@@ -583,4 +683,5 @@ class read_buffer:
             print('No trace has been generated yet')
             return
 
-        np.savetxt(filename, self.trace_matrix, fmt='%s', delimiter=",")
\ No newline at end of file
+        save_trace(filename, self.trace_matrix, trace_format=trace_format,
+                   csv_fmt=dram_trace_csv_fmt)
\ No newline at end of file
@@ -7,6 +7,7 @@ import math
 import numpy as np
 
 from scalesim.memory.read_port import read_port
+from scalesim.utilities.trace_io import save_trace, cycle_dtype, dram_trace_csv_fmt
 
 
 class ReadBufferEstimateBw:
@@ -124,7 +125,7 @@ class ReadBufferEstimateBw:
         for i in range(incoming_requests_arr_np.shape[0]):
             cycle = int(incoming_cycles_arr[i][0])
 
-            requests_this_cycle = incoming_requests_arr_np[i]
+            requests_this_cycle = incoming_requests_arr_np[i].tolist()
             if not self.first_request_seen:
                 if max(requests_this_cycle) > -1:
                     self.first_request_rcvd_cycle = cycle
@@ -136,6 +137,14 @@ class ReadBufferEstimateBw:
 
         return outcycles
 
+    #
+    def get_num_hit_rows(self, incoming_requests_arr_np):
+        """
+        Method to get the number of leading rows of the requests which can be serviced with the hit
+        latency. In estimate bandwidth mode the operation is stall free, so that is all of them.
+        """
+        return incoming_requests_arr_np.shape[0]
+
     #
     def manage_prefetches(self, cycle, addr):
         """
@@ -287,7 +296,7 @@ class ReadBufferEstimateBw:
         prefetch_requests = np.asarray(all_addresses).reshape((cycles_needed,
                                                                self.prefetch_bandwidth))
 
-        cycles_arr = np.zeros((cycles_needed,1))
+        cycles_arr = np.zeros((cycles_needed,1), dtype=cycle_dtype)
         for i in range(cycles_arr.shape[0]):
             cycles_arr[i][0] = self.last_prefetch_start_cycle + i
 
@@ -305,12 +314,14 @@ class ReadBufferEstimateBw:
         else:
             del_cols = self.trace_matrix.shape[1] - this_prefetch_traces.shape[1]
             if del_cols > 0:
-                empty_cols = np.ones((this_prefetch_traces.shape[0], del_cols))
+                empty_cols = np.ones((this_prefetch_traces.shape[0], del_cols),
+                                     dtype=this_prefetch_traces.dtype)
                 this_prefetch_traces = np.concatenate((this_prefetch_traces, empty_cols), axis=1)
 
             elif del_cols < 0:
                 del_cols = int(-1 * del_cols)
-                empty_cols = np.ones((self.trace_matrix.shape[0], del_cols))
+                empty_cols = np.ones((self.trace_matrix.shape[0], del_cols),
+                                     dtype=self.trace_matrix.dtype)
                 self.trace_matrix = np.concatenate((self.trace_matrix, empty_cols), axis=1)
 
             self.trace_matrix = np.concatenate((self.trace_matrix, this_prefetch_traces), axis=0)
@@ -362,7 +373,7 @@ class ReadBufferEstimateBw:
         return start_cycle, end_cycle
 
     #
-    def print_trace(self, filename):
+    def print_trace(self, filename, trace_format='csv'):
         """
         Method to write the read estimate buffer trace matrix to a file.
         """
@@ -370,4 +381,5 @@ class ReadBufferEstimateBw:
             print('No trace has been generated yet')
             return
 
-        np.savetxt(filename, self.trace_matrix, fmt='%s', delimiter=",")
+        save_trace(filename, self.trace_matrix, trace_format=trace_format,
+                   csv_fmt=dram_trace_csv_fmt)
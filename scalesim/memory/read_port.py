@@ -3,7 +3,7 @@ External DRAM read requests serviced by Ramulator
 """
 import numpy as np
 from scalesim.scale_config import scale_config as config
-from bisect import bisect_left
+from scalesim.memory.dram_request_queue import dram_request_queue
 
 class read_port:
     """
@@ -21,23 +21,29 @@ class read_port:
         self.request_queue_size = 100
         self.request_queue_status = 0
         self.stall_cycles = 0
-        self.request_array = []
+        self.request_queue = dram_request_queue(queue_size=self.request_queue_size)
         self.count = 0
         self.config = config()
     #
     def def_params( self,
                     config = config(),
-                    latency_file = ''
+                    latency_file = '',
+                    latency_matrix = None
                 ):
         """
         Method to define the paths of ramulator trace numpy files 
-        and read request queue sizes.
+        and read request queue sizes. The latencies can also be
+        given as an array, eg. by the Ramulator bridge.
         """
         self.config = config
-        self.ramulator_trace = self.config.get_ramulator_trace()
+        self.ramulator_trace = self.config.get_ramulator_trace() or latency_matrix is not None
         self.request_queue_size = self.config.get_req_buf_sz_rd()
+        self.request_queue.set_queue_size(self.request_queue_size)
         self.bw = self.config.get_bandwidths_as_list()[0]
-        if self.ramulator_trace == True:
+        if latency_matrix is not None:
+            self.latency_matrix = latency_matrix
+            self.count = 0
+        elif self.ramulator_trace == True:
             self.latency_matrix = np.load(latency_file)
             #print(f"Latency file is {latency_file}")
         self.stall_cycles=0
@@ -56,18 +62,19 @@ class read_port:
         """
         return self.latency
     
-    def find_latency(self):
+    def find_latencies(self, num_requests):
         """
-        Method to map DRAM return path latency for each transactions.
+        Method to map DRAM return path latency for the next transactions.
         """
-        if(self.count < len(self.latency_matrix)):
-            latency_out = self.latency_matrix[self.count]
-            self.count+=1
-        else:
-            latency_out = self.latency
-        if(latency_out > 10000):
-            latency_out = 1
-        return latency_out
+        latency_matrix = np.asarray(self.latency_matrix).reshape(-1)
+        trace_latencies = latency_matrix[self.count:self.count + num_requests]
+        self.count += trace_latencies.shape[0]
+
+        latencies = np.full(num_requests, self.latency,
+                            dtype=np.result_type(trace_latencies.dtype, np.int64))
+        latencies[:trace_latencies.shape[0]] = trace_latencies
+        latencies[latencies > 10000] = 1
+        return latencies
 
     # The incoming read requests will be needed when the capability of port is expanded
     # At the moment its kept for compatibility
@@ -82,29 +89,8 @@ class read_port:
             out_cycles_arr = incoming_cycles_arr + self.latency
             return out_cycles_arr
 
-        updated_req_timestamp = incoming_cycles_arr[0]
-        out_cycles_arr = np.zeros(incoming_requests_arr_np.shape[0])
-        for i in range(len(incoming_cycles_arr)):
-            out_cycles_arr[i] = incoming_cycles_arr[i] + self.stall_cycles + self.find_latency()
-            #print(str(incoming_cycles_arr[i]) + ' ' + str(out_cycles_arr[i]) + ' ' +str(self.stall_cycles))
-            self.request_array.append(out_cycles_arr[i])
-            if len(self.request_array) == self.request_queue_size:
-                updated_req_timestamp = incoming_cycles_arr[i] + self.stall_cycles
-                self.request_array.sort()
-                if self.request_array[0] >= updated_req_timestamp:
-                    self.stall_cycles += self.request_array[0] - updated_req_timestamp
-                    #print(f"stall cycle: {self.stall_cycles}. request array: {self.request_array[0]} updated_req_timestamp: {updated_req_timestamp}")
-                    updated_req_timestamp = self.request_array[0]
-                    self.request_array.pop(0)
-                else:
-                    index = bisect_left(self.request_array,updated_req_timestamp)
-                    if index == len(self.request_array):
-                        self.request_array = []
-                    else:
-                        self.request_array = self.request_array[index:]
-            elif len(self.request_array) > self.request_queue_size:
-                self.request_array = self.request_array[-self.request_queue_size:]
-                #print(f"stall cycle: {self.stall_cycles}. request array: {self.request_array[0]} updated_req_timestamp: {updated_req_timestamp}")
-        
-        self.stall_cycles=0
-        return out_cycles_arr
\ No newline at end of file
+        num_requests = incoming_requests_arr_np.shape[0]
+        out_cycles_arr = \
+            self.request_queue.service_requests(incoming_cycles_np=incoming_cycles_arr,
+                                                latencies_np=self.find_latencies(num_requests))
+        return out_cycles_arr
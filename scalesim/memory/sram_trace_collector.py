@@ -0,0 +1,207 @@
+"""
+This file contains the 'sram_trace_collector' class which gathers the cycles at which the rows of a
+demand matrix are serviced by an SRAM and generates the SRAM trace from them.
+"""
+
+import numpy as np
+
+from scalesim.utilities.trace_io import trace_writer, cycle_dtype
+
+
+class sram_trace_collector:
+    """
+    Class which collects the demand matrix rows of one operand along with the cycles at which they
+    are serviced by the SRAM. The rows can be added in chunks, eg. one fold at a time, so that the
+    complete demand matrix is never needed. By default the trace matrix is generated in memory as
+    the rows are serviced. In streaming mode the trace rows are written to a file in chunks as soon
+    as enough rows are serviced, so that only the chunk being filled is held in memory.
+    """
+    #
+    def __init__(self):
+        """
+        __init__ method.
+        """
+        self.num_rows = 0
+        self.trace_matrix = np.zeros((1, 1))
+
+        self.pending_cycles = []
+        self.pending_demands = []
+        self.num_pending_rows = 0
+        self.num_serviced_rows = 0
+
+        # Streaming mode
+        self.streaming = False
+        self.filename = ''
+        self.trace_format = 'csv'
+        self.chunk_rows = 0
+        self.writer = None
+
+        # Stats gathered while generating the trace, so that the trace is never rescanned
+        self.start_cycle = 0
+        self.stop_cycle = 0
+        self.start_cycle_found = False
+        self.max_cycle = 0
+        self.last_cycle = np.zeros(1)
+
+        self.params_set_flag = False
+        self.trace_valid = False
+
+    #
+    def set_params(self, num_rows, filename='', trace_format='csv', chunk_rows=0):
+        """
+        Method to set the number of demand matrix rows which will be serviced. Passing a filename
+        and a positive chunk_rows turns on the streaming mode.
+        """
+        self.num_rows = num_rows
+        self.trace_matrix = np.zeros((1, 1))
+
+        self.pending_cycles = []
+        self.pending_demands = []
+        self.num_pending_rows = 0
+        self.num_serviced_rows = 0
+
+        self.streaming = filename != '' and chunk_rows > 0
+        self.filename = filename
+        self.trace_format = trace_format
+        self.chunk_rows = chunk_rows
+        self.writer = None
+
+        self.start_cycle = 0
+        self.stop_cycle = 0
+        self.start_cycle_found = False
+        self.max_cycle = 0
+        self.last_cycle = np.zeros(1)
+
+        self.params_set_flag = True
+        self.trace_valid = False
+
+    #
+    def add_serviced_rows(self, cycles_np, demand_np):
+        """
+        Method to record the next rows of the demand matrix and the cycles at which they are
+        serviced.
+        """
+        assert self.params_set_flag, 'Parameters are not set'
+        assert cycles_np.shape[0] == demand_np.shape[0], 'Cycles and demands out of sync'
+
+        num_rows = demand_np.shape[0]
+        start = self.num_serviced_rows
+        end = start + num_rows
+        assert end <= self.num_rows, 'More rows serviced than set'
+
+        self.update_start_stop_cycles(cycles_np, demand_np)
+        self.max_cycle = max(self.max_cycle, int(np.max(cycles_np)))
+        self.last_cycle = cycles_np[-1]
+        self.num_serviced_rows = end
+
+        if not self.streaming:
+            if start == 0:
+                trace_dtype = np.result_type(cycle_dtype, demand_np.dtype)
+                self.trace_matrix = np.zeros((self.num_rows, demand_np.shape[1] + 1),
+                                             dtype=trace_dtype)
+            self.trace_matrix[start:end, :1] = cycles_np
+            self.trace_matrix[start:end, 1:] = demand_np
+            return
+
+        if self.writer is None:
+            self.writer = trace_writer(self.filename,
+                                       num_rows=self.num_rows,
+                                       num_addr_cols=demand_np.shape[1],
+                                       trace_format=self.trace_format,
+                                       csv_fmt='%i',
+                                       addr_dtype=np.result_type(np.int32, demand_np.dtype))
+
+        self.pending_cycles += [cycles_np]
+        self.pending_demands += [demand_np]
+        self.num_pending_rows += num_rows
+
+        if self.num_pending_rows >= self.chunk_rows:
+            self.flush()
+
+    #
+    def flush(self):
+        """
+        Method to write the rows serviced so far to the trace file in streaming mode.
+        """
+        if self.num_pending_rows == 0:
+            return
+
+        cycles_np = np.concatenate(self.pending_cycles, axis=0)
+        addr_np = np.concatenate(self.pending_demands, axis=0)
+        self.writer.write(cycles_np, addr_np)
+
+        self.pending_cycles = []
+        self.pending_demands = []
+        self.num_pending_rows = 0
+
+    #
+    def update_start_stop_cycles(self, cycles_np, addr_np):
+        """
+        Method to update the cycles of the first and the last rows with a valid address with the
+        next serviced rows.
+        """
+        valid_row_ids = np.flatnonzero(np.any(addr_np != -1, axis=1))
+        if valid_row_ids.shape[0] == 0:
+            return
+
+        if not self.start_cycle_found:
+            self.start_cycle = cycles_np[valid_row_ids[0]][0]
+            self.start_cycle_found = True
+        self.stop_cycle = cycles_np[valid_row_ids[-1]][0]
+
+    #
+    def finish(self):
+        """
+        Method to be called once all the rows are serviced. In streaming mode the remaining rows
+        are written and the file is closed.
+        """
+        assert self.params_set_flag, 'Parameters are not set'
+        assert self.num_serviced_rows == self.num_rows, 'Not all the rows are serviced'
+
+        if self.streaming and self.writer is not None:
+            self.flush()
+            self.writer.close()
+            self.writer = None
+
+        self.trace_valid = True
+
+    #
+    def is_streaming(self):
+        """
+        Method to check if the trace is written to a file in chunks.
+        """
+        return self.streaming
+
+    #
+    def get_trace_matrix(self):
+        """
+        Method to get the trace matrix. Not available in streaming mode.
+        """
+        assert self.trace_valid, 'Trace not generated yet'
+        assert not self.streaming, 'Trace matrix is not kept in streaming mode'
+        return self.trace_matrix
+
+    #
+    def get_start_stop_cycles(self):
+        """
+        Method to get the cycles of the first and the last rows with a valid address. Both are 0
+        if there is no valid address.
+        """
+        assert self.trace_valid, 'Trace not generated yet'
+        return self.start_cycle, self.stop_cycle
+
+    #
+    def get_max_cycle(self):
+        """
+        Method to get the largest serviced cycle.
+        """
+        assert self.trace_valid, 'Trace not generated yet'
+        return self.max_cycle
+
+    #
+    def get_last_cycle(self):
+        """
+        Method to get the cycle at which the last row is serviced, as an array with one element.
+        """
+        assert self.trace_valid, 'Trace not generated yet'
+        return self.last_cycle
@@ -7,8 +7,9 @@ import time
 import math
 import numpy as np
 # import matplotlib.pyplot as plt
-from tqdm import tqdm
 from scalesim.memory.write_port import write_port
+from scalesim.memory.growable_buffer import growable_buffer
+from scalesim.utilities.trace_io import save_trace, dram_trace_csv_fmt
 
 
 class write_buffer:
@@ -39,18 +40,21 @@ class write_buffer:
         self.drain_buf_start_line_id = 0
         self.drain_buf_end_line_id = 0
 
+        # Number of rows checked at once for stalls and drains when servicing a batch of writes
+        self.min_scan_rows = 64
+        self.max_scan_rows = 8192
+
         # Helper data structures for faster execution
         self.line_idx = 0
-        self.current_line = np.ones((1, 1)) * -1
-        self.max_cache_lines = 2 ** 10  # TODO: This is arbitrary, check if this can be tuned
-        self.trace_matrix_cache = np.zeros((1, 1))
+        self.current_line = np.full((1, self.req_gen_bandwidth), -1, dtype=np.int32)
 
         # Access counts
         self.num_access = 0
 
-        # Trace matrix
-        self.trace_matrix = np.zeros((1, 1))
-        self.cycles_vec = np.zeros((1, 1))
+        # Trace matrix: the lines written to the buffer, and the cycles at which they are drained
+        self.trace_buffer = growable_buffer(num_cols=self.req_gen_bandwidth,
+                                            dtype=self.current_line.dtype)
+        self.cycles_buffer = growable_buffer(num_cols=1)
 
         # Flags
         # This variable determines where the new requests should be buffered
@@ -60,9 +64,6 @@ class write_buffer:
         self.drain_end_cycle = 0
 
         self.trace_valid = False
-        # Fixing ISSUE #10
-        self.trace_matrix_cache_empty = True
-        self.trace_matrix_empty = True
 
     #
     def set_params(self, backing_buf_obj,
@@ -86,6 +87,12 @@ class write_buffer:
         self.drain_buf_size = self.total_size_elems - self.active_buf_size
         self.free_space = self.total_size_elems
 
+        self.line_idx = 0
+        self.current_line = np.full((1, self.req_gen_bandwidth), -1, dtype=np.int32)
+        self.trace_buffer = growable_buffer(num_cols=self.req_gen_bandwidth,
+                                            dtype=self.current_line.dtype)
+        self.cycles_buffer = growable_buffer(num_cols=1)
+
     #
     def reset(self):
         """
@@ -100,90 +107,80 @@ class write_buffer:
 
         self.free_space = self.total_size_elems
         self.drain_end_cycle = 0
+        self.drain_buf_start_line_id = 0
+        self.drain_buf_end_line_id = 0
 
-        self.trace_matrix = np.zeros((1, 1))
+        self.line_idx = 0
+        self.current_line = np.full((1, self.req_gen_bandwidth), -1, dtype=np.int32)
+        self.trace_buffer = growable_buffer(num_cols=self.req_gen_bandwidth,
+                                            dtype=self.current_line.dtype)
+        self.cycles_buffer = growable_buffer(num_cols=1)
 
         self.num_access = 0
         self.state = 0
 
         self.trace_valid = False
-        # Fixing ISSUE #10
-        self.trace_matrix_cache_empty = True
-        self.trace_matrix_empty = True
 
     #
-    def store_to_trace_mat_cache(self, elem):
+    def store_to_trace_mat(self, elem):
         """
-        Method to add the incoming element to the trace matrix cache.
+        Method to add the incoming element to the current line. Once the line is full, it is
+        appended to the trace matrix.
         """
         if elem == -1:
             return
 
-        if self.current_line.shape == (1,1):    # This line is empty
-            self.current_line = np.ones((1, self.req_gen_bandwidth)) * -1
-
         self.current_line[0, self.line_idx] = elem
         self.line_idx += 1
         self.free_space -= 1
 
         if not self.line_idx < self.req_gen_bandwidth:
-            # Store to the cache matrix
-            # Fixing ISSUE #10
-            # if self.trace_matrix_cache.shape == (1,1):
-            if self.trace_matrix_cache_empty:
-                self.trace_matrix_cache = self.current_line
-                self.trace_matrix_cache_empty = False
-            else:
-                self.trace_matrix_cache = np.concatenate((
-                                                          self.trace_matrix_cache,
-                                                          self.current_line
-                                                         ),
-                                                         axis=0)
-
-            self.current_line = np.ones((1,1)) * -1
+            self.trace_buffer.append(self.current_line)
+            self.current_line.fill(-1)
             self.line_idx = 0
 
-            if not self.trace_matrix_cache.shape[0] < self.max_cache_lines:
-                self.append_to_trace_mat()
-
     #
-    def append_to_trace_mat(self, force=False):
+    def store_to_trace_mat_batch(self, elems_np):
         """
-        Method to append to the trace matrix cache.
+        Method to add a 1D array of valid elements to the trace matrix in order. This is the same
+        as calling store_to_trace_mat() for each of the elements.
         """
-        if force:
-            # This forces the contents for self.current_line and self.trace_matrix
-            # cache to be dumped
-            if not self.line_idx == 0:
-                #if self.trace_matrix_cache.shape == (1,1):
-                if self.trace_matrix_cache_empty:
-                    self.trace_matrix_cache = self.current_line
-                    self.trace_matrix_cache_empty = False
-                else:
-                    self.trace_matrix_cache = np.concatenate((
-                                                              self.trace_matrix_cache,
-                                                              self.current_line
-                                                             ),
-                                                             axis=0)
-
-                self.current_line = np.ones((1,1)) * -1
-                self.line_idx = 0
-        # Fixing ISSUE #10
-        # if self.trace_matrix_cache.shape == (1,1):
-        if self.trace_matrix_cache_empty:
+        num_elems = elems_np.shape[0]
+        if num_elems == 0:
             return
 
-        #if self.trace_matrix.shape == (1,1):
-        if self.trace_matrix_empty:
-            self.trace_matrix = self.trace_matrix_cache
-            self.drain_buf_start_line_id = 0
-            self.trace_matrix_empty = False
-        else:
-            self.trace_matrix = np.concatenate((self.trace_matrix, self.trace_matrix_cache), axis=0)
+        self.free_space -= num_elems
+
+        # Top up the current line first
+        num_fill = min(num_elems, self.req_gen_bandwidth - self.line_idx)
+        self.current_line[0, self.line_idx:self.line_idx + num_fill] = elems_np[:num_fill]
+        self.line_idx += num_fill
+        if not self.line_idx < self.req_gen_bandwidth:
+            self.trace_buffer.append(self.current_line)
+            self.current_line.fill(-1)
+            self.line_idx = 0
+
+        # Then the full lines, and the rest goes to the new current line
+        remaining_elems = elems_np[num_fill:]
+        num_full_lines = remaining_elems.shape[0] // self.req_gen_bandwidth
+        num_full_elems = num_full_lines * self.req_gen_bandwidth
+        if num_full_lines > 0:
+            self.trace_buffer.append(
+                remaining_elems[:num_full_elems].reshape((num_full_lines, self.req_gen_bandwidth)))
 
-        self.trace_matrix_cache = np.zeros((1,1))
-        # Fixing ISSUE #10
-        self.trace_matrix_cache_empty = True
+        num_tail_elems = remaining_elems.shape[0] - num_full_elems
+        self.current_line[0, :num_tail_elems] = remaining_elems[num_full_elems:]
+        self.line_idx += num_tail_elems
+
+    #
+    def flush_current_line(self):
+        """
+        Method to append the partially filled current line, if any, to the trace matrix.
+        """
+        if not self.line_idx == 0:
+            self.trace_buffer.append(self.current_line)
+            self.current_line.fill(-1)
+            self.line_idx = 0
 
     #
     def service_writes(self, incoming_requests_arr_np, incoming_cycles_arr_np):
@@ -193,15 +190,57 @@ class write_buffer:
         """
         assert incoming_cycles_arr_np.shape[0] == incoming_requests_arr_np.shape[0], \
                                                   'Cycles and requests do not match'
-        out_cycles_arr = []
+        num_lines = incoming_requests_arr_np.shape[0]
+        out_cycles_chunks = []
         offset = 0
 
-        # DEBUG_num_drains = 0
-        # DEBUG_append_to_trace_times = []
+        # Widen the current line if the incoming addresses do not fit in it
+        if not np.can_cast(incoming_requests_arr_np.dtype, self.current_line.dtype):
+            self.current_line = self.current_line.astype(
+                np.result_type(self.current_line.dtype, incoming_requests_arr_np.dtype))
+
+        valid_requests = incoming_requests_arr_np != -1
+        num_valid_requests = np.count_nonzero(valid_requests, axis=1)
+        active_size = self.total_size_elems - self.drain_buf_size
+
+        scan_rows = self.min_scan_rows
+        row_id = 0
+        while row_id < num_lines:
+            # Find the first row in which a write stalls or the drain buffer is emptied. A row
+            # stalls when the buffer fills up before the ongoing drain ends, and drains once the
+            # free space drops below the active buffer size after the ongoing drain has ended.
+            # All the rows before it only store their elements.
+            end_id = min(row_id + scan_rows, num_lines)
+            row_counts = num_valid_requests[row_id:end_id]
+            cum_counts = np.cumsum(row_counts)
+            current_cycles = incoming_cycles_arr_np[row_id:end_id, 0] + offset
+
+            draining_rows = current_cycles < self.drain_end_cycle
+            stall_rows = np.logical_and(draining_rows, cum_counts >= self.free_space)
+            drain_rows = np.logical_and(np.logical_not(draining_rows),
+                                        cum_counts > self.free_space - active_size)
+            event_rows = np.logical_and(row_counts > 0, np.logical_or(stall_rows, drain_rows))
+
+            if np.any(event_rows):
+                num_event_free_rows = int(np.argmax(event_rows))
+            else:
+                num_event_free_rows = end_id - row_id
+
+            if num_event_free_rows > 0:
+                free_end_id = row_id + num_event_free_rows
+                self.store_to_trace_mat_batch(
+                    incoming_requests_arr_np[row_id:free_end_id][valid_requests[row_id:free_end_id]])
+                out_cycles_chunks.append(current_cycles[:num_event_free_rows])
+                row_id = free_end_id
+
+                if free_end_id == end_id:
+                    scan_rows = min(2 * scan_rows, self.max_scan_rows)
+                    continue
 
-        for i in tqdm(range(incoming_requests_arr_np.shape[0]), disable=True):
-            row = incoming_requests_arr_np[i]
-            cycle = incoming_cycles_arr_np[i]
+            # The row with the stall or the drain is serviced one element at a time
+            scan_rows = self.min_scan_rows
+            row = incoming_requests_arr_np[row_id].tolist()
+            cycle = incoming_cycles_arr_np[row_id]
             current_cycle = cycle[0] + offset
 
             for elem in row:
@@ -209,7 +248,7 @@ class write_buffer:
                 if elem == -1:
                     continue
 
-                self.store_to_trace_mat_cache(elem)
+                self.store_to_trace_mat(elem)
 
                 if current_cycle < self.drain_end_cycle:
                     if not self.free_space > 0:
@@ -217,20 +256,15 @@ class write_buffer:
                         current_cycle = self.drain_end_cycle
 
                 elif self.free_space < (self.total_size_elems - self.drain_buf_size):
-                    self.append_to_trace_mat(force=True)
+                    self.flush_current_line()
                     self.drain_end_cycle = self.empty_drain_buf(empty_start_cycle=current_cycle)
                     # TODO sarbartha
                     #current_cycle = self.drain_end_cycle
 
-            out_cycles_arr.append(current_cycle)
+            out_cycles_chunks.append(np.reshape(current_cycle, (1,)))
+            row_id += 1
 
-        num_lines = incoming_requests_arr_np.shape[0]
-        out_cycles_arr_np = np.asarray(out_cycles_arr).reshape((num_lines, 1))
-
-        #print('DEBUG: Num Drains = ' + str(DEBUG_num_drains))
-        #print('DEBUG: Num appeneds = ' + str(len(DEBUG_append_to_trace_times)))
-        #plt.plot(DEBUG_append_to_trace_times)
-        #plt.show()
+        out_cycles_arr_np = np.concatenate(out_cycles_chunks).reshape((num_lines, 1))
 
         return out_cycles_arr_np
 
@@ -240,31 +274,28 @@ class write_buffer:
         Method to drain the drain buffer once the active buffer is full.
         """
 
+        trace_matrix = self.trace_buffer.get_matrix()
+
         lines_to_fill_dbuf = int(math.ceil(self.drain_buf_size / self.req_gen_bandwidth))
         self.drain_buf_end_line_id = self.drain_buf_start_line_id + lines_to_fill_dbuf
-        self.drain_buf_end_line_id = min(self.drain_buf_end_line_id, self.trace_matrix.shape[0])
+        self.drain_buf_end_line_id = min(self.drain_buf_end_line_id, trace_matrix.shape[0])
 
         requests_arr_np = \
-                    self.trace_matrix[self.drain_buf_start_line_id: self.drain_buf_end_line_id, :]
+                    trace_matrix[self.drain_buf_start_line_id: self.drain_buf_end_line_id, :]
         num_lines = requests_arr_np.shape[0]
 
         data_sz_to_drain = num_lines * requests_arr_np.shape[1]
         # Adjust for -1
-        for elem in requests_arr_np[-1,:]:
-            if elem == -1:
-                data_sz_to_drain -= 1
+        data_sz_to_drain -= np.count_nonzero(requests_arr_np[-1, :] == -1)
         self.num_access += data_sz_to_drain
 
         cycles_arr = [x+empty_start_cycle for x in range(num_lines)]
         cycles_arr_np = np.asarray(cycles_arr).reshape((num_lines, 1))
         serviced_cycles_arr = self.backing_buffer.service_writes(requests_arr_np, cycles_arr_np)
 
-        # Assign the cycles vector which will be used to generate the complete trace
-        if not self.trace_valid:
-            self.cycles_vec = serviced_cycles_arr
-            self.trace_valid = True
-        else:
-            self.cycles_vec = np.concatenate((self.cycles_vec, serviced_cycles_arr), axis=0)
+        # Record the cycles which will be used to generate the complete trace
+        self.cycles_buffer.append(serviced_cycles_arr)
+        self.trace_valid = True
 
         service_end_cycle = np.amax(serviced_cycles_arr)
         self.free_space += data_sz_to_drain
@@ -277,12 +308,12 @@ class write_buffer:
         """
         Method to drain all of the active buffer.
         """
-        self.append_to_trace_mat(force=True)
+        self.flush_current_line()
 
-        if self.trace_matrix_empty:
+        if self.trace_buffer.is_empty():
             return
 
-        while self.drain_buf_start_line_id < self.trace_matrix.shape[0]:
+        while self.drain_buf_start_line_id < self.trace_buffer.get_num_rows():
             self.drain_end_cycle = self.empty_drain_buf(empty_start_cycle=cycle)
             cycle = self.drain_end_cycle + 1
 
@@ -296,7 +327,8 @@ class write_buffer:
             print('No trace has been generated yet')
             return
 
-        trace_matrix = np.column_stack((self.cycles_vec, self.trace_matrix))
+        trace_matrix = np.column_stack((self.cycles_buffer.get_matrix(),
+                                        self.trace_buffer.get_matrix()))
 
         return trace_matrix
 
@@ -321,12 +353,13 @@ class write_buffer:
         Method to get start and stop cycles of the write buffer if trace_valid flag is set.
         """
         assert self.trace_valid, 'Traces not ready yet'
-        start_cycle = np.amin(self.cycles_vec)
-        end_cycle = np.amax(self.cycles_vec)
+        cycles_vec = self.cycles_buffer.get_matrix()
+        start_cycle = np.amin(cycles_vec)
+        end_cycle = np.amax(cycles_vec)
         return start_cycle, end_cycle
 
     #
-    def print_trace(self, filename):
+    def print_trace(self, filename, trace_format='csv'):
         """
         Method to write the write buffer trace matrix to a file.
         """
@@ -334,4 +367,4 @@ class write_buffer:
             print('No trace has been generated yet')
             return
         trace_matrix = self.get_trace_matrix()
-        np.savetxt(filename, trace_matrix, fmt='%s', delimiter=",")
+        save_trace(filename, trace_matrix, trace_format=trace_format, csv_fmt=dram_trace_csv_fmt)
@@ -3,7 +3,7 @@ External DRAM write requests serviced by Ramulator
 """
 import numpy as np
 from scalesim.scale_config import scale_config as config
-from bisect import bisect_left
+from scalesim.memory.dram_request_queue import dram_request_queue
 
 # This is shell module to ensure continuity
 
@@ -23,41 +23,46 @@ class write_port:
         self.request_queue_size = 100
         self.request_queue_status = 0
         self.stall_cycles = 0
-        self.request_array = []
+        self.request_queue = dram_request_queue(queue_size=self.request_queue_size)
         self.count = 0
         self.config = config()
     
     def def_params( self,
                     config = config(),
-                    latency_file =''
+                    latency_file ='',
+                    latency_matrix = None
                 ):
         """
         Method to define the paths of ramulator trace numpy files 
-        and write request queue sizes.
+        and write request queue sizes. The latencies can also be
+        given as an array, eg. by the Ramulator bridge.
         """
         self.config = config
-        self.ramulator_trace = self.config.get_ramulator_trace()
+        self.ramulator_trace = self.config.get_ramulator_trace() or latency_matrix is not None
         self.request_queue_size = self.config.get_req_buf_sz_wr()
+        self.request_queue.set_queue_size(self.request_queue_size)
         self.bw = self.config.get_bandwidths_as_list()[0]
-        if self.ramulator_trace == True:
+        if latency_matrix is not None:
+            self.latency_matrix = latency_matrix
+            self.count = 0
+        elif self.ramulator_trace == True:
             self.latency_matrix = np.load(latency_file)
         self.latency=0
     #
 
-    def find_latency(self):
+    def find_latencies(self, num_requests):
         """
-        Method to map DRAM return path latency for each transactions.
+        Method to map DRAM return path latency for the next transactions.
         """
-        if(self.count < len(self.latency_matrix)):
-            latency_out = self.latency_matrix[self.count]
-            #print(str(self.count)+ ' ' + str(latency_out))
-            self.count+=1
-        else:
-            latency_out = self.latency
-        if(latency_out > 10000):
-            latency_out = 0
+        latency_matrix = np.asarray(self.latency_matrix).reshape(-1)
+        trace_latencies = latency_matrix[self.count:self.count + num_requests]
+        self.count += trace_latencies.shape[0]
 
-        return latency_out
+        latencies = np.full(num_requests, self.latency,
+                            dtype=np.result_type(trace_latencies.dtype, np.int64))
+        latencies[:trace_latencies.shape[0]] = trace_latencies
+        latencies[latencies > 10000] = 0
+        return latencies
 
     def service_writes(self, incoming_requests_arr_np, incoming_cycles_arr_np):
         """
@@ -71,31 +76,8 @@ class write_port:
             out_cycles_arr_np = out_cycles_arr_np.reshape((out_cycles_arr_np.shape[0], 1))
             return out_cycles_arr_np
 
-        updated_req_timestamp = incoming_cycles_arr_np[0][0]
-        print(updated_req_timestamp)
-        out_cycles_arr = np.zeros(incoming_cycles_arr_np.shape[0])
-        for i in range(len(incoming_cycles_arr_np)):
-            out_cycles_arr[i] = incoming_cycles_arr_np[i][0] + self.stall_cycles + self.find_latency()
-            self.request_array.append(out_cycles_arr[i])
-            if len(self.request_array) == self.request_queue_size:
-                updated_req_timestamp = incoming_cycles_arr_np[i][0] + self.stall_cycles
-                self.request_array.sort()
-                if self.request_array[0] >= updated_req_timestamp:
-                    self.stall_cycles += self.request_array[0] - updated_req_timestamp
-                    updated_req_timestamp = self.request_array[0]
-                    self.request_array.pop(0)
-                else:
-                    index = bisect_left(self.request_array,updated_req_timestamp)
-                    if index == len(self.request_array):
-                        self.request_array = []
-                        print("Empty array")
-                    else:
-                        self.request_array = self.request_array[index:]
-            elif len(self.request_array) > self.request_queue_size:
-                self.request_array = self.request_array[-self.request_queue_size:]
-        # --- Placeholder for zeroization logic
-        #if flush == 0:
-        #    self.stall_cycles = 0
-
-        self.stall_cycles =0
+        num_requests = incoming_cycles_arr_np.shape[0]
+        out_cycles_arr = \
+            self.request_queue.service_requests(incoming_cycles_np=incoming_cycles_arr_np[:, 0],
+                                                latencies_np=self.find_latencies(num_requests))
         return out_cycles_arr
@@ -33,6 +33,18 @@ if __name__ == '__main__':
                         default="Y",
                         help="Save Trace: (Y/N)"
                         )
+    parser.add_argument('-w', metavar='num workers', type=int,
+                        default=1,
+                        help="Number of worker processes to simulate the layers in parallel"
+                        )
+    parser.add_argument('-f', metavar='trace format', type=str,
+                        default="",
+                        help="Trace file format: csv, npy or npz (compressed). Overrides the config"
+                        )
+    parser.add_argument('-m', '--mode', metavar='sim mode', type=str,
+                        default="full", choices=['full', 'analytical'],
+                        help="full: cycle level simulation, analytical: closed form estimates"
+                        )
 
     args = parser.parse_args()
     topology = args.t
@@ -41,6 +53,9 @@ if __name__ == '__main__':
     logpath = args.p
     inp_type = args.i
     save_trace = args.s
+    num_workers = args.w
+    trace_format = args.f
+    mode = args.mode
 
     GEMM_INPUT = False
     if inp_type == 'gemm':
@@ -52,11 +67,14 @@ if __name__ == '__main__':
         save_space = True
    
 
-    s = scalesim(save_disk_space=False,
+    s = scalesim(save_disk_space=save_space,
                  verbose=True,
                  config=config,
                  topology=topology,
                  layout=layout,
-                 input_type_gemm=GEMM_INPUT
+                 input_type_gemm=GEMM_INPUT,
+                 num_workers=num_workers,
+                 trace_format=trace_format,
+                 mode=mode
                  )
     s.run_scale(top_path=logpath)
@@ -59,6 +59,38 @@ class scale_config:
     
     # Sarbartha: Added ramulator based DRAM trace support
         self.use_ramulator_trace = False
+        # Run Ramulator on the DRAM requests of each layer within the run, over a pipe
+        self.use_ramulator_bridge = False
+        self.ramulator_path = 'submodules/ramulator/ramulator'
+        self.ramulator_config = 'submodules/ramulator/configs/DDR4-config.cfg'
+
+        # Built-in DRAM timing model, an alternative to Ramulator set in the dram section
+        self.use_dram_model = False
+        self.dram_channels = 1
+        self.dram_banks = 16
+        self.dram_row_size_bytes = 8192
+        self.dram_burst_size_bytes = 64
+        self.dram_t_rcd = 16
+        self.dram_t_rp = 16
+        self.dram_t_cl = 16
+        self.dram_t_burst = 4
+        self.dram_page_policy = 'open'
+        self.dram_queue_depth = 32
+
+        self.trace_format = 'csv'
+        self.valid_trace_format_list = ['csv', 'npy', 'npz']
+        # Rows per chunk when streaming the SRAM traces to disk, 0 keeps them in memory
+        self.trace_chunk_rows = 0
+
+        # On disk cache of the layer results, an empty dir uses ~/.cache/scalesim
+        self.use_layer_cache = False
+        self.layer_cache_dir = ''
+        self.layer_cache_size_mb = 512
+        # Simulate only the first of the layers with identical parameters in a run
+        self.dedup_layers = True
+
+        # Number of images (or GEMM input matrices) processed together by each layer
+        self.batch_size = 1
     #
     def read_conf_file(self, conf_file_in):
         """
@@ -90,6 +122,42 @@ class scale_config:
             self.use_ramulator_trace = True
         else:
             self.use_ramulator_trace = False
+
+        if config.has_option(section, 'RamulatorBridge'):
+            self.use_ramulator_bridge = config.getboolean(section, 'RamulatorBridge')
+        if config.has_option(section, 'RamulatorPath'):
+            self.ramulator_path = config.get(section, 'RamulatorPath').strip()
+        if config.has_option(section, 'RamulatorConfig'):
+            self.ramulator_config = config.get(section, 'RamulatorConfig').strip()
+        if self.use_ramulator_bridge and self.use_ramulator_trace:
+            print("WARNING: RamulatorBridge replaces the Ramulator latency files, "
+                  "ignoring UseRamulatorTrace")
+            self.use_ramulator_trace = False
+
+        if config.has_option(section, 'TraceFormat'):
+            self.trace_format = config.get(section, 'TraceFormat').strip().lower()
+        if self.trace_format not in self.valid_trace_format_list:
+            print("WARNING: Invalid trace format, using csv")
+            self.trace_format = 'csv'
+
+        if config.has_option(section, 'TraceChunkRows'):
+            self.trace_chunk_rows = int(config.get(section, 'TraceChunkRows'))
+        assert self.trace_chunk_rows >= 0, "ERROR: Invalid trace chunk size"
+
+        if config.has_option(section, 'LayerCache'):
+            self.use_layer_cache = config.getboolean(section, 'LayerCache')
+        if config.has_option(section, 'LayerCacheDir'):
+            self.layer_cache_dir = config.get(section, 'LayerCacheDir').strip()
+        if config.has_option(section, 'LayerCacheSizeMB'):
+            self.layer_cache_size_mb = int(config.get(section, 'LayerCacheSizeMB'))
+        assert self.layer_cache_size_mb > 0, "ERROR: Invalid layer cache size"
+
+        if config.has_option(section, 'DedupLayers'):
+            self.dedup_layers = config.getboolean(section, 'DedupLayers')
+
+        if config.has_option(section, 'BatchSize'):
+            self.batch_size = int(config.get(section, 'BatchSize'))
+        assert self.batch_size >= 1, "ERROR: Invalid batch size"
         
         # TODO Sarbartha: Should be bw
         div_factor = 1
@@ -150,6 +218,43 @@ class scale_config:
 
             self.sparsity_rand_seed = int(config.get(section, 'RandomNumberGeneratorSeed'))
 
+        # DRAM timing model
+        section = 'dram'
+        if config.has_section(section):
+            if config.has_option(section, 'DramModel'):
+                self.use_dram_model = config.getboolean(section, 'DramModel')
+            if config.has_option(section, 'Channels'):
+                self.dram_channels = int(config.get(section, 'Channels'))
+            if config.has_option(section, 'Banks'):
+                self.dram_banks = int(config.get(section, 'Banks'))
+            if config.has_option(section, 'RowSizeBytes'):
+                self.dram_row_size_bytes = int(config.get(section, 'RowSizeBytes'))
+            if config.has_option(section, 'BurstSizeBytes'):
+                self.dram_burst_size_bytes = int(config.get(section, 'BurstSizeBytes'))
+            if config.has_option(section, 'tRCD'):
+                self.dram_t_rcd = int(config.get(section, 'tRCD'))
+            if config.has_option(section, 'tRP'):
+                self.dram_t_rp = int(config.get(section, 'tRP'))
+            if config.has_option(section, 'tCL'):
+                self.dram_t_cl = int(config.get(section, 'tCL'))
+            if config.has_option(section, 'tBurst'):
+                self.dram_t_burst = int(config.get(section, 'tBurst'))
+            if config.has_option(section, 'PagePolicy'):
+                self.dram_page_policy = config.get(section, 'PagePolicy').strip().lower()
+            if config.has_option(section, 'QueueDepth'):
+                self.dram_queue_depth = int(config.get(section, 'QueueDepth'))
+
+        assert self.dram_channels > 0 and self.dram_banks > 0, \
+            "ERROR: Invalid number of DRAM channels or banks"
+        assert self.dram_page_policy in ['open', 'closed'], "ERROR: Invalid DRAM page policy"
+        assert self.dram_queue_depth >= 0, "ERROR: Invalid DRAM queue depth"
+
+        if self.use_dram_model and (self.use_ramulator_bridge or self.use_ramulator_trace):
+            print("WARNING: The DRAM model replaces Ramulator, "
+                  "ignoring RamulatorBridge and UseRamulatorTrace")
+            self.use_ramulator_bridge = False
+            self.use_ramulator_trace = False
+
         self.valid_conf_flag = True
 
     #
@@ -261,6 +366,91 @@ class scale_config:
     def set_layout_file(self, layoutfile=''):
         self.layoutfile = layoutfile
 
+    #
+    def set_trace_format(self, trace_format='csv'):
+        """
+        Method to set the file format of the saved traces, with csv being the default format.
+        """
+        assert trace_format in self.valid_trace_format_list, 'Invalid trace format'
+        self.trace_format = trace_format
+
+    #
+    def set_trace_chunk_rows(self, chunk_rows=0):
+        """
+        Method to set the number of rows per chunk when streaming the SRAM traces to disk, with 0
+        (no streaming) being the default.
+        """
+        assert chunk_rows >= 0, 'Invalid trace chunk size'
+        self.trace_chunk_rows = chunk_rows
+
+    #
+    def set_layer_cache(self, use_layer_cache=True, cache_dir='', cache_size_mb=512):
+        """
+        Method to enable or disable the on disk cache of the layer results.
+        """
+        assert cache_size_mb > 0, 'Invalid layer cache size'
+        self.use_layer_cache = use_layer_cache
+        self.layer_cache_dir = cache_dir
+        self.layer_cache_size_mb = cache_size_mb
+
+    #
+    def set_dedup_layers(self, dedup_layers=True):
+        """
+        Method to set if identical layers in a run are simulated only once.
+        """
+        self.dedup_layers = dedup_layers
+
+    #
+    def set_batch_size(self, batch_size=1):
+        """
+        Method to set the number of images processed together by each layer, with 1 being the
+        default.
+        """
+        assert batch_size >= 1, 'Invalid batch size'
+        self.batch_size = batch_size
+
+    #
+    def set_ramulator_bridge(self, use_ramulator_bridge=True, ramulator_path='',
+                             ramulator_config=''):
+        """
+        Method to set if Ramulator is run on the DRAM requests of each layer within the run, and
+        optionally the paths to the Ramulator binary and DRAM config file.
+        """
+        self.use_ramulator_bridge = use_ramulator_bridge
+        if use_ramulator_bridge:
+            self.use_ramulator_trace = False
+        if not ramulator_path == '':
+            self.ramulator_path = ramulator_path
+        if not ramulator_config == '':
+            self.ramulator_config = ramulator_config
+
+    #
+    def set_dram_model(self, use_dram_model=True,
+                       num_channels=1, num_banks=16, row_size_bytes=8192, burst_size_bytes=64,
+                       t_rcd=16, t_rp=16, t_cl=16, t_burst=4, page_policy='open',
+                       queue_depth=32):
+        """
+        Method to set if the built-in DRAM timing model gives the DRAM latencies, and its
+        organization, timings and controller queue depth.
+        """
+        assert num_channels > 0 and num_banks > 0, 'Invalid number of DRAM channels or banks'
+        assert page_policy in ['open', 'closed'], 'Invalid DRAM page policy'
+        assert queue_depth >= 0, 'Invalid DRAM queue depth'
+        self.use_dram_model = use_dram_model
+        if use_dram_model:
+            self.use_ramulator_bridge = False
+            self.use_ramulator_trace = False
+        self.dram_channels = num_channels
+        self.dram_banks = num_banks
+        self.dram_row_size_bytes = row_size_bytes
+        self.dram_burst_size_bytes = burst_size_bytes
+        self.dram_t_rcd = t_rcd
+        self.dram_t_rp = t_rp
+        self.dram_t_cl = t_cl
+        self.dram_t_burst = t_burst
+        self.dram_page_policy = page_policy
+        self.dram_queue_depth = queue_depth
+
     #
     def set_offsets(self,
                     ifmap_offset=0,
@@ -290,6 +480,15 @@ class scale_config:
         """
         self.use_user_bandwidth = False
 
+    #
+    def set_bw_mode_to_user(self, bandwidths=[10]):
+        """
+        Method to set the 'use_user_bandwidth' to USER mode with the given DRAM bandwidths.
+        """
+        assert len(bandwidths) > 0, 'No bandwidth provided'
+        self.use_user_bandwidth = True
+        self.bandwidths = [int(x) for x in bandwidths]
+
     #
     def use_user_dram_bandwidth(self):
         """
@@ -416,7 +615,83 @@ class scale_config:
         """
         if self.valid_conf_flag:
             return self.use_ramulator_trace
-    
+
+    #
+    def get_ramulator_bridge(self):
+        """
+        Method to check if Ramulator is run on the DRAM requests of each layer within the run.
+        """
+        return self.use_ramulator_bridge
+
+    #
+    def get_ramulator_paths(self):
+        """
+        Method to get the paths to the Ramulator binary and DRAM config file used by the bridge.
+        """
+        return self.ramulator_path, self.ramulator_config
+
+    #
+    def get_dram_model(self):
+        """
+        Method to check if the built-in DRAM timing model gives the DRAM latencies.
+        """
+        return self.use_dram_model
+
+    #
+    def get_dram_model_params(self):
+        """
+        Method to get the organization and timings of the DRAM timing model, as the arguments of
+        dram_model.set_params().
+        """
+        return {'num_channels': self.dram_channels,
+                'num_banks': self.dram_banks,
+                'row_size_bytes': self.dram_row_size_bytes,
+                'burst_size_bytes': self.dram_burst_size_bytes,
+                't_rcd': self.dram_t_rcd,
+                't_rp': self.dram_t_rp,
+                't_cl': self.dram_t_cl,
+                't_burst': self.dram_t_burst,
+                'page_policy': self.dram_page_policy,
+                'queue_depth': self.dram_queue_depth}
+
+    #
+    def get_trace_format(self):
+        """
+        Method to get the file format (csv, npy or npz) of the saved traces.
+        """
+        if self.valid_conf_flag:
+            return self.trace_format
+
+    #
+    def get_trace_chunk_rows(self):
+        """
+        Method to get the number of rows per chunk when streaming the SRAM traces to disk. 0 means
+        the traces are kept in memory and written once the layer is simulated.
+        """
+        if self.valid_conf_flag:
+            return self.trace_chunk_rows
+
+    #
+    def get_layer_cache_params(self):
+        """
+        Method to get the layer cache settings: enabled flag, directory and size limit in MB.
+        """
+        return self.use_layer_cache, self.layer_cache_dir, self.layer_cache_size_mb
+
+    #
+    def get_dedup_layers(self):
+        """
+        Method to check if identical layers in a run are simulated only once.
+        """
+        return self.dedup_layers
+
+    #
+    def get_batch_size(self):
+        """
+        Method to get the number of images processed together by each layer.
+        """
+        return self.batch_size
+
     def get_req_buf_sz_rd(self):
         """
         Method to set the read request buffer size
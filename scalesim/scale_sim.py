@@ -22,7 +22,10 @@ class scalesim:
                  config='',
                  topology='',
                  layout='',
-                 input_type_gemm=False):
+                 input_type_gemm=False,
+                 num_workers=1,
+                 trace_format='',
+                 mode='full'):
         """
         __init__ method
         """
@@ -44,6 +47,11 @@ class scalesim:
         self.read_gemm_inputs = input_type_gemm
         self.save_space = save_disk_space
         self.verbose_flag = verbose
+        self.num_workers = num_workers
+        # Empty string keeps the trace format from the config file
+        self.trace_format = trace_format
+        # 'full' runs the cycle level simulation, 'analytical' estimates the stats in closed form
+        self.mode = mode
         self.run_done_flag = False
         self.logs_generated_flag = False
 
@@ -88,6 +96,10 @@ class scalesim:
         # Parse config first
         self.config.read_conf_file(self.config_file)
 
+        # Take the CLI trace format over the one in config
+        if self.trace_format != '':
+            self.config.set_trace_format(self.trace_format)
+
         # Take the CLI topology over the one in config
         # If topology is not passed from CLI take the one from config
         if self.topology_file == '':
@@ -121,7 +133,9 @@ class scalesim:
             layout_obj=self.layout,
             top_path=self.top_path,
             verbosity=self.verbose_flag,
-            save_trace=save_trace
+            save_trace=save_trace,
+            num_workers=self.num_workers,
+            mode=self.mode
         )
         self.run_once()
 
@@ -189,6 +203,9 @@ class scalesim:
         else:
             print('Working in ESTIMATE BANDWIDTH mode.')
 
+        if self.mode == 'analytical':
+            print('Working in ANALYTICAL mode. Memory is not simulated.')
+
         print("====================================================")
 
     #
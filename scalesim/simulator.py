@@ -4,11 +4,75 @@ This file contains the 'simulator' class that simulates the entire model using t
 """
 
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 
 from scalesim.scale_config import scale_config as cfg
 from scalesim.topology_utils import topologies as topo
 from scalesim.layout_utils import layouts as layout
 from scalesim.single_layer_sim import single_layer_sim as layer_sim
+from scalesim.analytical_layer_sim import analytical_layer_sim
+from scalesim.utilities.layer_cache import layer_cache, get_layer_signature
+
+
+valid_sim_modes = ['full', 'analytical']
+
+
+#
+def get_layer_cache(config_obj):
+    """
+    Function to get the layer cache set in the config, or None when it is disabled. The cache is
+    not used with the ramulator traces or the Ramulator bridge, as the layer results then depend
+    on the latency files, or on the Ramulator binary and DRAM config, which are not in the key.
+    """
+    use_layer_cache, cache_dir, cache_size_mb = config_obj.get_layer_cache_params()
+    if not use_layer_cache or config_obj.get_ramulator_trace() \
+            or config_obj.get_ramulator_bridge():
+        return None
+    return layer_cache(cache_dir=cache_dir, max_size_mb=cache_size_mb)
+
+
+#
+def run_single_layer(layer_id, config_obj, topo_obj, layout_obj, top_path, save_trace):
+    """
+    Function to run the simulation of a single layer inside a worker process. The layer object
+    never leaves the worker, only the report items and the path to the saved traces (if any) are
+    shipped back to the parent process. When the layer cache is enabled and no traces are saved,
+    the report items of an identical layer simulated before are reused.
+    """
+    this_layer_cache = get_layer_cache(config_obj)
+    cache_key = ''
+    if this_layer_cache is not None:
+        cache_key = this_layer_cache.get_layer_key(config_obj, topo_obj, layout_obj, layer_id)
+        if not save_trace:
+            report_items = this_layer_cache.get(cache_key)
+            if report_items is not None:
+                return report_items, ''
+
+    this_layer_sim = layer_sim()
+    this_layer_sim.set_params(layer_id=layer_id,
+                              config_obj=config_obj,
+                              topology_obj=topo_obj,
+                              layout_obj=layout_obj,
+                              verbose=False)
+    if save_trace:
+        this_layer_sim.set_trace_path(top_path)
+    this_layer_sim.run()
+
+    trace_path = ''
+    if save_trace:
+        this_layer_sim.save_traces(top_path)
+        trace_path = top_path + '/layer' + str(layer_id)
+
+    report_items = [this_layer_sim.get_compute_report_items(),
+                    this_layer_sim.get_bandwidth_report_items(),
+                    this_layer_sim.get_detail_report_items(),
+                    this_layer_sim.get_sparse_report_items()]
+
+    if this_layer_cache is not None:
+        this_layer_cache.put(cache_key, report_items)
+
+    return report_items, trace_path
 
 
 class simulator:
@@ -27,10 +91,16 @@ class simulator:
         self.top_path = "./"
         self.verbose = True
         self.save_trace = True
+        self.num_workers = 1
+        self.mode = 'full'
 
         self.num_layers = 0
 
-        self.single_layer_sim_object_list = []
+        # Per layer id of the first layer with identical parameters, which is simulated for both
+        self.layer_representatives = []
+        # Per layer [compute, bandwidth, detail, sparse] report items, in layer order
+        self.layer_report_items = []
+        self.layer_trace_paths = []
 
         self.params_set_flag = False
         self.all_layer_run_done = False
@@ -42,10 +112,14 @@ class simulator:
                    layout_obj=layout(),
                    top_path="./",
                    verbosity=True,
-                   save_trace=True
+                   save_trace=True,
+                   num_workers=1,
+                   mode='full'
                    ):
         """
         Method to set the run parameters including inputs and parameters for housekeeping.
+        num_workers > 1 runs the layers in parallel using a pool of worker processes. The
+        'analytical' mode estimates the layer stats in closed form instead of simulating them.
         """
         self.conf = config_obj
         self.topo = topo_obj
@@ -54,6 +128,10 @@ class simulator:
         self.top_path = top_path
         self.verbose = verbosity
         self.save_trace = save_trace
+        assert num_workers > 0, 'Number of workers should be a positive integer'
+        self.num_workers = num_workers
+        assert mode in valid_sim_modes, 'Invalid simulation mode: ' + str(mode)
+        self.mode = mode
 
         # Calculate inferrable parameters here
         self.num_layers = self.topo.get_num_layers()
@@ -67,21 +145,10 @@ class simulator:
         simulations for each layer and gathers the required stats. Once the simulation runs are
         done, it gathers the stats from single_layer_sim objects and calls generate_report() method
         to create the report files. If save_trace flag is set, then layer wise traces are saved as
-        well.
+        well. When more than one worker is requested, the layers are simulated in parallel.
         """
         assert self.params_set_flag, 'Simulator parameters are not set'
 
-        # 1. Create the layer runners for each layer
-        for i in range(self.num_layers):
-            this_layer_sim = layer_sim()
-            this_layer_sim.set_params(layer_id=i,
-                                 config_obj=self.conf,
-                                 topology_obj=self.topo,
-                                 layout_obj=self.layout,
-                                 verbose=self.verbose)
-
-            self.single_layer_sim_object_list.append(this_layer_sim)
-
         if not os.path.isdir(self.top_path):
             os.mkdir(self.top_path)
 
@@ -92,78 +159,263 @@ class simulator:
 
         self.top_path = report_path
 
-        # 2. Run each layer
-        # TODO: This is parallelizable
-        for single_layer_obj in self.single_layer_sim_object_list:
+        self.layer_report_items = []
+        self.layer_trace_paths = []
+        self.layer_representatives = self.get_layer_representatives()
+
+        if self.mode == 'analytical':
+            self.run_analytical()
+            self.all_layer_run_done = True
+            self.generate_analytical_reports()
+            return
+
+        num_distinct_layers = len(set(self.layer_representatives))
+        if self.num_workers > 1 and num_distinct_layers > 1:
+            self.run_parallel()
+        else:
+            self.run_serial()
+
+        self.all_layer_run_done = True
+
+        self.generate_reports()
 
+    #
+    def get_layer_representatives(self):
+        """
+        Method to map every layer to the first layer in the topology with the same parameters
+        (except the name) and layout. Only the first layer of each group is simulated, the others
+        reuse its results. Every layer is its own representative when the deduplication is off or
+        the ramulator traces are used, as the latency files differ across layers.
+        """
+        dedup = self.conf.get_dedup_layers() and not self.conf.get_ramulator_trace()
+
+        representatives = []
+        first_layer_ids = {}
+        for layer_id in range(self.num_layers):
+            if not dedup:
+                representatives.append(layer_id)
+                continue
+            signature = get_layer_signature(self.conf, self.topo, self.layout, layer_id)
+            representatives.append(first_layer_ids.setdefault(signature, layer_id))
+
+        return representatives
+
+    #
+    def replicate_layer_traces(self, layer_id, representative_id):
+        """
+        Method to make the traces of a layer available in its own directory by linking it to the
+        trace directory of its representative. The directory is copied when links are not
+        supported.
+        """
+        trace_path = self.top_path + '/layer' + str(layer_id)
+        if os.path.islink(trace_path):
+            os.remove(trace_path)
+        elif os.path.isdir(trace_path):
+            shutil.rmtree(trace_path)
+
+        representative_dir = 'layer' + str(representative_id)
+        try:
+            os.symlink(representative_dir, trace_path, target_is_directory=True)
+        except OSError:
+            shutil.copytree(self.top_path + '/' + representative_dir, trace_path)
+
+        return trace_path
+
+    #
+    def run_serial(self):
+        """
+        Method to run the layers one after the other in the current process.
+        """
+        this_layer_cache = get_layer_cache(self.conf)
+
+        # Run each layer
+        for layer_id in range(self.num_layers):
             if self.verbose:
-                layer_id = single_layer_obj.get_layer_id()
                 print('\nRunning Layer ' + str(layer_id))
 
+            # 1. Reuse the results of an identical layer simulated earlier in this run
+            representative_id = self.layer_representatives[layer_id]
+            if representative_id != layer_id:
+                report_items = self.layer_report_items[representative_id]
+                self.layer_report_items.append(report_items)
+                trace_path = ''
+                if self.save_trace:
+                    trace_path = self.replicate_layer_traces(layer_id, representative_id)
+                self.layer_trace_paths.append(trace_path)
+                if self.verbose:
+                    print('Identical to Layer ' + str(representative_id) + ', reusing its results')
+                    self.print_layer_stats(report_items)
+                continue
+
+            # 2. Reuse the results found in the layer cache if the traces are not needed
+            cache_key = ''
+            if this_layer_cache is not None:
+                cache_key = this_layer_cache.get_layer_key(self.conf, self.topo, self.layout,
+                                                           layer_id)
+                if not self.save_trace:
+                    report_items = this_layer_cache.get(cache_key)
+                    if report_items is not None:
+                        self.layer_report_items.append(report_items)
+                        self.layer_trace_paths.append('')
+                        if self.verbose:
+                            print('Results found in the layer cache')
+                            self.print_layer_stats(report_items)
+                        continue
+
+            # 3. Simulate the layer. The layer runner is created here and released once its traces
+            #    are saved, so only one layer holds its operand matrices and traces at a time
+            single_layer_obj = layer_sim()
+            single_layer_obj.set_params(layer_id=layer_id,
+                                        config_obj=self.conf,
+                                        topology_obj=self.topo,
+                                        layout_obj=self.layout,
+                                        verbose=self.verbose)
+            if self.save_trace:
+                single_layer_obj.set_trace_path(self.top_path)
             single_layer_obj.run()
 
+            report_items = [single_layer_obj.get_compute_report_items(),
+                            single_layer_obj.get_bandwidth_report_items(),
+                            single_layer_obj.get_detail_report_items(),
+                            single_layer_obj.get_sparse_report_items()]
+            self.layer_report_items.append(report_items)
+
+            if this_layer_cache is not None:
+                this_layer_cache.put(cache_key, report_items)
+
             if self.verbose:
-                comp_items = single_layer_obj.get_compute_report_items()
-                total_cycles = comp_items[0]
-                comp_cycles = comp_items[1]
-                stall_cycles = comp_items[2]
-                util = comp_items[3]
-                mapping_eff = comp_items[4]
-                print('Total cycles: ' + str(total_cycles))
-                print('Compute cycles: ' + str(comp_cycles))
-                print('Stall cycles: ' + str(stall_cycles))
-                print('Overall utilization: ' + "{:.2f}".format(util) +'%')
-                print('Mapping efficiency: ' + "{:.2f}".format(mapping_eff) +'%')
-
-                avg_bw_items = single_layer_obj.get_bandwidth_report_items()
-                if self.conf.sparsity_support is True:
-                    avg_ifmap_sram_bw = avg_bw_items[0]
-                    avg_filter_sram_bw = avg_bw_items[1]
-                    avg_filter_metadata_sram_bw = avg_bw_items[2]
-                    avg_ofmap_sram_bw = avg_bw_items[3]
-                    avg_ifmap_dram_bw = avg_bw_items[4]
-                    avg_filter_dram_bw = avg_bw_items[5]
-                    avg_ofmap_dram_bw = avg_bw_items[6]
-                else:
-                    avg_ifmap_sram_bw = avg_bw_items[0]
-                    avg_filter_sram_bw = avg_bw_items[1]
-                    avg_ofmap_sram_bw = avg_bw_items[2]
-                    avg_ifmap_dram_bw = avg_bw_items[3]
-                    avg_filter_dram_bw = avg_bw_items[4]
-                    avg_ofmap_dram_bw = avg_bw_items[5]
-
-                print('Average IFMAP SRAM BW: ' + "{:.3f}".format(avg_ifmap_sram_bw) + \
-                      ' words/cycle')
-                print('Average Filter SRAM BW: ' + "{:.3f}".format(avg_filter_sram_bw) + \
-                      ' words/cycle')
-                if self.conf.sparsity_support is True:
-                    print('Average Filter Metadata SRAM BW: ' + \
-                          "{:.3f}".format(avg_filter_metadata_sram_bw) + ' words/cycle')
-                print('Average OFMAP SRAM BW: ' + "{:.3f}".format(avg_ofmap_sram_bw) + \
-                      ' words/cycle')
-                print('Average IFMAP DRAM BW: ' + "{:.3f}".format(avg_ifmap_dram_bw) + \
-                      ' words/cycle')
-                print('Average Filter DRAM BW: ' + "{:.3f}".format(avg_filter_dram_bw) + \
-                      ' words/cycle')
-                print('Average OFMAP DRAM BW: ' + "{:.3f}".format(avg_ofmap_dram_bw) + \
-                      ' words/cycle')
+                self.print_layer_stats(report_items)
 
+            trace_path = ''
             if self.save_trace:
                 if self.verbose:
                     print('Saving traces: ', end='')
                 single_layer_obj.save_traces(self.top_path)
+                trace_path = self.top_path + '/layer' + str(layer_id)
                 if self.verbose:
                     print('Done!')
+            self.layer_trace_paths.append(trace_path)
 
-        self.all_layer_run_done = True
+            del single_layer_obj
 
-        self.generate_reports()
+    #
+    def run_parallel(self):
+        """
+        Method to run the layers in a pool of worker processes. Every worker simulates one layer at
+        a time and ships back only the report items, so the results are collected in layer order
+        irrespective of the order in which the workers finish. Only the distinct layers are
+        submitted, the others reuse the results of their representative.
+        """
+        distinct_layer_ids = sorted(set(self.layer_representatives))
+        num_workers = min(self.num_workers, len(distinct_layer_ids))
+        if self.verbose:
+            print('\nRunning ' + str(len(distinct_layer_ids)) + ' distinct layers out of '
+                  + str(self.num_layers) + ' on ' + str(num_workers) + ' workers')
+
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = {layer_id: executor.submit(run_single_layer, layer_id, self.conf,
+                                                 self.topo, self.layout, self.top_path,
+                                                 self.save_trace)
+                       for layer_id in distinct_layer_ids}
+
+            for layer_id in range(self.num_layers):
+                representative_id = self.layer_representatives[layer_id]
+                report_items, trace_path = futures[representative_id].result()
+                if representative_id != layer_id and self.save_trace:
+                    trace_path = self.replicate_layer_traces(layer_id, representative_id)
+                self.layer_report_items.append(report_items)
+                self.layer_trace_paths.append(trace_path)
+
+                if self.verbose:
+                    print('\nLayer ' + str(layer_id) + ' done')
+                    if representative_id != layer_id:
+                        print('Identical to Layer ' + str(representative_id)
+                              + ', reusing its results')
+                    self.print_layer_stats(report_items)
+                    if self.save_trace:
+                        print('Traces saved to: ' + trace_path)
+
+    #
+    def run_analytical(self):
+        """
+        Method to estimate the stats of each layer in closed form. No operand or demand matrices
+        are generated and no traces are saved in this mode.
+        """
+        if self.save_trace and self.verbose:
+            print('WARNING: Traces are not generated in the analytical mode')
+
+        for layer_id in range(self.num_layers):
+            this_layer_sim = analytical_layer_sim()
+            this_layer_sim.set_params(layer_id=layer_id,
+                                      config_obj=self.conf,
+                                      topology_obj=self.topo)
+            this_layer_sim.run()
+
+            report_items = [this_layer_sim.get_compute_report_items(),
+                            this_layer_sim.get_bandwidth_report_items(),
+                            this_layer_sim.get_access_report_items()]
+            self.layer_report_items.append(report_items)
+            self.layer_trace_paths.append('')
+
+            if self.verbose:
+                print('\nLayer ' + str(layer_id) + ' (analytical)')
+                self.print_layer_stats(report_items)
+
+    #
+    def print_layer_stats(self, report_items):
+        """
+        Method to print the compute and bandwidth stats of a layer from its report items.
+        """
+        comp_items = report_items[0]
+        total_cycles = comp_items[0]
+        comp_cycles = comp_items[1]
+        stall_cycles = comp_items[2]
+        util = comp_items[3]
+        mapping_eff = comp_items[4]
+        print('Total cycles: ' + str(total_cycles))
+        print('Compute cycles: ' + str(comp_cycles))
+        print('Stall cycles: ' + str(stall_cycles))
+        print('Overall utilization: ' + "{:.2f}".format(util) +'%')
+        print('Mapping efficiency: ' + "{:.2f}".format(mapping_eff) +'%')
+
+        avg_bw_items = report_items[1]
+        if self.conf.sparsity_support is True:
+            avg_ifmap_sram_bw = avg_bw_items[0]
+            avg_filter_sram_bw = avg_bw_items[1]
+            avg_filter_metadata_sram_bw = avg_bw_items[2]
+            avg_ofmap_sram_bw = avg_bw_items[3]
+            avg_ifmap_dram_bw = avg_bw_items[4]
+            avg_filter_dram_bw = avg_bw_items[5]
+            avg_ofmap_dram_bw = avg_bw_items[6]
+        else:
+            avg_ifmap_sram_bw = avg_bw_items[0]
+            avg_filter_sram_bw = avg_bw_items[1]
+            avg_ofmap_sram_bw = avg_bw_items[2]
+            avg_ifmap_dram_bw = avg_bw_items[3]
+            avg_filter_dram_bw = avg_bw_items[4]
+            avg_ofmap_dram_bw = avg_bw_items[5]
+
+        print('Average IFMAP SRAM BW: ' + "{:.3f}".format(avg_ifmap_sram_bw) + \
+              ' words/cycle')
+        print('Average Filter SRAM BW: ' + "{:.3f}".format(avg_filter_sram_bw) + \
+              ' words/cycle')
+        if self.conf.sparsity_support is True:
+            print('Average Filter Metadata SRAM BW: ' + \
+                  "{:.3f}".format(avg_filter_metadata_sram_bw) + ' words/cycle')
+        print('Average OFMAP SRAM BW: ' + "{:.3f}".format(avg_ofmap_sram_bw) + \
+              ' words/cycle')
+        print('Average IFMAP DRAM BW: ' + "{:.3f}".format(avg_ifmap_dram_bw) + \
+              ' words/cycle')
+        print('Average Filter DRAM BW: ' + "{:.3f}".format(avg_filter_dram_bw) + \
+              ' words/cycle')
+        print('Average OFMAP DRAM BW: ' + "{:.3f}".format(avg_ofmap_dram_bw) + \
+              ' words/cycle')
 
     #
     def generate_reports(self):
         """
         Method to generate the report files for scalesim run if the runs are already completed. For
-        each layer, this method collects the report data from single_layer_sim objects and then
+        each layer, this method takes the report data collected from the layer runs and then
         prints them out into COMPUTE_REPORT.csv, BANDWIDTH_REPORT.csv, DETAILED_ACCESS_REPORT.csv
         and SPARSE_REPORT.csv files.
         """
@@ -207,28 +459,27 @@ class simulator:
             header += '\n'
             sparse_report.write(header)
 
-        for lid in range(len(self.single_layer_sim_object_list)):
-            single_layer_obj = self.single_layer_sim_object_list[lid]
-            compute_report_items_this_layer = single_layer_obj.get_compute_report_items()
+        for lid in range(len(self.layer_report_items)):
+            compute_report_items_this_layer, bandwidth_report_items_this_layer, \
+                detail_report_items_this_layer, sparse_report_items_this_layer \
+                = self.layer_report_items[lid]
+
             log = str(lid) +', '
             log += ', '.join([str(x) for x in compute_report_items_this_layer])
             log += ',\n'
             compute_report.write(log)
 
-            bandwidth_report_items_this_layer = single_layer_obj.get_bandwidth_report_items()
             log = str(lid) + ', '
             log += ', '.join([str(x) for x in bandwidth_report_items_this_layer])
             log += ',\n'
             bandwidth_report.write(log)
 
-            detail_report_items_this_layer = single_layer_obj.get_detail_report_items()
             log = str(lid) + ', '
             log += ', '.join([str(x) for x in detail_report_items_this_layer])
             log += ',\n'
             detail_report.write(log)
 
             if self.conf.sparsity_support is True:
-                sparse_report_items_this_layer = single_layer_obj.get_sparse_report_items()
                 log = str(lid) + ', ' + self.conf.sparsity_representation + ', '
                 log += ', '.join([str(x) for x in sparse_report_items_this_layer])
                 log += ',\n'
@@ -240,6 +491,45 @@ class simulator:
         if self.conf.sparsity_support is True:
             sparse_report.close()
 
+    #
+    def generate_analytical_reports(self):
+        """
+        Method to generate the report files for an analytical run. COMPUTE_REPORT.csv and
+        BANDWIDTH_REPORT.csv have the same columns as in the full simulation, the SRAM and the
+        compulsory DRAM access counts are written to ACCESS_COUNT_REPORT.csv.
+        """
+        assert self.all_layer_run_done, 'Layer runs are not done yet'
+
+        compute_report_name = self.top_path + '/COMPUTE_REPORT.csv'
+        compute_report = open(compute_report_name, 'w')
+        header = ('LayerID, Total Cycles (incl. prefetch), Total Cycles, Stall Cycles, Overall Util %, Mapping Efficiency %,'
+                  ' Compute Util %,\n')
+        compute_report.write(header)
+
+        bandwidth_report_name = self.top_path + '/BANDWIDTH_REPORT.csv'
+        bandwidth_report = open(bandwidth_report_name, 'w')
+        header = 'LayerID, Avg IFMAP SRAM BW, Avg FILTER SRAM BW, Avg OFMAP SRAM BW, '
+        header += 'Avg IFMAP DRAM BW, Avg FILTER DRAM BW, Avg OFMAP DRAM BW,\n'
+        bandwidth_report.write(header)
+
+        access_report_name = self.top_path + '/ACCESS_COUNT_REPORT.csv'
+        access_report = open(access_report_name, 'w')
+        header = 'LayerID, SRAM IFMAP Reads, SRAM Filter Reads, SRAM OFMAP Writes, '
+        header += 'DRAM IFMAP Reads, DRAM Filter Reads, DRAM OFMAP Writes,\n'
+        access_report.write(header)
+
+        for lid in range(len(self.layer_report_items)):
+            for report, items in zip([compute_report, bandwidth_report, access_report],
+                                     self.layer_report_items[lid]):
+                log = str(lid) + ', '
+                log += ', '.join([str(x) for x in items])
+                log += ',\n'
+                report.write(log)
+
+        compute_report.close()
+        bandwidth_report.close()
+        access_report.close()
+
     #
     def get_total_cycles(self):
         """
@@ -249,8 +539,8 @@ class simulator:
         assert self.all_layer_run_done, 'Layer runs are not done yet'
 
         total_cycles = 0
-        for layer_obj in self.single_layer_sim_object_list:
-            cycles_this_layer = int(layer_obj.get_compute_report_items[0])
+        for report_items in self.layer_report_items:
+            cycles_this_layer = int(report_items[0][0])
             total_cycles += cycles_this_layer
 
         return total_cycles
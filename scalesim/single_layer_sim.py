@@ -16,6 +16,9 @@ from scalesim.compute.systolic_compute_os import systolic_compute_os
 from scalesim.compute.systolic_compute_ws import systolic_compute_ws
 from scalesim.compute.systolic_compute_is import systolic_compute_is
 from scalesim.memory.double_buffered_scratchpad_mem import double_buffered_scratchpad as mem_dbsp
+from scalesim.memory.ramulator_bridge import ramulator_bridge
+from scalesim.memory.dram_model import dram_model
+from scalesim.utilities.trace_io import get_trace_extension
 
 class single_layer_sim:
     """
@@ -93,6 +96,9 @@ class single_layer_sim:
         self.ofmap_dram_stop_cycle = 0
         self.ofmap_dram_writes = 0
 
+        # Directory the traces are saved to, needed before the run to stream the SRAM traces
+        self.trace_top_path = ''
+
         self.params_set_flag = False
         self.memory_system_ready_flag = False
         self.runs_ready = False
@@ -194,14 +200,21 @@ class single_layer_sim:
         # 1. Setup and the get the demand from compute system
 
         # 1.1 Get the operand matrices
-        _, ifmap_op_mat = self.op_mat_obj.get_ifmap_matrix()
-        _, filter_op_mat = self.op_mat_obj.get_filter_matrix()
-        _, ofmap_op_mat = self.op_mat_obj.get_ofmap_matrix()
+        # Without sparsity the compute system only slices a fold at a time, so the operands are
+        # generated tile by tile instead of being held in full
+        if self.config.sparsity_support:
+            _, ifmap_op_mat = self.op_mat_obj.get_ifmap_matrix()
+            _, filter_op_mat = self.op_mat_obj.get_filter_matrix()
+            _, ofmap_op_mat = self.op_mat_obj.get_ofmap_matrix()
+        else:
+            ifmap_op_mat, filter_op_mat, ofmap_op_mat = \
+                self.op_mat_obj.get_tiled_operand_matrices()
 
         # 1.2 Calculate the storage occupied by filter and its metadata
         self.calculate_filter_metadata_storage(filter_op_mat)
         self.num_compute = self.topo.get_layer_num_ofmap_px(self.layer_id) \
-                           * self.topo.get_layer_window_size(self.layer_id)
+                           * self.topo.get_layer_window_size(self.layer_id) \
+                           * self.config.get_batch_size()
 
         # 1.3 Get the prefetch matrices for both operands
         if self.dataflow == 'ws':
@@ -227,12 +240,38 @@ class single_layer_sim:
             ifmap_prefetch_mat = self.op_mat_obj.get_ifmap_prefetch_matrix_custom_layout()
         if self.using_filter_custom_layout:
             filter_prefetch_mat = self.op_mat_obj.get_filter_prefetch_matrix_custom_layout()
-    
-        ifmap_demand_mat, filter_demand_mat, ofmap_demand_mat = self.compute_system.get_demand_matrices()
+
         #print('DEBUG: Compute operations done')
         # 2. Setup the memory system and run the demands through it to find any memory bottleneck and generate traces
+        use_dram_latencies = (self.config.get_ramulator_bridge() or self.config.get_dram_model()) \
+                             and not self.memory_system_ready_flag
+        if use_dram_latencies and not self.config.use_user_dram_bandwidth():
+            print("WARNING: The Ramulator bridge and the DRAM model need the USER interface "
+                  "bandwidth, running without them")
+            use_dram_latencies = False
+
+        if use_dram_latencies:
+            # Get the DRAM requests from a run with no DRAM stalls, simulate them with Ramulator
+            # or the DRAM model and run the memory system again with the latency of each request
+            self.run_memory_system(ifmap_prefetch_mat, filter_prefetch_mat,
+                                   stream_sram_traces=False)
+            dram_latencies = self.get_dram_latencies()
+
+            self.memory_system = mem_dbsp()
+            self.run_memory_system(ifmap_prefetch_mat, filter_prefetch_mat,
+                                   dram_latencies=dram_latencies)
+        else:
+            self.run_memory_system(ifmap_prefetch_mat, filter_prefetch_mat)
 
+        self.runs_ready = True
 
+    #
+    def run_memory_system(self, ifmap_prefetch_mat, filter_prefetch_mat, dram_latencies=None,
+                          stream_sram_traces=True):
+        """
+        Method to setup the memory system and service the demands of the compute system. The DRAM
+        latencies of the request lines can be given, eg. by the Ramulator bridge or the DRAM model.
+        """
         # 2.1 Setup the memory system if it was not setup externally
         if not self.memory_system_ready_flag:
             word_size = 1           # bytes, this can be incorporated in the config file
@@ -281,47 +320,118 @@ class single_layer_sim:
                     using_filter_custom_layout=self.using_filter_custom_layout,
                     estimate_bandwidth_mode=estimate_bandwidth_mode,
                     config=self.config,
-                    topo=self.topo
+                    topo=self.topo,
+                    dram_latencies=dram_latencies
             )
 
-        # 2.2 Install the prefetch matrices to the read buffers to finish setup
+        # 2.2 Stream the SRAM traces to disk while servicing the requests if asked for
+        trace_chunk_rows = self.config.get_trace_chunk_rows()
+        if stream_sram_traces and trace_chunk_rows > 0 and not self.trace_top_path == '':
+            ifmap_sram_filename, filter_sram_filename, ofmap_sram_filename, _, _, _ = \
+                self.get_trace_filenames(self.trace_top_path)
+            self.memory_system.set_sram_trace_streaming(ifmap_sram_filename,
+                                                        filter_sram_filename,
+                                                        ofmap_sram_filename,
+                                                        trace_format=self.config.get_trace_format(),
+                                                        chunk_rows=trace_chunk_rows)
+
+        # 2.3 Install the prefetch matrices to the read buffers to finish setup
         if self.config.use_user_dram_bandwidth() :
             self.memory_system.set_read_buf_prefetch_matrices(
                                                         ifmap_prefetch_mat=ifmap_prefetch_mat,
                                                         filter_prefetch_mat=filter_prefetch_mat
                                                              )
-        self.memory_system.service_memory_requests(ifmap_demand_mat,
-                                                    filter_demand_mat,
-                                                    ofmap_demand_mat)
 
-        self.runs_ready = True
+        # 2.4 Generate the demands one fold at a time and service them as they come, so that only
+        #     the fold being serviced is held in memory
+        self.memory_system.service_demand_folds(
+                                    demand_folds=self.compute_system.iter_demand_folds(),
+                                    num_rows=self.compute_system.get_num_demand_rows())
 
-    # This will write the traces
-    def save_traces(self, top_path):
+    #
+    def get_dram_latencies(self):
         """
-        Method to save SRAM and DRAM traces for ifmap, filter and ofmap matrices.
+        Method to simulate the DRAM requests of the memory system with the DRAM model or Ramulator
+        and get the latencies of the ifmap, filter and ofmap request lines. The Ramulator stats are
+        saved with the traces of the layer if the traces are saved.
         """
-        assert self.params_set_flag, 'Parameters are not set'
+        ifmap_dram_trace, filter_dram_trace, ofmap_dram_trace = \
+            self.memory_system.get_dram_trace_matrices()
+
+        if self.config.get_dram_model():
+            model = dram_model()
+            model.set_params(**self.config.get_dram_model_params())
+            return model.get_dram_latencies(ifmap_dram_trace, filter_dram_trace, ofmap_dram_trace)
+
+        stats_filename = ''
+        if not self.trace_top_path == '':
+            layer_dir = os.path.dirname(self.get_trace_filenames(self.trace_top_path)[3])
+            stats_filename = layer_dir + '/RAMULATOR_STATS.txt'
+
+        ramulator_path, ramulator_config = self.config.get_ramulator_paths()
+        bridge = ramulator_bridge()
+        bridge.set_params(ramulator_path=ramulator_path,
+                          ramulator_config=ramulator_config,
+                          stats_filename=stats_filename)
+
+        return bridge.get_dram_latencies(ifmap_dram_trace, filter_dram_trace, ofmap_dram_trace)
 
+    #
+    def set_trace_path(self, top_path):
+        """
+        Method to set the directory the traces are saved to. This is needed before run() only when
+        the SRAM traces are streamed to disk or the Ramulator stats are saved.
+        """
+        self.trace_top_path = top_path
+
+    #
+    def get_trace_filenames(self, top_path):
+        """
+        Method to get the paths of the ifmap, filter and ofmap SRAM traces followed by the paths of
+        the DRAM traces, creating the layer directory if needed.
+        """
         dir_name = top_path + '/layer' + str(self.layer_id)
+        # A link to the traces of an identical layer, left by an earlier run, is not written into
+        if os.path.islink(dir_name):
+            os.remove(dir_name)
         if not os.path.isdir(dir_name):
             cmd = 'mkdir ' + dir_name
             os.system(cmd)
 
-        ifmap_sram_filename = dir_name +  '/IFMAP_SRAM_TRACE.csv'
-        filter_sram_filename = dir_name + '/FILTER_SRAM_TRACE.csv'
-        ofmap_sram_filename = dir_name +  '/OFMAP_SRAM_TRACE.csv'
+        ext = get_trace_extension(self.config.get_trace_format())
+
+        ifmap_sram_filename = dir_name +  '/IFMAP_SRAM_TRACE' + ext
+        filter_sram_filename = dir_name + '/FILTER_SRAM_TRACE' + ext
+        ofmap_sram_filename = dir_name +  '/OFMAP_SRAM_TRACE' + ext
+
+        ifmap_dram_filename = dir_name +  '/IFMAP_DRAM_TRACE' + ext
+        filter_dram_filename = dir_name + '/FILTER_DRAM_TRACE' + ext
+        ofmap_dram_filename = dir_name +  '/OFMAP_DRAM_TRACE' + ext
+
+        return ifmap_sram_filename, filter_sram_filename, ofmap_sram_filename, \
+               ifmap_dram_filename, filter_dram_filename, ofmap_dram_filename
+
+    # This will write the traces
+    def save_traces(self, top_path):
+        """
+        Method to save SRAM and DRAM traces for ifmap, filter and ofmap matrices. The SRAM traces
+        are skipped if they were already streamed to disk during the run.
+        """
+        assert self.params_set_flag, 'Parameters are not set'
+
+        trace_format = self.config.get_trace_format()
+        ifmap_sram_filename, filter_sram_filename, ofmap_sram_filename, \
+            ifmap_dram_filename, filter_dram_filename, ofmap_dram_filename = \
+            self.get_trace_filenames(top_path)
 
-        ifmap_dram_filename = dir_name +  '/IFMAP_DRAM_TRACE.csv'
-        filter_dram_filename = dir_name + '/FILTER_DRAM_TRACE.csv'
-        ofmap_dram_filename = dir_name +  '/OFMAP_DRAM_TRACE.csv'
+        if not self.memory_system.is_sram_trace_streamed():
+            self.memory_system.print_ifmap_sram_trace(ifmap_sram_filename, trace_format)
+            self.memory_system.print_filter_sram_trace(filter_sram_filename, trace_format)
+            self.memory_system.print_ofmap_sram_trace(ofmap_sram_filename, trace_format)
 
-        self.memory_system.print_ifmap_sram_trace(ifmap_sram_filename)
-        self.memory_system.print_ifmap_dram_trace(ifmap_dram_filename)
-        self.memory_system.print_filter_sram_trace(filter_sram_filename)
-        self.memory_system.print_filter_dram_trace(filter_dram_filename)
-        self.memory_system.print_ofmap_sram_trace(ofmap_sram_filename)
-        self.memory_system.print_ofmap_dram_trace(ofmap_dram_filename)
+        self.memory_system.print_ifmap_dram_trace(ifmap_dram_filename, trace_format)
+        self.memory_system.print_filter_dram_trace(filter_dram_filename, trace_format)
+        self.memory_system.print_ofmap_dram_trace(ofmap_dram_filename, trace_format)
 
     #
     def calc_report_data(self):
@@ -432,12 +542,19 @@ class single_layer_sim:
         if not self.report_items_ready:
             self.calc_report_data()
 
-        items = [self.ifmap_sram_start_cycle, self.ifmap_sram_stop_cycle, self.ifmap_sram_reads]
-        items += [self.filter_sram_start_cycle, self.filter_sram_stop_cycle, self.filter_sram_reads]
-        items += [self.ofmap_sram_start_cycle, self.ofmap_sram_stop_cycle, self.ofmap_sram_writes]
-        items += [self.ifmap_dram_start_cycle, self.ifmap_dram_stop_cycle, self.ifmap_dram_reads]
-        items += [self.filter_dram_start_cycle, self.filter_dram_stop_cycle, self.filter_dram_reads]
-        items += [self.ofmap_dram_start_cycle, self.ofmap_dram_stop_cycle, self.ofmap_dram_writes]
+        # The start and stop cycles are reported as floats, as they always have been
+        items = [float(self.ifmap_sram_start_cycle), float(self.ifmap_sram_stop_cycle),
+                 self.ifmap_sram_reads]
+        items += [float(self.filter_sram_start_cycle), float(self.filter_sram_stop_cycle),
+                  self.filter_sram_reads]
+        items += [float(self.ofmap_sram_start_cycle), float(self.ofmap_sram_stop_cycle),
+                  self.ofmap_sram_writes]
+        items += [float(self.ifmap_dram_start_cycle), float(self.ifmap_dram_stop_cycle),
+                  self.ifmap_dram_reads]
+        items += [float(self.filter_dram_start_cycle), float(self.filter_dram_stop_cycle),
+                  self.filter_dram_reads]
+        items += [float(self.ofmap_dram_start_cycle), float(self.ofmap_dram_stop_cycle),
+                  self.ofmap_dram_writes]
 
         return items
 
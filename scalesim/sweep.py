@@ -0,0 +1,505 @@
+"""
+This file contains the 'sweep' class which runs a design space sweep over the architecture
+parameters of a scale_config. The topology is parsed once and shared with all the worker
+processes, and the stats of every layer at every design point are streamed into a single table.
+"""
+
+import os
+import csv
+import copy
+import random
+import shutil
+import hashlib
+import tempfile
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scalesim.scale_config import scale_config as cfg
+from scalesim.topology_utils import topologies as topo
+from scalesim.layout_utils import layouts as layout
+from scalesim.simulator import run_single_layer, valid_sim_modes
+from scalesim.analytical_layer_sim import analytical_layer_sim
+from scalesim.utilities.layer_cache import config_fields_not_in_key
+
+
+# Parameters which can be swept, named as in the config file
+valid_sweep_params = ['ArrayHeight', 'ArrayWidth',
+                      'IfmapSramSzkB', 'FilterSramSzkB', 'OfmapSramSzkB',
+                      'Dataflow', 'Bandwidth', 'BatchSize']
+
+report_columns = ['LayerID', 'LayerName',
+                  'Total Cycles (incl. prefetch)', 'Total Cycles', 'Stall Cycles',
+                  'Overall Util %', 'Mapping Efficiency %', 'Compute Util %',
+                  'Avg IFMAP SRAM BW', 'Avg FILTER SRAM BW', 'Avg OFMAP SRAM BW',
+                  'Avg IFMAP DRAM BW', 'Avg FILTER DRAM BW', 'Avg OFMAP DRAM BW',
+                  'SRAM IFMAP Reads', 'SRAM Filter Reads', 'SRAM OFMAP Writes',
+                  'DRAM IFMAP Reads', 'DRAM Filter Reads', 'DRAM OFMAP Writes']
+
+# Inputs shared by all the points run in a process, set once per worker by init_worker()
+worker_inputs = {}
+
+
+#
+def parse_param_value(name, value):
+    """
+    Function to convert a parameter value given as a string to the type used in the config.
+    Bandwidth is either an integer (USER bandwidth mode) or CALC.
+    """
+    value = str(value).strip()
+    if name == 'Dataflow':
+        return value.lower()
+    if name == 'Bandwidth' and value.upper() == 'CALC':
+        return 'CALC'
+    return int(value)
+
+
+#
+def get_point_id(point):
+    """
+    Function to get the string which identifies a design point, used to resume a sweep.
+    """
+    return ';'.join([name + '=' + str(value) for name, value in point.items()])
+
+
+#
+def get_sweep_fingerprint(config_obj, topo_obj, layout_obj, mode):
+    """
+    Function to get a hash of the inputs which the results of a sweep depend on besides the swept
+    parameters: the base config values, the topology, the layouts when a custom layout is used,
+    and the simulation mode. A sweep is only resumed from results with the same fingerprint.
+    """
+    config_items = sorted([(name, value) for name, value in vars(config_obj).items()
+                           if name not in config_fields_not_in_key])
+
+    layout_arrays = []
+    if config_obj.using_ifmap_custom_layout or config_obj.using_filter_custom_layout:
+        layout_arrays = layout_obj.layout_arrays
+
+    key_str = repr((config_items, topo_obj.topo_arrays, layout_arrays, mode))
+    return hashlib.sha256(key_str.encode('utf-8')).hexdigest()
+
+
+#
+def apply_point(config_obj, point):
+    """
+    Function to set the parameters of a design point on a config object.
+    """
+    arr_rows, arr_cols = config_obj.get_array_dims()
+    arr_rows = point.get('ArrayHeight', arr_rows)
+    arr_cols = point.get('ArrayWidth', arr_cols)
+    config_obj.set_arr_dims(rows=arr_rows, cols=arr_cols)
+
+    ifmap_kb, filter_kb, ofmap_kb = config_obj.get_mem_sizes()
+    config_obj.set_buffer_sizes_kb(ifmap_size_kb=point.get('IfmapSramSzkB', ifmap_kb),
+                                   filter_size_kb=point.get('FilterSramSzkB', filter_kb),
+                                   ofmap_size_kb=point.get('OfmapSramSzkB', ofmap_kb))
+
+    if 'Dataflow' in point:
+        config_obj.set_dataflow(point['Dataflow'])
+
+    if 'Bandwidth' in point:
+        if point['Bandwidth'] == 'CALC':
+            config_obj.set_bw_mode_to_calc()
+        else:
+            config_obj.set_bw_mode_to_user(bandwidths=[point['Bandwidth']])
+
+    if 'BatchSize' in point:
+        config_obj.set_batch_size(point['BatchSize'])
+
+
+#
+def init_worker(config_obj, topo_obj, layout_obj, mode):
+    """
+    Function to install the inputs shared by all the points in the current process. The worker
+    processes receive the parsed topology once instead of once per point.
+    """
+    worker_inputs['config'] = config_obj
+    worker_inputs['topo'] = topo_obj
+    worker_inputs['layout'] = layout_obj
+    worker_inputs['mode'] = mode
+
+
+#
+def run_point(point):
+    """
+    Function to run all the layers of the topology at a design point. Returns the point id and one
+    row of stats per layer.
+    """
+    config_obj = copy.deepcopy(worker_inputs['config'])
+    apply_point(config_obj, point)
+    topo_obj = worker_inputs['topo']
+
+    rows = []
+    for layer_id in range(topo_obj.get_num_layers()):
+        if worker_inputs['mode'] == 'analytical':
+            this_layer_sim = analytical_layer_sim()
+            this_layer_sim.set_params(layer_id=layer_id,
+                                      config_obj=config_obj,
+                                      topology_obj=topo_obj)
+            this_layer_sim.run()
+            access_items = this_layer_sim.get_access_report_items()
+            report_items = [this_layer_sim.get_compute_report_items(),
+                            this_layer_sim.get_bandwidth_report_items()]
+        else:
+            report_items, _ = run_single_layer(layer_id, config_obj, topo_obj,
+                                               worker_inputs['layout'], '', False)
+            # The access counts are every third item of the detail report
+            access_items = report_items[2][2::3]
+
+        row = [layer_id, topo_obj.get_layer_name(layer_id)]
+        row += report_items[0] + report_items[1] + access_items
+        rows.append(row)
+
+    return get_point_id(point), rows
+
+
+class sweep:
+    """
+    Class which runs a topology over a grid, or a random sample of a grid, of architecture
+    parameters. The results are appended to a CSV file as soon as a point completes, so an
+    interrupted sweep resumes from the points which are not in the file yet. The fingerprint of
+    the sweep inputs is kept in a file next to the results, and a sweep with different inputs
+    never resumes from them.
+    """
+    #
+    def __init__(self):
+        """
+        __init__ method
+        """
+        self.conf = cfg()
+        self.topo = topo()
+        self.layout = layout()
+
+        self.param_grid = {}
+        self.num_samples = 0
+        self.seed = 0
+        self.mode = 'full'
+        self.num_workers = 1
+        self.verbose = True
+
+        self.results_file = ''
+        self.results_csv = ''
+        self.fingerprint_file = ''
+        self.fingerprint = ''
+
+        self.points = []
+        self.params_set_flag = False
+
+    #
+    def set_params(self,
+                   config_obj=cfg(),
+                   topo_obj=topo(),
+                   layout_obj=layout(),
+                   param_grid={},
+                   num_samples=0,
+                   seed=0,
+                   results_file='./sweep_results.csv',
+                   mode='full',
+                   num_workers=1,
+                   verbosity=True
+                   ):
+        """
+        Method to set the sweep parameters. param_grid maps the swept config parameters to their
+        values. num_samples > 0 runs that many points sampled from the grid with the given seed,
+        otherwise all the points of the grid are run. A results file ending with .parquet is
+        written once the sweep is done, from the CSV file streamed next to it.
+        """
+        assert not config_obj.sparsity_support, 'Sweeps over sparse configs are not supported'
+        assert len(param_grid) > 0, 'No parameters to sweep'
+        for name, values in param_grid.items():
+            assert name in valid_sweep_params, 'Invalid sweep parameter: ' + str(name)
+            assert len(values) > 0, 'No values for sweep parameter: ' + str(name)
+        assert mode in valid_sim_modes, 'Invalid simulation mode: ' + str(mode)
+        assert num_workers > 0, 'Number of workers should be a positive integer'
+
+        self.conf = config_obj
+        self.topo = topo_obj
+        self.layout = layout_obj
+
+        self.param_grid = {name: [parse_param_value(name, x) for x in values]
+                           for name, values in param_grid.items()}
+        self.num_samples = num_samples
+        self.seed = seed
+        self.mode = mode
+        self.num_workers = num_workers
+        self.verbose = verbosity
+
+        self.results_file = results_file
+        self.results_csv = results_file
+        if os.path.splitext(results_file)[1] == '.parquet':
+            self.results_csv = os.path.splitext(results_file)[0] + '.csv'
+        self.fingerprint_file = os.path.splitext(self.results_csv)[0] + '.fingerprint'
+        self.fingerprint = get_sweep_fingerprint(config_obj, topo_obj, layout_obj, mode)
+
+        self.points = self.get_points()
+        self.params_set_flag = True
+
+    #
+    def get_points(self):
+        """
+        Method to get the design points to run. The sampled points are decoded from their index in
+        the grid, so that the grid is never enumerated, and are the same for the same seed.
+        """
+        names = list(self.param_grid.keys())
+        value_lists = [self.param_grid[name] for name in names]
+
+        if self.num_samples <= 0:
+            return [dict(zip(names, values)) for values in itertools.product(*value_lists)]
+
+        num_grid_points = 1
+        for values in value_lists:
+            num_grid_points *= len(values)
+        num_samples = min(self.num_samples, num_grid_points)
+
+        points = []
+        for point_idx in random.Random(self.seed).sample(range(num_grid_points), num_samples):
+            point_values = []
+            for values in reversed(value_lists):
+                point_values.append(values[point_idx % len(values)])
+                point_idx //= len(values)
+            points.append(dict(zip(names, reversed(point_values))))
+        return points
+
+    #
+    def get_header(self):
+        """
+        Method to get the column names of the results table.
+        """
+        return ['PointID'] + list(self.param_grid.keys()) + report_columns
+
+    #
+    def load_completed_points(self):
+        """
+        Method to read the points already in the results file, after checking that it was written
+        by a sweep with the same inputs. Points with missing layers, left by an interrupted run,
+        are dropped. The table without them is written in place of the results file, and the
+        original file is kept next to it.
+        """
+        if not os.path.isfile(self.results_csv):
+            return set()
+
+        with open(self.results_csv, 'r', newline='') as results:
+            rows = list(csv.reader(results))
+
+        header = self.get_header()
+        if len(rows) == 0 or rows[0] != header:
+            print('ERROR: sweep.py: Results file ' + self.results_csv
+                  + ' was written by a different sweep')
+            print('Exiting')
+            exit()
+
+        self.check_fingerprint()
+
+        rows_per_point = {}
+        for row in rows[1:]:
+            if len(row) == len(header):
+                rows_per_point.setdefault(row[0], []).append(row)
+
+        num_layers = self.topo.get_num_layers()
+        completed = {point_id: point_rows for point_id, point_rows in rows_per_point.items()
+                     if len(point_rows) == num_layers}
+
+        num_dropped_rows = len(rows) - 1 - sum([len(x) for x in completed.values()])
+        if num_dropped_rows > 0:
+            backup_file = self.get_backup_filename()
+            shutil.copyfile(self.results_csv, backup_file)
+
+            temp_fd, temp_filename = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.results_csv)), suffix='.tmp')
+            with os.fdopen(temp_fd, 'w', newline='') as results:
+                writer = csv.writer(results)
+                writer.writerow(header)
+                for point_rows in completed.values():
+                    writer.writerows(point_rows)
+            os.replace(temp_filename, self.results_csv)
+
+            print('WARNING: sweep.py: Dropped ' + str(num_dropped_rows)
+                  + ' rows of incomplete points from ' + self.results_csv
+                  + ', the original file is kept as ' + backup_file)
+
+        return set(completed.keys())
+
+    #
+    def check_fingerprint(self):
+        """
+        Method to exit when the results file was not written by a sweep with the same inputs.
+        """
+        fingerprint = ''
+        if os.path.isfile(self.fingerprint_file):
+            with open(self.fingerprint_file, 'r') as fingerprint_file:
+                fingerprint = fingerprint_file.read().strip()
+
+        if fingerprint == '':
+            print('ERROR: sweep.py: No fingerprint in ' + self.fingerprint_file
+                  + ', cannot check that ' + self.results_csv + ' was written by the same sweep')
+            print('Use another results file')
+            print('Exiting')
+            exit()
+
+        if fingerprint != self.fingerprint:
+            print('ERROR: sweep.py: Results file ' + self.results_csv
+                  + ' was written with a different config, topology, layout or mode')
+            print('Use another results file')
+            print('Exiting')
+            exit()
+
+    #
+    def get_backup_filename(self):
+        """
+        Method to get a file name, not used yet, to keep the original results file.
+        """
+        stem, extension = os.path.splitext(self.results_csv)
+        backup_file = stem + '.incomplete' + extension
+        backup_idx = 1
+        while os.path.exists(backup_file):
+            backup_file = stem + '.incomplete' + str(backup_idx) + extension
+            backup_idx += 1
+        return backup_file
+
+    #
+    def run(self):
+        """
+        Method to run all the design points not in the results file yet. The points are run in a
+        pool of worker processes when more than one worker is requested.
+        """
+        assert self.params_set_flag, 'Sweep parameters are not set'
+
+        completed = self.load_completed_points()
+        pending = [x for x in self.points if get_point_id(x) not in completed]
+
+        if self.verbose:
+            print('Sweep: ' + str(len(self.points)) + ' points, '
+                  + str(len(self.points) - len(pending)) + ' already done')
+
+        new_file = not os.path.isfile(self.results_csv)
+        if new_file:
+            with open(self.fingerprint_file, 'w') as fingerprint_file:
+                fingerprint_file.write(self.fingerprint + '\n')
+
+        with open(self.results_csv, 'a', newline='') as results:
+            writer = csv.writer(results)
+            if new_file:
+                writer.writerow(self.get_header())
+                results.flush()
+
+            if self.num_workers > 1 and len(pending) > 1:
+                num_workers = min(self.num_workers, len(pending))
+                with ProcessPoolExecutor(max_workers=num_workers,
+                                         initializer=init_worker,
+                                         initargs=(self.conf, self.topo, self.layout,
+                                                   self.mode)) as executor:
+                    futures = [executor.submit(run_point, x) for x in pending]
+                    for done_idx, this_future in enumerate(as_completed(futures)):
+                        self.write_point(writer, results, this_future.result(), done_idx,
+                                         len(pending))
+            else:
+                init_worker(self.conf, self.topo, self.layout, self.mode)
+                for done_idx, point in enumerate(pending):
+                    self.write_point(writer, results, run_point(point), done_idx, len(pending))
+
+        if self.results_file != self.results_csv:
+            self.write_parquet()
+
+    #
+    def write_point(self, writer, results, point_result, done_idx, num_pending):
+        """
+        Method to append the rows of a completed point to the results file.
+        """
+        point_id, rows = point_result
+        point = dict(x.split('=') for x in point_id.split(';'))
+        param_values = [point[name] for name in self.param_grid.keys()]
+
+        writer.writerows([[point_id] + param_values + row for row in rows])
+        results.flush()
+
+        if self.verbose:
+            print('Point ' + str(done_idx + 1) + '/' + str(num_pending) + ' done: ' + point_id)
+
+    #
+    def write_parquet(self):
+        """
+        Method to convert the results to parquet. The CSV file is kept to resume the sweep.
+        """
+        import pandas as pd
+
+        results_df = pd.read_csv(self.results_csv)
+        try:
+            results_df.to_parquet(self.results_file, index=False)
+        except ImportError:
+            print('WARNING: Writing parquet needs pyarrow or fastparquet. Results are in '
+                  + self.results_csv)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', metavar='Topology file', type=str,
+                        default="./topologies/conv_nets/test.csv",
+                        help="Path to the topology file"
+                        )
+    parser.add_argument('-l', metavar='Layout file', type=str,
+                        default="./layouts/conv_nets/test.csv",
+                        help="Path to the layout file"
+                        )
+    parser.add_argument('-c', metavar='Config file', type=str,
+                        default="./configs/scale.cfg",
+                        help="Path to the base config file"
+                        )
+    parser.add_argument('-i', metavar='input type', type=str,
+                        default="conv",
+                        help="Type of input topology, gemm: MNK, conv: conv"
+                        )
+    parser.add_argument('-g', '--grid', metavar='NAME=V1,V2,...', type=str, action='append',
+                        required=True,
+                        help="Values of a swept parameter, repeat for each parameter. "
+                             "Parameters: " + ', '.join(valid_sweep_params)
+                        )
+    parser.add_argument('-n', metavar='num samples', type=int,
+                        default=0,
+                        help="Number of points sampled from the grid, 0 runs the entire grid"
+                        )
+    parser.add_argument('--seed', metavar='seed', type=int,
+                        default=0,
+                        help="Seed used to sample the points"
+                        )
+    parser.add_argument('-o', metavar='results file', type=str,
+                        default="./sweep_results.csv",
+                        help="Path to the results table (.csv or .parquet)"
+                        )
+    parser.add_argument('-w', metavar='num workers', type=int,
+                        default=1,
+                        help="Number of worker processes to run the points in parallel"
+                        )
+    parser.add_argument('-m', '--mode', metavar='sim mode', type=str,
+                        default="full", choices=valid_sim_modes,
+                        help="full: cycle level simulation, analytical: closed form estimates"
+                        )
+    args = parser.parse_args()
+
+    grid = {}
+    for grid_arg in args.grid:
+        param_name, param_values = grid_arg.split('=')
+        grid[param_name.strip()] = param_values.split(',')
+
+    gemm_input = args.i == 'gemm'
+    base_config = cfg()
+    base_config.read_conf_file(args.c)
+    base_config.set_topology_file(args.t)
+    base_config.set_layout_file(args.l)
+
+    base_topo = topo()
+    base_topo.load_arrays(topofile=args.t, mnk_inputs=gemm_input)
+    base_layout = layout()
+    base_layout.load_arrays(layoutfile=args.l, mnk_inputs=gemm_input)
+
+    s = sweep()
+    s.set_params(config_obj=base_config,
+                 topo_obj=base_topo,
+                 layout_obj=base_layout,
+                 param_grid=grid,
+                 num_samples=args.n,
+                 seed=args.seed,
+                 results_file=args.o,
+                 mode=args.mode,
+                 num_workers=args.w)
+    s.run()
@@ -0,0 +1,176 @@
+"""
+This file contains the 'layer_cache' class, an on disk cache of the report items of simulated
+layers. The entries are keyed by a hash of the layer shape, the config fields which affect the
+simulation and the simulator sources, so identical layers are simulated once and reused across
+layers, runs and sweeps of the same simulator version.
+"""
+
+import os
+import pickle
+import hashlib
+import tempfile
+from functools import lru_cache
+
+
+# Bump when the format of the entries changes. Changes in the simulator sources change the keys
+cache_format_version = 2
+
+# Config fields which do not change the report items of a layer
+config_fields_not_in_key = ['run_name', 'topofile', 'layoutfile', 'valid_conf_flag',
+                            'trace_format', 'trace_chunk_rows',
+                            'use_layer_cache', 'layer_cache_dir', 'layer_cache_size_mb',
+                            'dedup_layers']
+
+
+#
+def get_default_cache_dir():
+    """
+    Method to get the default cache directory, ~/.cache/scalesim unless XDG_CACHE_HOME is set.
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME', '')
+    if cache_home == '':
+        cache_home = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'scalesim')
+
+
+#
+@lru_cache(maxsize=None)
+def get_simulator_version():
+    """
+    Method to get a hash of the sources of the scalesim package. It is part of the layer keys, so
+    the entries written by another version of the simulator are never used. Computed once per
+    process.
+    """
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    source_hash = hashlib.sha256()
+    for dir_path, dir_names, file_names in os.walk(package_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if not file_name.endswith('.py'):
+                continue
+            file_path = os.path.join(dir_path, file_name)
+            source_hash.update(os.path.relpath(file_path, package_dir).encode('utf-8'))
+            with open(file_path, 'rb') as source_file:
+                source_hash.update(source_file.read())
+    return source_hash.hexdigest()
+
+
+#
+def get_layer_signature(config_obj, topo_obj, layout_obj, layer_id):
+    """
+    Method to get the parameters which define the simulation of a layer in a given config: the
+    layer parameters without the name, and the layout of the layer when a custom layout is used.
+    """
+    layer_params = tuple([int(x) for x in topo_obj.get_layer_params(layer_id)[1:]])
+
+    layer_layout = ()
+    if config_obj.using_ifmap_custom_layout or config_obj.using_filter_custom_layout:
+        layer_layout = tuple(layout_obj.layout_arrays[layer_id][1:])
+
+    return layer_params, layer_layout
+
+
+class layer_cache:
+    """
+    Class which stores the report items of each simulated layer in a file named by the layer key.
+    The access time of an entry is kept in its modification time, and the least recently used
+    entries are evicted once the cache grows beyond its size limit.
+    """
+    #
+    def __init__(self, cache_dir='', max_size_mb=512):
+        """
+        __init__ method. Creates the cache directory if needed.
+        """
+        assert max_size_mb > 0, 'Cache size should be positive'
+
+        if cache_dir == '':
+            cache_dir = get_default_cache_dir()
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    #
+    @staticmethod
+    def get_layer_key(config_obj, topo_obj, layout_obj, layer_id):
+        """
+        Method to get the key of a layer, a hash of its parameters without the name, of the config
+        fields which affect the simulation, of its layout when a custom layout is used, and of the
+        simulator sources.
+        """
+        layer_signature = get_layer_signature(config_obj, topo_obj, layout_obj, layer_id)
+        config_items = sorted([(name, value) for name, value in vars(config_obj).items()
+                               if name not in config_fields_not_in_key])
+
+        key_str = repr((cache_format_version, get_simulator_version(), layer_signature,
+                        config_items))
+        return hashlib.sha256(key_str.encode('utf-8')).hexdigest()
+
+    #
+    def get_entry_filename(self, key):
+        """
+        Method to get the file holding the entry of a key.
+        """
+        return os.path.join(self.cache_dir, key + '.pkl')
+
+    #
+    def get(self, key):
+        """
+        Method to get the report items stored for a key. Returns None on a miss.
+        """
+        filename = self.get_entry_filename(key)
+        try:
+            with open(filename, 'rb') as entry_file:
+                report_items = pickle.load(entry_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # Mark the entry as the most recently used
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+        return report_items
+
+    #
+    def put(self, key, report_items):
+        """
+        Method to store the report items of a key. The entry is written to a temporary file and
+        moved in place, so concurrent runs never read a partial entry.
+        """
+        temp_fd, temp_filename = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(temp_fd, 'wb') as entry_file:
+            pickle.dump(report_items, entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_filename, self.get_entry_filename(key))
+
+        self.evict()
+
+    #
+    def evict(self):
+        """
+        Method to delete the least recently used entries until the cache fits in its size limit.
+        """
+        entries = []
+        total_size = 0
+        with os.scandir(self.cache_dir) as dir_entries:
+            for dir_entry in dir_entries:
+                if not dir_entry.name.endswith('.pkl'):
+                    continue
+                try:
+                    stat = dir_entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+                total_size += stat.st_size
+
+        if total_size <= self.max_size_bytes:
+            return
+
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            if total_size <= self.max_size_bytes:
+                break
@@ -0,0 +1,219 @@
+"""
+This file contains the utility functions to write the SRAM and DRAM traces in the supported file
+formats and to read them back, so that downstream tools can consume the traces without parsing text.
+
+Supported formats:
+    csv: comma separated text, one row per cycle (default)
+    npy: a single 2D integer matrix, the first column holds the cycles
+    npz: compressed archive with the 'cycles' and 'addresses' arrays
+"""
+
+import os
+import shutil
+import tempfile
+import zipfile
+import numpy as np
+
+
+trace_extensions = {'csv': '.csv', 'npy': '.npy', 'npz': '.npz'}
+
+# Addresses are held as native int32, with -1 for no request, and are widened to int64 only when
+# the largest address does not fit. Cycles are held as int64.
+cycle_dtype = np.int64
+
+# The DRAM traces have always been written with the cycles and addresses as floats
+dram_trace_csv_fmt = '%.1f'
+
+
+#
+def get_trace_extension(trace_format='csv'):
+    """
+    Method to get the file extension used for the given trace format.
+    """
+    assert trace_format in trace_extensions, 'Invalid trace format: ' + str(trace_format)
+    return trace_extensions[trace_format]
+
+
+#
+def get_addr_dtype(max_addr):
+    """
+    Method to get the dtype of the addresses, int32 unless the largest address needs int64.
+    """
+    if max_addr <= np.iinfo(np.int32).max:
+        return np.int32
+    return np.int64
+
+
+#
+def get_min_int_dtype(matrix_np):
+    """
+    Method to get the narrowest of int32 and int64 which can hold all the entries of the matrix.
+    """
+    if matrix_np.size == 0:
+        return np.int32
+
+    int32_info = np.iinfo(np.int32)
+    if np.min(matrix_np) >= int32_info.min and np.max(matrix_np) <= int32_info.max:
+        return np.int32
+    return np.int64
+
+
+#
+def save_trace(filename, trace_matrix, trace_format='csv', csv_fmt='%i'):
+    """
+    Method to write a trace matrix to a file. The first column of the matrix holds the cycles and
+    the rest hold the addresses. The csv_fmt is only used for the csv format, the binary formats
+    store the entries as integers.
+    """
+    assert trace_format in trace_extensions, 'Invalid trace format: ' + str(trace_format)
+
+    if trace_format == 'csv':
+        np.savetxt(filename, trace_matrix, fmt=csv_fmt, delimiter=",")
+        return
+
+    trace_matrix = np.asarray(trace_matrix)
+    if trace_matrix.ndim == 1:
+        trace_matrix = trace_matrix.reshape((-1, 1))
+
+    if trace_format == 'npy':
+        out_matrix = trace_matrix.astype(get_min_int_dtype(trace_matrix))
+        np.save(filename, out_matrix)
+    else:
+        cycles = trace_matrix[:, 0].astype(np.int64)
+        addresses = trace_matrix[:, 1:]
+        addresses = addresses.astype(get_min_int_dtype(addresses))
+        np.savez_compressed(filename, cycles=cycles, addresses=addresses)
+
+
+#
+def load_trace(filename):
+    """
+    Method to read a trace file written in any of the supported formats. The format is inferred
+    from the file extension. Returns the trace as a 2D int64 matrix with the cycles in the first
+    column and the addresses in the rest.
+    """
+    extension = os.path.splitext(filename)[1]
+
+    if extension == trace_extensions['npy']:
+        trace_matrix = np.load(filename)
+    elif extension == trace_extensions['npz']:
+        with np.load(filename) as trace_archive:
+            cycles = trace_archive['cycles'].astype(np.int64)
+            addresses = trace_archive['addresses'].astype(np.int64)
+        trace_matrix = np.column_stack((cycles, addresses))
+    else:
+        trace_matrix = np.loadtxt(filename, delimiter=",", ndmin=2)
+
+    return trace_matrix.astype(np.int64)
+
+
+#
+def find_trace_file(filename_base):
+    """
+    Method to find the trace file written for the given path without an extension, checking the
+    supported formats in order. Returns an empty string if no trace file is found.
+    """
+    for extension in trace_extensions.values():
+        filename = filename_base + extension
+        if os.path.isfile(filename):
+            return filename
+    return ''
+
+
+class trace_writer:
+    """
+    Class which writes a trace to a file in chunks of rows, so that the complete trace matrix never
+    needs to be held in memory. The total number of rows is needed upfront to write the headers of
+    the binary formats. The npy format is written as an int64 matrix in this mode.
+    """
+    #
+    def __init__(self, filename, num_rows, num_addr_cols, trace_format='csv', csv_fmt='%i',
+                 addr_dtype=np.int64):
+        """
+        __init__ method. Opens the trace file for writing.
+        """
+        assert trace_format in trace_extensions, 'Invalid trace format: ' + str(trace_format)
+
+        self.filename = filename
+        self.num_rows = num_rows
+        self.num_addr_cols = num_addr_cols
+        self.trace_format = trace_format
+        self.csv_fmt = csv_fmt
+        self.addr_dtype = np.dtype(addr_dtype)
+
+        self.num_rows_written = 0
+
+        self.trace_file = None
+        self.trace_mmap = None
+        self.zip_file = None
+        self.addr_stream = None
+        self.cycles_file = None
+
+        if self.trace_format == 'csv':
+            self.trace_file = open(filename, 'w')
+        elif self.trace_format == 'npy':
+            self.trace_mmap = np.lib.format.open_memmap(filename, mode='w+', dtype=np.int64,
+                                                        shape=(num_rows, num_addr_cols + 1))
+        else:
+            # The addresses are compressed into the archive as they come, the cycles are spooled
+            # to a temporary file and added to the archive once all the rows are written
+            self.zip_file = zipfile.ZipFile(filename, mode='w', compression=zipfile.ZIP_DEFLATED,
+                                            allowZip64=True)
+            self.addr_stream = self.zip_file.open('addresses.npy', mode='w', force_zip64=True)
+            self.write_npy_header(self.addr_stream, self.addr_dtype, (num_rows, num_addr_cols))
+            self.cycles_file = tempfile.TemporaryFile()
+
+    #
+    @staticmethod
+    def write_npy_header(stream, dtype, shape):
+        """
+        Method to write the header of an npy array of the given dtype and shape to a stream.
+        """
+        header = {'descr': np.lib.format.dtype_to_descr(dtype),
+                  'fortran_order': False,
+                  'shape': shape}
+        np.lib.format.write_array_header_1_0(stream, header)
+
+    #
+    def write(self, cycles_np, addr_np):
+        """
+        Method to append rows to the trace. cycles_np is a column with the cycles and addr_np
+        holds the addresses requested in those cycles.
+        """
+        num_rows = addr_np.shape[0]
+        assert cycles_np.shape[0] == num_rows, 'Cycles and addresses do not match'
+        assert self.num_rows_written + num_rows <= self.num_rows, 'Trace has more rows than set'
+
+        if self.trace_format == 'csv':
+            np.savetxt(self.trace_file, np.concatenate((cycles_np, addr_np), axis=1),
+                       fmt=self.csv_fmt, delimiter=",")
+        elif self.trace_format == 'npy':
+            start = self.num_rows_written
+            self.trace_mmap[start:start + num_rows, 0] = cycles_np.reshape(-1)
+            self.trace_mmap[start:start + num_rows, 1:] = addr_np
+        else:
+            self.cycles_file.write(cycles_np.astype(np.int64).tobytes())
+            self.addr_stream.write(np.ascontiguousarray(addr_np, dtype=self.addr_dtype).tobytes())
+
+        self.num_rows_written += num_rows
+
+    #
+    def close(self):
+        """
+        Method to complete the trace file once all the rows are written.
+        """
+        assert self.num_rows_written == self.num_rows, 'Trace has fewer rows than set'
+
+        if self.trace_format == 'csv':
+            self.trace_file.close()
+        elif self.trace_format == 'npy':
+            self.trace_mmap.flush()
+            self.trace_mmap = None
+        else:
+            self.addr_stream.close()
+            with self.zip_file.open('cycles.npy', mode='w', force_zip64=True) as cycles_stream:
+                self.write_npy_header(cycles_stream, np.dtype(np.int64), (self.num_rows,))
+                self.cycles_file.seek(0)
+                shutil.copyfileobj(self.cycles_file, cycles_stream)
+            self.cycles_file.close()
+            self.zip_file.close()
@@ -0,0 +1,142 @@
+"""
+This script is a micro benchmark of the skew kernels in scalesim.compute.skew. The kernels are
+checked against the loop based implementations they replace and both are timed on the demands of
+a fold of a 256x256 array, along with skewing a stack of folds in one call.
+
+Example:
+    python3 scripts/benchmark_skew.py --array 256 --rows 1024 --folds 8
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scalesim.compute.skew import skew_matrix, skew_matrix_row_sparsity
+
+
+#
+def skew_matrix_loop(input_matrix_np):
+    """
+    Method with the column by column skew, used as the reference.
+    """
+    rows, cols = input_matrix_np.shape
+
+    out_matrix_np = np.full((rows + cols - 1, cols), -1, dtype=input_matrix_np.dtype)
+
+    for c in range(cols):
+        out_matrix_np[c:c + rows, c] = input_matrix_np[:, c]
+
+    return out_matrix_np
+
+
+#
+def skew_matrix_row_sparsity_loop(input_matrix, arr_row, block_size):
+    """
+    Method with the block by block row sparsity skew, used as the reference.
+    """
+    num_tiles = 2
+    num_cols = input_matrix.shape[1]
+    if num_cols < arr_row * num_tiles:
+        padding = arr_row * num_tiles - num_cols
+        input_matrix = np.pad(input_matrix, ((0, 0), (0, padding)), constant_values=-1)
+
+    blocks = []
+    for row in input_matrix:
+        row_blocks = [row[i:i+block_size] for i in range(0, len(row), block_size)]
+        blocks.append(row_blocks)
+
+    repeated_blocks = []
+    for block_row in blocks:
+        new_row = []
+        for block in block_row:
+            new_row.extend([block] * (block_size // num_tiles))
+        repeated_blocks.append(new_row)
+
+    output_matrix = []
+    num_block_rows = len(repeated_blocks)
+
+    for i in range(num_block_rows + arr_row - 1):
+        row = []
+        for j in range(len(repeated_blocks[0])):
+            block_row_idx = i - j
+            if 0 <= block_row_idx < num_block_rows:
+                row.append(repeated_blocks[block_row_idx][j])
+            else:
+                row.append([-1] * block_size)
+        row = np.concatenate(row)
+        output_matrix.append(row)
+
+    return np.array(output_matrix, dtype=input_matrix.dtype)
+
+
+#
+def time_call(func, repeats):
+    """
+    Method to get the best time in seconds of a number of calls to a function.
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+#
+def print_timing(name, loop_time, kernel_time):
+    """
+    Method to print the times of the reference and the kernel, and the speedup.
+    """
+    print(f'{name:<28} loop: {loop_time * 1e3:9.3f} ms   '
+          f'kernel: {kernel_time * 1e3:9.3f} ms   speedup: {loop_time / kernel_time:7.1f}x')
+
+
+#
+def main():
+    """
+    Method to check and time the skew kernels.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--array', type=int, default=256, help='Rows and columns of the array')
+    parser.add_argument('--rows', type=int, default=1024, help='Rows of demands per fold')
+    parser.add_argument('--folds', type=int, default=8, help='Folds in the stacked benchmark')
+    parser.add_argument('--block-size', type=int, default=4,
+                        help='Block size of the row wise sparse mapping')
+    parser.add_argument('--repeats', type=int, default=5, help='Calls timed per benchmark')
+    args = parser.parse_args()
+
+    arr = args.array
+    rng = np.random.default_rng(0)
+
+    fold_np = rng.integers(-1, 1 << 20, size=(args.rows, arr)).astype(np.int32)
+    folds_np = rng.integers(-1, 1 << 20, size=(args.folds, args.rows, arr)).astype(np.int32)
+    sparse_np = rng.integers(-1, 1 << 20, size=(args.rows, 2 * arr)).astype(np.int32)
+
+    # Check the kernels against the references
+    assert np.array_equal(skew_matrix(fold_np), skew_matrix_loop(fold_np))
+    stacked_out = skew_matrix(folds_np)
+    for fold_id in range(args.folds):
+        assert np.array_equal(stacked_out[fold_id], skew_matrix_loop(folds_np[fold_id]))
+    assert np.array_equal(skew_matrix_row_sparsity(sparse_np, arr, args.block_size),
+                          skew_matrix_row_sparsity_loop(sparse_np, arr, args.block_size))
+    print('Kernels match the references')
+
+    print_timing(f'skew_matrix {args.rows}x{arr}',
+                 time_call(lambda: skew_matrix_loop(fold_np), args.repeats),
+                 time_call(lambda: skew_matrix(fold_np), args.repeats))
+    print_timing(f'skew_matrix {args.folds} folds',
+                 time_call(lambda: [skew_matrix_loop(x) for x in folds_np], args.repeats),
+                 time_call(lambda: skew_matrix(folds_np), args.repeats))
+    print_timing(f'row sparsity {args.rows}x{2 * arr}',
+                 time_call(lambda: skew_matrix_row_sparsity_loop(sparse_np, arr,
+                                                                 args.block_size), 1),
+                 time_call(lambda: skew_matrix_row_sparsity(sparse_np, arr, args.block_size),
+                           args.repeats))
+
+
+if __name__ == '__main__':
+    main()
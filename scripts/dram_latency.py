@@ -1,19 +1,38 @@
-import numpy as np 
-import numba
+import numpy as np
 import pandas as pd
 import os
 import multiprocessing as mp
 import argparse
-from tqdm import tqdm
-
-mp.set_start_method('spawn',True)
 
 rootPath= os.getcwd()
 resultsPath = rootPath+"/results/"
 
+hexDigits = np.full(256, -1, dtype=np.int64)
+hexDigits[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(10)
+hexDigits[np.frombuffer(b'abcdef', dtype=np.uint8)] = np.arange(10, 16)
+hexDigits[np.frombuffer(b'ABCDEF', dtype=np.uint8)] = np.arange(10, 16)
+
+def parseHexAddresses(addressStrings):
+    """ Converts '0x<hex>' strings to integers, one column of hex digits at a time """
+    addressBytes = np.asarray(addressStrings, dtype='S')
+    if addressBytes.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64)
+    chars = addressBytes.view(np.uint8).reshape(addressBytes.shape[0], -1)
+    # The 'x' of the prefix and the padding after the shorter strings are not digits
+    digits = hexDigits[chars]
+    isDigit = digits >= 0
+    # Number of digits to the right of each one
+    places = np.cumsum(isDigit[:, ::-1], axis=1)[:, ::-1] - 1
+    addresses = np.zeros(addressBytes.shape[0], dtype=np.int64)
+    for col in range(chars.shape[1]):
+        valid = isDigit[:, col]
+        addresses[valid] += digits[valid, col] << (4 * places[valid, col])
+    return addresses
+
 class dram_latency():
     def __init__(self,
                 ramulatorFile='',
+                bw=10
                 ):
         self.ramulatorFile = ramulatorFile
         self.ifmapLatency  = []
@@ -23,145 +42,78 @@ class dram_latency():
         self.ofmapOffset   = 20000000
         self.metaOffset    = 30000000
         self.fakeOffset    = 40000000
-        self.bw = 10
-    
+        self.bw = bw
+
+    def readRamulatorOutput(self):
+        """ Returns the address, arrival and latency of the requests reported by Ramulator """
+        df = pd.read_csv(self.ramulatorFile, header=None, sep=' ', usecols=[0, 1, 2, 3],
+                         names=['type', 'address', 'arrive', 'depart'], dtype=str,
+                         on_bad_lines='skip')
+        # Only the 'RD: 0x<address> <arrive> <depart>' and 'WR: ...' lines are requests
+        df = df[df['type'].isin(['RD:', 'WR:'])]
+        address = parseHexAddresses(df['address'].to_numpy())
+        arrive = df['arrive'].to_numpy().astype(np.int64)
+        latency = df['depart'].to_numpy().astype(np.int64) - arrive
+        return address, arrive, latency
+
     def latencyExtraction(self, layerNo, topo,shaper):
         print("starting to read file " + str(self.ramulatorFile))
-        df = pd.read_csv(self.ramulatorFile,header=None,skipfooter=1,delimiter=' ',engine='python')
-        print("file read")
-        df = df.sort_values(2)
-        print("sorting")
-        latency = df[3]-df[2]
-        print("latency")
-        df[1] = df[1].str.replace('0x','')
-        df[1] = df[1].apply(lambda x: int(x,16))
-        count=0
-        flag=0
-        lastIndex = 'ifmap'
-        iterate=100000
-        print(df.shape[0])
-        while count < df.shape[0]:
-            endIndex = count+self.bw - 1
-            if count+self.bw > df.shape[0]:
-                endIndex = df.shape[0] - 1
-            if count > iterate:
-                print("Iteration {} of {}".format(count,df.shape[0]))
-                iterate+=100000
-#            k=count
-#            for i in range(count,count+self.bw):
-#                a= df[2][k]
-#                b=df[2][i]
-#                m = a<self.ofmapOffset
-#                n= b<self.ofmapOffset
-#                ifmapAddress = df[2][k] < self.filterOffset and df[2][i] < self.filterOffset
-#                filterAddress = df[2][k] < self.ofmapOffset and df[2][i] < self.ofmapOffset
-#                ofmapAddress = not df[2][k] < self.ofmapOffset and not df[2][i] < self.ofmapOffset
-#                if(ifmapAddress + filterAddress + ofmapAddress) == 0:
-#                    if counter == 0:
-#                        counter=1
-#                    else:
-#                        print("ERROR")
-#                        print(df[2][count:count+10])
-#                        print(k)
-#                        print(i)
-#                    k=i
-            addressList = df[1][count:endIndex].sort_values().to_list()
-            startAddress = addressList[0]
-            endAddress = addressList[-1]
-
-            if shaper == 1:
-                ifmapAddress =  startAddress < self.filterOffset
-                filterAddress = startAddress < self.ofmapOffset
-                ofmapAddress =  startAddress < self.metaOffset
-            else:
-                ifmapAddress =  (0 <= startAddress < self.filterOffset) and (0 <= endAddress < self.filterOffset)
-                filterAddress = (self.filterOffset <= startAddress < self.ofmapOffset) and (self.filterOffset <= endAddress < self.ofmapOffset)
-                ofmapAddress =  (self.ofmapOffset <= startAddress < self.metaOffset) and (self.ofmapOffset <= startAddress < self.metaOffset)
-                #ifmapAddress =  startAddress in range(0,self.filterOffset) and endAddress in range(0,self.filterOffset)
-                #filterAddress=  startAddress in range(self.filterOffset,self.ofmapOffset) and endAddress in range(self.filterOffset,self.ofmapOffset)
-                #ofmapAddress =  startAddress in range(self.ofmapOffset,self.metaOffset) and endAddress in range(self.ofmapOffset,self.metaOffset)
-
-            if shaper == 1:
-                #a=[]
-                #for i in range(count,count+self.bw):
-                #    a.append(df[2][i])
-
-                if ifmapAddress:
-                    self.ifmapLatency.append(np.amax(latency[count:count+self.bw]))
-                    lastIndex = 'ifmap'
-                elif filterAddress:
-                    self.filterLatency.append(np.amax(latency[count:count+self.bw]))   
-                    lastIndex = 'filter'
-
-                elif ofmapAddress:
-                    self.ofmapLatency.append(np.amax(latency[count:count+self.bw]))  
-                    lastIndex = 'ofmap' 
-                else:
-                    if lastIndex == 'ifmap':
-                        self.ifmapLatency.append(np.amax(latency[count:count+self.bw]))
-                    elif lastIndex == 'filter':
-                        self.filterLatency.append(np.amax(latency[count:count+self.bw]))  
-                    else:
-                        self.ofmapLatency.append(np.amax(latency[count:count+self.bw]))  
-                count+=self.bw
-            
-            else:
-                if ifmapAddress:
-                    self.ifmapLatency.append(np.amax(latency[count:count+self.bw]))
-                    count+=self.bw
-                    lastIndex = 'ifmap'
-                elif filterAddress:
-                    self.filterLatency.append(np.amax(latency[count:count+self.bw]))  
-                    count+=self.bw 
-                    lastIndex = 'filter'
-                elif ofmapAddress:
-                    self.ofmapLatency.append(np.amax(latency[count:count+self.bw]))  
-                    count+=self.bw
-                    lastIndex = 'ofmap'
-                else:                       # ---- This is the padding case... 
-                    addressList = df[1][count:count+self.bw].to_list()
-                    ifmapAddress =  0 <= addressList[0] < self.filterOffset
-                    filterAddress = self.filterOffset <= addressList[0] < self.ofmapOffset
-                    ofmapAddress =  self.ofmapOffset  <= addressList[0] < self.metaOffset
-                    for i in range(0,self.bw):
-                        exp = (((0 <= addressList[i] < self.filterOffset) and ifmapAddress) or 
-                               ((self.filterOffset <= addressList[i] < self.ofmapOffset) and filterAddress) or 
-                               ((self.ofmapOffset <= addressList[i] < self.metaOffset) and ofmapAddress))
-                        if(not exp):
-                            endIndex = count + i
-                            break
-
-                    if(ifmapAddress):
-                        self.ifmapLatency.append(np.amax(latency[count:endIndex]))
-                    elif(filterAddress):
-                        self.filterLatency.append(np.amax(latency[count:endIndex]))                            
-                    elif(ofmapAddress):
-                        self.ofmapLatency.append(np.amax(latency[count:endIndex]))   
-                    count = endIndex
-
-
-        np.asarray(self.ifmapLatency)
-        np.asarray(self.filterLatency)
-        np.asarray(self.ofmapLatency)
-
-        #print("-------------------------- IFMAP Latency -------------------------")
-        #print(self.ifmapLatency)
-        #print("-------------------------- Filter Latency -------------------------")
-        #print(self.filterLatency)
-        #print("-------------------------- OFMAP Latency -------------------------")
-        #print(self.ofmapLatency)
+        address, arrive, latency = self.readRamulatorOutput()
+        print("file read, {} requests".format(address.shape[0]))
+
+        # The requests are grouped back into the trace lines in the order they were issued
+        order = np.argsort(arrive, kind='stable')
+        address = address[order]
+        latency = latency[order]
+        numRequests = address.shape[0]
+
+        # 0: ifmap, 1: filter, 2: ofmap, 3: none (eg. the fake requests of the shaper)
+        operandBounds = [self.filterOffset, self.ofmapOffset, self.metaOffset]
+        if shaper == 1:
+            # Every line has bw requests, the fake ones included
+            lineStarts = np.arange(0, numRequests, self.bw)
+            lineMinAddress = np.minimum.reduceat(address, lineStarts) if numRequests > 0 \
+                             else np.zeros(0, dtype=np.int64)
+            lineOperand = np.searchsorted(operandBounds, lineMinAddress, side='right')
+            # Lines of fake requests only belong to the last operand before them
+            lineOperand = self.fillUnknownOperands(lineOperand)
+        else:
+            # A line holds up to bw consecutive requests to the same operand
+            requestOperand = np.searchsorted(operandBounds, address, side='right')
+            # Requests outside the operands belong to the last operand before them
+            requestOperand = self.fillUnknownOperands(requestOperand)
+            runStarts = np.flatnonzero(np.diff(requestOperand, prepend=-1))
+            runLens = np.diff(np.append(runStarts, numRequests))
+            posInRun = np.arange(numRequests) - np.repeat(runStarts, runLens)
+            lineStarts = np.flatnonzero(posInRun % self.bw == 0)
+            lineOperand = requestOperand[lineStarts]
+
+        lineLatency = np.maximum.reduceat(latency, lineStarts) if numRequests > 0 \
+                      else np.zeros(0, dtype=np.int64)
+
+        self.ifmapLatency  = lineLatency[lineOperand == 0].astype(np.int32)
+        self.filterLatency = lineLatency[lineOperand == 1].astype(np.int32)
+        self.ofmapLatency  = lineLatency[lineOperand == 2].astype(np.int32)
+        print("The number of IFMAP, FILTER, OFMAP lines is {} {} {}".format(
+            self.ifmapLatency.shape[0], self.filterLatency.shape[0], self.ofmapLatency.shape[0]))
 
         np.save(resultsPath+"/"+topo+'_ifmapFile'+layerNo+'.npy',self.ifmapLatency)
         np.save(resultsPath+"/"+topo+'_filterFile'+layerNo+'.npy',self.filterLatency)
         np.save(resultsPath+"/"+topo+'_ofmapFile'+layerNo+'.npy',self.ofmapLatency)
 
+    def fillUnknownOperands(self, operands):
+        """ Assigns the entries without an operand (3) to the last operand before them, ifmap at first """
+        known = operands < 3
+        lastKnown = np.maximum.accumulate(np.where(known, np.arange(operands.shape[0]), -1))
+        return np.where(lastKnown >= 0, operands[np.maximum(lastKnown, 0)], 0)
+
     def check_integrity_address(self,address):
         address = address - self.metaOffset
         address 
 
-def worker(fileName, topology,shaper):
+def worker(fileName, topology,shaper,bw=10):
     layerNo = fileName.split('.')[0].split('_')[-1]
-    latencyFunc = dram_latency(ramulatorFile=resultsPath+fileName)
+    latencyFunc = dram_latency(ramulatorFile=resultsPath+fileName, bw=bw)
     latencyFunc.latencyExtraction(layerNo, topology,shaper)
 
 
@@ -180,18 +132,26 @@ if __name__ == "__main__":
                         default=False,
                         help="Define if shaper is present"
                         )
+    parser.add_argument('-bw', metavar='Requests per trace line', type=int,
+                        default=10,
+                        help="Number of DRAM requests in each line of the traces"
+                        )
     args = parser.parse_args()
     topology = args.topology
     parallel = args.parallel
     shaper = args.shaper
+    bw = args.bw
 
     tracefiles = []
     for file in os.listdir(resultsPath):
         if file.startswith(topology+"_RamulatorTrace") and file.endswith(".trace"):
             tracefiles.append(file)
-    for tracefile in tracefiles:
-        if parallel:
-            p = mp.Process(target=worker, args=(tracefile, topology,shaper))
-            p.start()
-        else:
-            worker(tracefile, topology, shaper)
+    workerArgs = [(tracefile, topology, shaper, bw) for tracefile in tracefiles]
+    if parallel and len(workerArgs) > 0:
+        # One layer per task, the pool waits for all of them and reports their errors
+        numProcesses = min(len(workerArgs), os.cpu_count())
+        with mp.get_context('spawn').Pool(processes=numProcesses) as pool:
+            pool.starmap(worker, workerArgs, chunksize=1)
+    else:
+        for workerArg in workerArgs:
+            worker(*workerArg)
@@ -6,6 +6,10 @@ import subprocess
 import queue
 import multiprocessing as mp
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scalesim.utilities.trace_io import load_trace, find_trace_file
+from scalesim.memory.ramulator_bridge import get_ramulator_trace_bytes
+
 rootPath=os.getcwd()
 resultsPath=os.getcwd()+"/results/"
 
@@ -35,155 +39,70 @@ class dataExtraction:
         self.cycle =[]
     
     def extractAddress(self,ifmapFile,ofmapFile,filterFile,layerNo,shaper):
-        ifmapAddress=[]
-        ofmapAddress=[]
-        filterAddress=[]
-        ofmapIntegrityAddress=[]
-        ifmapCycle=[]
-        ofmapCycle=[]
-        ofmapIntegrityCycle=[]
-        filterCycle=[]
-        flag = 0
-        txnCount=0
         fake_address = 40000000
     # ----- Extract DRAM transactions for input feature map ----- #
-        with open(ifmapFile,'r') as f:
-            for line in f.readlines():
-                line = line.strip()
-                x = line.split(',')
-                
-                if flag ==0:
-                    self.ifmapStartCycle = int(float(x[0]))
-                    self.bw = len(x) - 1
-                    flag=1
-                ifmapCycle.append(int(float(x[0])))
-                
-                for i in range(1,len(x)):
-                    ifmapAddress.append(hex(int(float(x[i]))))
-                txnCount+=1
-                
-                #cycle = int(x[0])
-                #self.txnCount.append(len(x) -1)
-        f.close()
-        print("Layer%s: Number of IFMAP lines is %d" % (layerNo, txnCount))
-        print("Layer%s: Reading IFMAP file complete" % layerNo)
-        
-        txnCount=0
-        flag = 0
-    # ----- Extract DRAM transactions for filter map ----- #
-        with open(filterFile,'r') as f:
-            for line in f.readlines():
-                line = line.strip()
-                x = line.split(',')
-                if flag == 0:
-                    self.filterStartCycle = int(float(x[0]))
-                    flag=1
-                filterCycle.append(int(float(x[0])))
-                for i in range(1,len(x)):
-                    filterAddress.append(hex(int(float(x[i]))))  
-                txnCount+=1
-        f.close()
-        print("Layer%s: Number of FILTER lines is %d" % (layerNo, txnCount))
-        print("Layer%s: Reading FILTER file complete" % layerNo)
-        txnCount=0
-        flag = 0
-        integrityRMW = 0
-    # ----- Extract DRAM transactions for output feature map ----- #
-        with open(ofmapFile,'r') as f:
-            for line in f.readlines():
-                line = line.strip()
-                x = line.split(',')
-                if float(x[1]) > 0.0:
-                    ofmapCycle.append(int(float(x[0])))
-                    for i in range(1,len(x)):
-                        ofmapAddress.append(hex(int(float(x[i]))))
-                    txnCount+=1
-                else:
-                    ofmapIntegrityCycle.append(int(float(x[0])))
-                    for i in range(1,len(x)):
-                        ofmapIntegrityAddress.append(hex(-int(float(x[i]))))
-                    integrityRMW+=1
-        f.close()
-        self.ofmapStartCycle = min(ofmapCycle)
-        print("Layer%s: Number of OFMAP lines is %d" % (layerNo, txnCount))
-        print("Layer%s: Number of OFMAP Integrity Read lines is %d" % (layerNo, integrityRMW))
-        print("Layer%s: Reading OFMAP file complete" % layerNo)
-        np.asarray(ifmapAddress)
-        np.asarray(filterAddress)
-        np.asarray(ofmapAddress)
-        np.asarray(ofmapIntegrityAddress)
-        np.asarray(ifmapCycle)
-        np.asarray(filterCycle)
-        np.asarray(ofmapCycle)
-        np.asarray(ofmapIntegrityCycle)
-        print("Layer%s: Conversion to array complete" % layerNo)
-
-        ifmapIndex=0
-        filterIndex=0
-        ofmapIndex=0
-        ofmapIntegrityIndex=0
-        flag =0
-        total_count = 0
-        
-        f = open(self.traceMap,'w')
-        cycle = min(self.ifmapStartCycle,self.filterStartCycle,self.ofmapStartCycle)
-        maxCycle= max(ifmapCycle[-1],filterCycle[-1],ofmapCycle[-1])
-        while (cycle !=maxCycle+1):
-            #if cycle != ifmapCycle[0] or cycle!=ofmapCycle[0] or cycle!=filterCycle[0]:
-            if cycle in range(ifmapCycle[0],ifmapCycle[-1]+1):        # Valid cycle range for the input feature map trace
-                if cycle == ifmapCycle[ifmapIndex]:
-                    flag=1
-                    for i in range(self.bw):
-                        value = ifmapAddress[ifmapIndex*self.bw+i]
-                        if not value== "-0x1": 
-                            f.write(str(value)+" R\n")
-                        elif shaper == 1:
-                            f.write(str(hex(fake_address)) + " R\n")
+        ifmapTrace = load_trace(ifmapFile)
+        self.ifmapStartCycle = int(ifmapTrace[0][0])
+        self.bw = ifmapTrace.shape[1] - 1
+        print("Layer%s: Number of IFMAP lines is %d" % (layerNo, ifmapTrace.shape[0]))
 
-                    ifmapIndex+=1
+    # ----- Extract DRAM transactions for filter map ----- #
+        filterTrace = load_trace(filterFile)
+        self.filterStartCycle = int(filterTrace[0][0])
+        print("Layer%s: Number of FILTER lines is %d" % (layerNo, filterTrace.shape[0]))
 
-            if cycle in range(filterCycle[0],filterCycle[-1]+1):        # Valid cycle range for the filter map trace          
-                if cycle == filterCycle[filterIndex]: 
-                    flag=1
-                    for i in range(self.bw):
-                        value = filterAddress[filterIndex*self.bw+i]
-                        if not value== "-0x1": 
-                            f.write(str(value)+" R\n")
-                        elif shaper == 1:
-                            f.write(str(hex(fake_address)) + " R\n")
-                    filterIndex+=1
-           
-            if cycle in range(ofmapCycle[0],ofmapCycle[-1]+1):        # Valid cycle range for the output feature map trace   
-                if cycle == ofmapCycle[ofmapIndex]:
-                    flag=1
-                    for i in range(self.bw):
-                        value = ofmapAddress[ofmapIndex*self.bw+i]
-                        if not value== "-0x1": 
-                            f.write(str(value)+" W\n")                        
-                        elif shaper == 1:
-                            f.write(str(hex(fake_address)) + " W\n")
-                    ofmapIndex+=1
-            if len(ofmapIntegrityCycle) !=0:
-                if cycle in range(ofmapIntegrityCycle[0],ofmapIntegrityCycle[-1]+1):        # Valid cycle range for the input feature map trace   
-                    if cycle == ofmapIntegrityCycle[ofmapIntegrityIndex]:
-                        flag=1
-                        for i in range(self.bw):
-                            value = ofmapIntegrityAddress[ofmapIntegrityIndex*self.bw+i]
-                            if not value== "-0x1": 
-                                f.write(str(value)+" R\n")                        
-                            elif shaper == 1:
-                                f.write(str(hex(fake_address)) + " R\n")
-                        ofmapIntegrityIndex+=1
-            if flag == 1:
-                total_count += self.bw
-            else:
-                print(cycle)
-                print(ifmapCycle[ifmapIndex])
-                print(filterCycle[filterIndex])
-                print(ofmapCycle[ofmapIndex])
-            cycle+=1
-        f.close()
-        print("The number of IFMAP, FILTER, OFMAP, integrity index is {} {} {} {}".format(ifmapIndex,filterIndex,ofmapIndex,ofmapIntegrityIndex))
+    # ----- Extract DRAM transactions for output feature map ----- #
+        ofmapTrace = load_trace(ofmapFile)
+        writeRows = ofmapTrace[:, 1] > 0
+        ofmapWriteTrace = ofmapTrace[writeRows]
+        # Rows with negative addresses are the integrity reads of the read-modify-write
+        ofmapIntegrityTrace = ofmapTrace[~writeRows]
+        ofmapIntegrityTrace[:, 1:] *= -1
+        self.ofmapStartCycle = int(np.amin(ofmapWriteTrace[:, 0]))
+        print("Layer%s: Number of OFMAP lines is %d" % (layerNo, ofmapWriteTrace.shape[0]))
+        print("Layer%s: Number of OFMAP Integrity Read lines is %d"
+              % (layerNo, ofmapIntegrityTrace.shape[0]))
+
+    # ----- Merge the transactions by cycle ----- #
+        # Only the cycles from the first ifmap, filter or ofmap line to the last one are covered
+        cycle = min(self.ifmapStartCycle, self.filterStartCycle, self.ofmapStartCycle)
+        maxCycle = max(ifmapTrace[-1][0], filterTrace[-1][0], ofmapWriteTrace[-1][0])
+        integrityCycles = ofmapIntegrityTrace[:, 0]
+        ofmapIntegrityTrace = ofmapIntegrityTrace[np.logical_and(integrityCycles >= cycle,
+                                                                 integrityCycles <= maxCycle)]
+
+        # Within a cycle the lines go in the order ifmap, filter, ofmap, integrity read
+        traces = [ifmapTrace, filterTrace, ofmapWriteTrace, ofmapIntegrityTrace]
+        numLines = [trace.shape[0] for trace in traces]
+        maxWidth = max([trace.shape[1] - 1 for trace in traces])
+        streamIds = np.repeat(np.arange(len(traces)), numLines)
+
+        # Lines narrower than the widest one are padded with -2, which is never written
+        lines = np.full((sum(numLines), maxWidth), -2, dtype=np.int64)
+        start = 0
+        for trace in traces:
+            lines[start:start + trace.shape[0], :trace.shape[1] - 1] = trace[:, 1:]
+            start += trace.shape[0]
+        cycles = np.concatenate([trace[:, 0] for trace in traces])
+
+        lineOrder = np.lexsort((streamIds, cycles))
+        lines = lines[lineOrder]
+        writeLines = streamIds[lineOrder] == 2
+
+        # Empty requests are dropped, or replaced with fake ones by the shaper
+        if shaper == 1:
+            lines[lines == -1] = fake_address
+
+    # ----- Write the Ramulator trace in chunks of lines ----- #
+        chunkLines = 1 << 16
+        with open(self.traceMap, 'wb') as f:
+            for start in range(0, lines.shape[0], chunkLines):
+                chunk = lines[start:start + chunkLines]
+                valid = chunk >= 0
+                isWrite = np.broadcast_to(writeLines[start:start + chunkLines, None], chunk.shape)
+                f.write(get_ramulator_trace_bytes(chunk[valid], isWrite[valid]))
+
+        print("The number of IFMAP, FILTER, OFMAP, integrity index is {} {} {} {}".format(*numLines))
 
     def runRamulator(self,prefix):
         output=subprocess.check_output([rootPath+"/submodules/ramulator/ramulator",
@@ -201,9 +120,10 @@ def worker(layer_path, topo, shaper):
     layer_no = layer_path.split('/')[-1].replace('layer','')
     if not os.path.isdir(layer_path):
         sys.exit("Please run scalesim with oracle memory first to get the demand requests")
-    ifmap_file  = layer_path+"/IFMAP_DRAM_TRACE.csv"  #args.ifmap_file
-    filter_file = layer_path+"/FILTER_DRAM_TRACE.csv" #args.filter_file
-    ofmap_file  = layer_path+"/OFMAP_DRAM_TRACE.csv"  #args.ofmap_file
+    # The traces can be saved as csv, npy or npz
+    ifmap_file  = find_trace_file(layer_path+"/IFMAP_DRAM_TRACE")  #args.ifmap_file
+    filter_file = find_trace_file(layer_path+"/FILTER_DRAM_TRACE") #args.filter_file
+    ofmap_file  = find_trace_file(layer_path+"/OFMAP_DRAM_TRACE")  #args.ofmap_file
     if not os.path.isdir(resultsPath):
         os.mkdir(resultsPath)
     mem_trace_in  = resultsPath+topo+"_DemandTrace_"+layer_no+".trace" #args.mem_trace_in
@@ -0,0 +1,121 @@
+"""
+This script compares the analytical mode against the full cycle level simulation. For every layer
+of the given topologies both the models are run and the relative error of each reported stat is
+printed, followed by the mean absolute error of each stat over all the layers.
+
+Example:
+    python3 scripts/validate_analytical.py -c configs/scale.cfg \
+        -t topologies/conv_nets/test.csv topologies/conv_nets/alexnet_part.csv
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scalesim.scale_sim import scalesim
+from scalesim.single_layer_sim import single_layer_sim
+from scalesim.analytical_layer_sim import analytical_layer_sim
+
+
+stat_names = ['Total Cycles', 'Overall Util %', 'Mapping Efficiency %', 'Compute Util %',
+              'SRAM IFMAP Reads', 'SRAM Filter Reads', 'SRAM OFMAP Writes',
+              'DRAM IFMAP Reads', 'DRAM Filter Reads', 'DRAM OFMAP Writes']
+
+
+#
+def get_full_sim_stats(layer_id, sim):
+    """
+    Method to run the full simulation of a layer without saving the traces and return its stats.
+    """
+    layer_sim = single_layer_sim()
+    layer_sim.set_params(layer_id=layer_id,
+                         config_obj=sim.config,
+                         topology_obj=sim.topo,
+                         layout_obj=sim.layout,
+                         verbose=False)
+    layer_sim.run()
+
+    compute_items = layer_sim.get_compute_report_items()
+    detail_items = layer_sim.get_detail_report_items()
+    # The access counts are every third item of the detail report, after the start/stop cycles
+    return compute_items[1:2] + compute_items[3:6] + detail_items[2::3]
+
+
+#
+def get_analytical_stats(layer_id, sim):
+    """
+    Method to run the analytical model of a layer and return its stats.
+    """
+    layer_sim = analytical_layer_sim()
+    layer_sim.set_params(layer_id=layer_id, config_obj=sim.config, topology_obj=sim.topo)
+    layer_sim.run()
+
+    compute_items = layer_sim.get_compute_report_items()
+    return compute_items[1:2] + compute_items[3:6] + layer_sim.get_access_report_items()
+
+
+#
+def get_rel_error(estimate, reference):
+    """
+    Method to get the relative error of an estimate in %.
+    """
+    if reference == 0:
+        return 0.0 if estimate == 0 else float('inf')
+    return (float(estimate) - float(reference)) * 100 / float(reference)
+
+
+#
+def main():
+    """
+    Method to parse the arguments and compare the models on all the layers.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', metavar='Config file', type=str,
+                        default="./configs/scale.cfg",
+                        help="Path to the config file"
+                        )
+    parser.add_argument('-t', metavar='Topology files', type=str, nargs='+',
+                        default=["./topologies/conv_nets/test.csv"],
+                        help="Paths to the topology files"
+                        )
+    parser.add_argument('-l', metavar='Layout file', type=str,
+                        default="./layouts/conv_nets/test.csv",
+                        help="Path to the layout file"
+                        )
+    parser.add_argument('-i', metavar='input type', type=str,
+                        default="conv",
+                        help="Type of input topology, gemm: MNK, conv: conv"
+                        )
+    args = parser.parse_args()
+
+    all_errors = [[] for _ in stat_names]
+
+    for topology in args.t:
+        sim = scalesim(save_disk_space=True,
+                       verbose=False,
+                       config=args.c,
+                       topology=topology,
+                       layout=args.l,
+                       input_type_gemm=(args.i == 'gemm'))
+
+        print('Topology: ' + topology)
+        for layer_id in range(sim.topo.get_num_layers()):
+            full_stats = get_full_sim_stats(layer_id, sim)
+            analytical_stats = get_analytical_stats(layer_id, sim)
+
+            print('  Layer ' + str(layer_id) + ' (' + sim.topo.get_layer_name(layer_id) + ')')
+            for stat_id, name in enumerate(stat_names):
+                error = get_rel_error(analytical_stats[stat_id], full_stats[stat_id])
+                all_errors[stat_id].append(abs(error))
+                print('    {:<22s} full: {:<14s} analytical: {:<14s} error: {:.2f}%'.format(
+                    name, str(full_stats[stat_id]), str(analytical_stats[stat_id]), error))
+
+    print('Mean absolute error over all the layers')
+    for stat_id, name in enumerate(stat_names):
+        errors = all_errors[stat_id]
+        print('  {:<22s} {:.2f}%'.format(name, sum(errors) / len(errors)))
+
+
+if __name__ == '__main__':
+    main()
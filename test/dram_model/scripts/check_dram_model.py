@@ -0,0 +1,157 @@
+"""
+This script checks the vectorized DRAM model: serve_in_order against the plain per request loop on
+random inputs, the latencies of a few request patterns against hand computed values, and the
+latencies and stalls of a saturated sequential stream.
+Run from the repository root with PYTHONPATH=. ; exits with 1 on a mismatch.
+"""
+
+import sys
+
+import numpy as np
+
+from scalesim.memory.dram_model import dram_model, serve_in_order, get_group_ids
+from scalesim.memory.dram_request_queue import dram_request_queue
+
+
+#
+def serve_in_order_loop(arrive_cycles_np, service_cycles_np, group_ids_np):
+    """
+    Method to get the finish cycles with the recurrence, one request at a time.
+    """
+    finish = np.zeros(arrive_cycles_np.shape[0], dtype=np.int64)
+    for idx in range(arrive_cycles_np.shape[0]):
+        start = arrive_cycles_np[idx]
+        if idx > 0 and group_ids_np[idx] == group_ids_np[idx - 1]:
+            start = max(start, finish[idx - 1])
+        finish[idx] = start + service_cycles_np[idx]
+    return finish
+
+
+#
+def check_serve_in_order(num_trials=500, seed=0):
+    """
+    Method to compare serve_in_order with the loop on random groups, arrivals and services.
+    """
+    errors = []
+    rng = np.random.default_rng(seed)
+    for trial in range(num_trials):
+        num_requests = int(rng.integers(1, 200))
+        num_groups = int(rng.integers(1, 10))
+        groups = np.sort(rng.integers(0, num_groups, num_requests))
+        group_ids = get_group_ids(groups)
+        arrive = rng.integers(-50, 1000, num_requests)
+        service = rng.integers(0, 40, num_requests)
+
+        # Requests are served in arrival order within a bank in the model
+        order = np.lexsort((arrive, group_ids))
+        arrive = arrive[order]
+        service = service[order]
+
+        expected = serve_in_order_loop(arrive, service, group_ids)
+        result = serve_in_order(arrive, service, group_ids)
+        if not np.array_equal(result, expected):
+            errors.append('serve_in_order: trial ' + str(trial) + ' differs from the loop')
+    return errors
+
+
+#
+def check_latencies():
+    """
+    Method to check the request latencies of small patterns. With 2 bursts per row and 2 banks,
+    bursts 0 and 1 are in row 0 of bank 0, burst 2 in row 0 of bank 1 and burst 4 in row 1 of
+    bank 0. A row miss takes tRCD + tBurst + tCL, a row hit tBurst + tCL and a row conflict
+    tRP + tRCD + tBurst + tCL.
+    """
+    t_rcd, t_rp, t_cl, t_burst = 10, 7, 5, 4
+    miss = t_rcd + t_burst + t_cl
+    hit = t_burst + t_cl
+    conflict = t_rp + t_rcd + t_burst + t_cl
+
+    # (page policy, queue depth, arrival cycles, bursts, expected latencies)
+    cases = [
+        ('open', 32, [0], [0], [miss]),
+        ('open', 32, [0, 100], [0, 1], [miss, hit]),
+        ('open', 32, [0, 100], [0, 4], [miss, conflict]),
+        # The hit waits for the bank and the data bus behind the miss
+        ('open', 32, [0, 0], [0, 1], [miss, miss + t_burst]),
+        # Different banks open their rows in parallel and share the data bus
+        ('open', 32, [0, 0], [0, 2], [miss, miss + t_burst]),
+        ('closed', 32, [0, 100], [0, 1], [miss, miss]),
+        # The second request waits for the first one to open, read and close the row
+        ('closed', 32, [0, 0], [0, 1], [miss, t_rcd + t_burst + t_rp + miss]),
+        # With a full queue, the second request enters when the first one completes
+        ('open', 1, [0, 0], [0, 2], [miss, miss]),
+        ('open', 1, [0, 0], [0, 1], [miss, hit]),
+    ]
+
+    errors = []
+    for page_policy, queue_depth, arrive, bursts, expected in cases:
+        model = dram_model()
+        model.set_params(num_channels=1, num_banks=2, row_size_bytes=128, burst_size_bytes=64,
+                         t_rcd=t_rcd, t_rp=t_rp, t_cl=t_cl, t_burst=t_burst,
+                         page_policy=page_policy, queue_depth=queue_depth)
+        result = model.get_request_latencies(np.asarray(arrive, dtype=np.int64),
+                                             np.asarray(bursts, dtype=np.int64))
+        if not np.array_equal(result, expected):
+            errors.append('get_request_latencies: ' + page_policy + ' policy, queue depth '
+                          + str(queue_depth) + ', bursts '
+                          + str(bursts) + ' at ' + str(arrive) + ': got ' + str(result.tolist())
+                          + ', expected ' + str(expected))
+
+    # Addresses of a line in the same burst make one request, and empty lines have no latency
+    model = dram_model()
+    model.set_params(num_channels=1, num_banks=2, row_size_bytes=128, burst_size_bytes=64,
+                     t_rcd=t_rcd, t_rp=t_rp, t_cl=t_cl, t_burst=t_burst)
+    ifmap_trace = np.asarray([[0, 0, 5, -1], [1, -1, -1, -1]])
+    empty_trace = np.zeros((0, 4), dtype=np.int64)
+    ifmap_latencies, filter_latencies, ofmap_latencies = \
+        model.get_dram_latencies(ifmap_trace, empty_trace, empty_trace)
+    if not (np.array_equal(ifmap_latencies, [miss, 0])
+            and filter_latencies.shape[0] == 0 and ofmap_latencies.shape[0] == 0):
+        errors.append('get_dram_latencies: got ' + str(ifmap_latencies.tolist())
+                      + ', expected ' + str([miss, 0]))
+
+    return errors
+
+
+#
+def check_saturated_stream(num_requests=20000, port_queue_size=128):
+    """
+    Method to check a sequential read stream issuing more bursts per cycle than the DRAM serves.
+    The controller queues bound the latencies under the 10000 cycle sentinel of the ports, and
+    with row hits the open page policy does not stall the port more than the closed one.
+    """
+    errors = []
+    for requests_per_cycle in [1, 4]:
+        arrive = np.arange(num_requests, dtype=np.int64) // requests_per_cycle
+        bursts = np.arange(num_requests, dtype=np.int64)
+
+        stall_cycles = {}
+        for page_policy in ['open', 'closed']:
+            model = dram_model()
+            model.set_params(page_policy=page_policy)
+            latencies = model.get_request_latencies(arrive, bursts)
+            if latencies.max() >= 10000:
+                errors.append('saturated stream: ' + page_policy + ' policy, '
+                              + str(requests_per_cycle) + ' requests per cycle: latency '
+                              + str(latencies.max()) + ' reaches the port sentinel')
+
+            request_queue = dram_request_queue(queue_size=port_queue_size)
+            out_cycles = request_queue.service_requests(arrive, latencies)
+            stall_cycles[page_policy] = int(out_cycles[-1] - arrive[-1] - latencies[-1])
+
+        if stall_cycles['open'] > stall_cycles['closed']:
+            errors.append('saturated stream: ' + str(requests_per_cycle)
+                          + ' requests per cycle: open page stalls ' + str(stall_cycles['open'])
+                          + ' cycles, closed page ' + str(stall_cycles['closed']))
+    return errors
+
+
+if __name__ == '__main__':
+    all_errors = check_serve_in_order() + check_latencies() + check_saturated_stream()
+    if len(all_errors) > 0:
+        print('Output does not match!')
+        for error in all_errors:
+            print(error)
+        sys.exit(1)
+    print('DRAM model checks passed')
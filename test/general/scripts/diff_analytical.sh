@@ -0,0 +1,33 @@
+#!/bin/bash
+
+path="./"
+
+sed -i "2s/.*/run_name = scale_example_run_32x32_ws/" $path/configs/scale.cfg
+sed -i "s/Dataflow : os/Dataflow : ws/g" $path/configs/scale.cfg
+sed -i "s/Dataflow : is/Dataflow : ws/g" $path/configs/scale.cfg
+sed -i 's/InterfaceBandwidth: USER/InterfaceBandwidth: CALC/g' $path/configs/scale.cfg
+
+source venv/bin/activate
+export PYTHONPATH=.
+rm -rf $path/test_runs_analytical
+python3 $path/scalesim/scale.py -c $path/configs/scale.cfg -t $path/topologies/conv_nets/test.csv -m analytical -p $path/test_runs_analytical
+
+# The errors of diff are kept, so a missing report fails the test
+DIFF1=$(diff $path/test_runs_analytical/scale_example_run_32x32_ws/COMPUTE_REPORT.csv $path/test/general/golden_trace_analytical/COMPUTE_REPORT.csv 2>&1)
+DIFF2=$(diff $path/test_runs_analytical/scale_example_run_32x32_ws/BANDWIDTH_REPORT.csv $path/test/general/golden_trace_analytical/BANDWIDTH_REPORT.csv 2>&1)
+DIFF3=$(diff $path/test_runs_analytical/scale_example_run_32x32_ws/ACCESS_COUNT_REPORT.csv $path/test/general/golden_trace_analytical/ACCESS_COUNT_REPORT.csv 2>&1)
+
+
+if [ "$DIFF1" != "" ]; then
+    echo "Output does not match!"
+    echo "$DIFF1"
+    exit 1
+elif [ "$DIFF2" != "" ]; then
+    echo "Output does not match!"
+    echo "$DIFF2"
+    exit 1
+elif [ "$DIFF3" != "" ]; then
+    echo "Output does not match!"
+    echo "$DIFF3"
+    exit 1
+fi
@@ -0,0 +1,41 @@
+#!/bin/bash
+
+path="./"
+runs=$path/test_runs_layout
+
+source venv/bin/activate
+export PYTHONPATH=.
+rm -rf $runs
+mkdir -p $runs
+
+# Two layers with different layout rows, so each layer has to use its own row
+for dataflow in ws os is; do
+    sed -e "2s/.*/run_name = layout_$dataflow/" \
+        -e "s/Dataflow : [a-z]*/Dataflow : $dataflow/" \
+        -e "s/InterfaceBandwidth: CALC/InterfaceBandwidth: USER/" \
+        -e "s/IfmapCustomLayout: False/IfmapCustomLayout: True/" \
+        -e "s/FilterCustomLayout: False/FilterCustomLayout: True/" \
+        -e "s/SRAMBankBandwidth: .*/SRAMBankBandwidth: 64/" \
+        -e "s/SRAMBankNum: .*/SRAMBankNum: 8/" \
+        $path/configs/scale.cfg > $runs/layout_$dataflow.cfg
+    python3 $path/scalesim/scale.py -c $runs/layout_$dataflow.cfg -t $path/test/general/layout_inputs/topology.csv -l $path/test/general/layout_inputs/layout.csv -p $runs
+done
+
+DIFF1=$(diff -r $runs/layout_ws $path/test/general/golden_trace_layout/layout_ws 2>&1)
+DIFF2=$(diff -r $runs/layout_os $path/test/general/golden_trace_layout/layout_os 2>&1)
+DIFF3=$(diff -r $runs/layout_is $path/test/general/golden_trace_layout/layout_is 2>&1)
+
+
+if [ "$DIFF1" != "" ]; then
+    echo "Output does not match!"
+    echo "$DIFF1"
+    exit 1
+elif [ "$DIFF2" != "" ]; then
+    echo "Output does not match!"
+    echo "$DIFF2"
+    exit 1
+elif [ "$DIFF3" != "" ]; then
+    echo "Output does not match!"
+    echo "$DIFF3"
+    exit 1
+fi
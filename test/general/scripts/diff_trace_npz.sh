@@ -0,0 +1,61 @@
+#!/bin/bash
+
+path="./"
+
+sed -i "2s/.*/run_name = scale_example_run_32x32_ws/" $path/configs/scale.cfg
+sed -i "s/Dataflow : os/Dataflow : ws/g" $path/configs/scale.cfg
+sed -i "s/Dataflow : is/Dataflow : ws/g" $path/configs/scale.cfg
+sed -i 's/InterfaceBandwidth: CALC/InterfaceBandwidth: USER/g' $path/configs/scale.cfg
+
+source venv/bin/activate
+export PYTHONPATH=.
+rm -rf $path/test_runs_npz
+python3 $path/scalesim/scale.py -c $path/configs/scale.cfg -t $path/topologies/GEMM_mnk/test_mnk_input.csv -i gemm -f npz -p $path/test_runs_npz
+
+# The errors of diff are kept, so a missing report fails the test
+DIFF1=$(diff $path/test_runs_npz/scale_example_run_32x32_ws/BANDWIDTH_REPORT.csv $path/test/general/golden_trace_user_ws/BANDWIDTH_REPORT.csv 2>&1)
+DIFF2=$(diff $path/test_runs_npz/scale_example_run_32x32_ws/COMPUTE_REPORT.csv $path/test/general/golden_trace_user_ws/COMPUTE_REPORT.csv 2>&1)
+DIFF3=$(diff $path/test_runs_npz/scale_example_run_32x32_ws/DETAILED_ACCESS_REPORT.csv $path/test/general/golden_trace_user_ws/DETAILED_ACCESS_REPORT.csv 2>&1)
+
+# The npz traces are read back and compared with the golden csv traces
+DIFF4=$(python3 - $path/test_runs_npz/scale_example_run_32x32_ws/layer0 $path/test/general/golden_trace_user_ws/layer0 2>&1 <<'PYEOF'
+import os
+import sys
+
+import numpy as np
+
+from scalesim.utilities.trace_io import load_trace
+
+run_dir, golden_dir = sys.argv[1], sys.argv[2]
+for golden_file in sorted(os.listdir(golden_dir)):
+    trace_name = os.path.splitext(golden_file)[0]
+    npz_file = os.path.join(run_dir, trace_name + '.npz')
+    if not os.path.isfile(npz_file):
+        print('Missing trace: ' + npz_file)
+        continue
+    trace = load_trace(npz_file)
+    golden = load_trace(os.path.join(golden_dir, golden_file))
+    if not (trace.shape == golden.shape and np.array_equal(trace, golden)):
+        print(trace_name + ': npz trace of shape ' + str(trace.shape)
+              + ' does not match the golden trace of shape ' + str(golden.shape))
+PYEOF
+)
+
+
+if [ "$DIFF1" != "" ]; then
+    echo "Output does not match!"
+    echo "$DIFF1"
+    exit 1
+elif [ "$DIFF2" != "" ]; then
+    echo "Output does not match!"
+    echo "$DIFF2"
+    exit 1
+elif [ "$DIFF3" != "" ]; then
+    echo "Output does not match!"
+    echo "$DIFF3"
+    exit 1
+elif [ "$DIFF4" != "" ]; then
+    echo "Output does not match!"
+    echo "$DIFF4"
+    exit 1
+fi